@@ -67,7 +67,7 @@ def read(ctx, input, output):
         output.write('%s : %s\n=====\n' % (element.__class__.__name__, six.text_type(element)))
 
 
-from . import cluster, config, data, tokenize, pos, chemdner, cem, dict, evaluate
+from . import bench, cluster, config, data, tokenize, pos, chemdner, cem, dict, evaluate, relex
 
 
 cli.add_command(cluster.cluster_cli)
@@ -79,3 +79,5 @@ cli.add_command(chemdner.chemdner_cli)
 cli.add_command(cem.cem)
 cli.add_command(dict.dict_cli)
 cli.add_command(evaluate.evaluate)
+cli.add_command(relex.relex_cli)
+cli.add_command(bench.bench_cli)
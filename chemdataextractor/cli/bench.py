@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+chemdataextractor.cli.bench
+~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Performance benchmark commands.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import json
+import logging
+
+import click
+
+from .relex import corpus_paths, load_relationship
+
+
+log = logging.getLogger(__name__)
+
+
+@click.group(name='bench')
+@click.pass_context
+def bench_cli(ctx):
+    """Performance benchmarks."""
+    pass
+
+
+def format_summary(name, summary):
+    """One line of the benchmark table."""
+    if not summary['calls']:
+        return '%-16s %8s' % (name, 0)
+    memory = '%.1f' % summary['peak_memory_mb'] if summary['peak_memory_mb'] is not None else '-'
+    return '%-16s %8d %10.1f %9.3f %9.3f %9.3f %9.3f %9s' % (
+        name, summary['calls'], summary['throughput'] or 0, summary['p50_ms'], summary['p90_ms'], summary['p99_ms'],
+        summary['max_ms'], memory)
+
+
+@bench_cli.command()
+@click.option('--model', '-m', type=click.Path(exists=True, dir_okay=False), help='Snowball model (.pkl or .snowball).', default='tests/data/relex/curie_temperatures.pkl', show_default=True)
+@click.option('--relationship', '-r', help='ChemicalRelationship of a .snowball model, as module:attribute.')
+@click.option('--corpus', '-c', type=click.Path(exists=True), help='Documents, or directory of documents, to extract from.', default='tests/data/relex/curie_training_set', show_default=True)
+@click.option('--scale', '-s', type=int, multiple=True, help='Multiple of the number of clusters to benchmark, can be repeated.', default=[1, 10, 100], show_default=True)
+@click.option('--sentences', type=int, help='Largest number of corpus sentences to use.')
+@click.option('--updates', type=int, help='Number of cluster updates to time.', default=100, show_default=True)
+@click.option('--repeat', type=int, help='Number of timed passes of each stage.', default=1, show_default=True)
+@click.option('--seed', type=int, help='Seed of the synthetic clusters and sampled updates.', default=0, show_default=True)
+@click.option('--no-memory', is_flag=True, help='Do not measure peak memory, which needs an extra pass of each stage.')
+@click.option('--output', '-o', type=click.File('w', encoding='utf8'), help='Also write the full report as JSON.')
+@click.pass_obj
+def relex(ctx, model, relationship, corpus, scale, sentences, updates, repeat, seed, no_memory, output):
+    """Time Snowball loading, candidate generation, extraction and updates.
+
+    Run from a source checkout to use the bundled Curie temperature model and training set. Sentences are tagged
+    before anything is timed. Synthetic models with more clusters are made by varying one token of every phrase of
+    the model. Latencies are in milliseconds, throughput in calls per second and peak memory in MiB.
+    """
+    from ..relex import Snowball
+    from ..relex.bench import bench_relex, read_sentences
+    log.info('chemdataextractor.bench.relex')
+    if relationship is not None:
+        relationship = load_relationship(relationship)
+    snowball = Snowball.load(model, relationship=relationship)
+    tagged = read_sentences(list(corpus_paths([corpus])), limit=sentences)
+    log.info('Benchmarking %s clusters on %s sentences' % (len(snowball.clusters), len(tagged)))
+    report = bench_relex(snowball, tagged, scales=scale, updates=updates, repeat=repeat, memory=not no_memory,
+                         seed=seed)
+    click.echo('%-16s %8s %10s %9s %9s %9s %9s %9s' % ('stage', 'calls', 'per sec', 'p50', 'p90', 'p99', 'max',
+                                                       'peak MiB'))
+    click.echo(format_summary('get_candidates', report['get_candidates']))
+    for result in report['scales']:
+        for stage in ('load', 'extract', 'update'):
+            name = '%s x%s' % (stage, result['scale'])
+            click.echo(format_summary(name, result[stage]))
+    if 'max_rss_mb' in report:
+        click.echo('max RSS %.1f MiB' % report['max_rss_mb'])
+    if output is not None:
+        json.dump(report, output, indent=2)
+        output.write('\n')
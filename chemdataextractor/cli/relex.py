@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+chemdataextractor.cli.relex
+~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Snowball relation extraction command line interface.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import importlib
+import json
+import logging
+import os
+import pickle
+import sys
+
+import click
+import six
+
+
+log = logging.getLogger(__name__)
+
+
+@click.group(name='relex')
+@click.pass_context
+def relex_cli(ctx):
+    """Snowball relation extraction commands."""
+    pass
+
+
+def corpus_paths(paths):
+    """Expand directories into the (sorted) files they contain."""
+    for path in paths:
+        if os.path.isdir(path):
+            for fname in sorted(os.listdir(path)):
+                fpath = os.path.join(path, fname)
+                if os.path.isfile(fpath):
+                    yield fpath
+        else:
+            yield path
+
+
+def load_relationship(spec):
+    """Import a ChemicalRelationship given as module:attribute."""
+    module_name, _, attr = spec.partition(':')
+    if not attr:
+        raise click.BadParameter('Expected module:attribute, got %s' % spec, param_hint='--relationship')
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def write_stats(snowball, f):
+    """Write the stats report of a Snowball model as JSON."""
+    json.dump(snowball.stats_report(), f, indent=2)
+    f.write('\n')
+
+
+@relex_cli.command()
+@click.option('--model', '-m', type=click.Path(exists=True, dir_okay=False), help='Trained Snowball model (.pkl or .snowball).', required=True)
+@click.option('--relationship', '-r', help='ChemicalRelationship of a .snowball model, as module:attribute.')
+@click.option('--output', '-o', type=click.File('w', encoding='utf8'), help='Output JSONL file.', default=sys.stdout)
+@click.option('--workers', '-w', type=int, help='Number of worker processes.', default=1)
+@click.option('--unordered', is_flag=True, help='Output each document as soon as it is done, not in input order.')
+@click.option('--include-empty', is_flag=True, help='Also output sentences without relations.')
+@click.option('--stats', type=click.File('w', encoding='utf8'), help='Write timers, counters and histograms as JSON (work done in worker processes is not included).')
+@click.argument('input', type=click.Path(exists=True), required=True, nargs=-1)
+@click.pass_obj
+def extract(ctx, model, relationship, output, workers, unordered, include_empty, stats, input):
+    """Extract relations from documents or directories of documents as JSON lines."""
+    from ..relex import Snowball
+    log.info('chemdataextractor.relex.extract')
+    if relationship is not None:
+        relationship = load_relationship(relationship)
+    snowball = Snowball.load(model, relationship=relationship)
+    paths = list(corpus_paths(input))
+    log.info('Extracting from %s documents with %s workers' % (len(paths), workers))
+    for record in snowball.extract_corpus(paths, workers=workers, ordered=not unordered, include_empty=include_empty):
+        output.write(six.text_type(json.dumps(record, ensure_ascii=False)))
+        output.write('\n')
+    if stats is not None:
+        write_stats(snowball, stats)
+
+
+@relex_cli.command()
+@click.option('--relationship', '-r', help='ChemicalRelationship of .snowball models, as module:attribute.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False, writable=True), help='Merged model (.pkl or .snowball).', required=True)
+@click.argument('models', type=click.Path(exists=True, dir_okay=False), required=True, nargs=-1)
+@click.pass_obj
+def merge(ctx, relationship, output, models):
+    """Merge Snowball models trained on different parts of a corpus, in the order given."""
+    from ..relex import Snowball
+    log.info('chemdataextractor.relex.merge')
+    if relationship is not None:
+        relationship = load_relationship(relationship)
+    snowballs = [Snowball.load(model, relationship=relationship) for model in models]
+    merged = snowballs[0].spawn()
+    merged.journaling = False
+    for snowball in snowballs:
+        merged.merge_model(snowball)
+    merged.journaling = True
+    if output.endswith('.snowball'):
+        merged.save_model(output)
+    else:
+        with open(output, 'wb') as f:
+            pickle.dump(merged, f)
+
+
+@relex_cli.command()
+@click.option('--relationship', '-r', help='ChemicalRelationship to train, as module:attribute.', required=True)
+@click.option('--model', '-m', type=click.Path(exists=True, dir_okay=False), help='Existing Snowball model to continue training.')
+@click.option('--save-dir', '-s', type=click.Path(file_okay=False), help='Directory for the trained model.')
+@click.option('--documents', '-d', type=click.Path(exists=True, file_okay=False), help='Directory that document paths in the annotations are relative to.')
+@click.option('--tc', type=float, help='Minimum relation confidence for a new model.', default=0.95)
+@click.option('--tsim', type=float, help='Minimum cluster similarity for a new model.', default=0.95)
+@click.option('--workers', '-w', type=int, help='Number of worker processes.', default=1)
+@click.option('--stats', type=click.File('w', encoding='utf8'), help='Write timers, counters and histograms as JSON (work done in worker processes is not included).')
+@click.argument('annotations', type=click.Path(exists=True, dir_okay=False), required=True, nargs=-1)
+@click.pass_obj
+def train(ctx, relationship, model, save_dir, documents, tc, tsim, workers, stats, annotations):
+    """Train a Snowball model from JSONL or TSV annotation files, without prompting."""
+    from ..relex import Snowball
+    from ..relex.annotations import annotation_changes
+    from ..relex.training import split_shards
+    log.info('chemdataextractor.relex.train')
+    relationship = load_relationship(relationship)
+    if model is not None:
+        snowball = Snowball.load(model, relationship=relationship)
+    else:
+        snowball = Snowball(relationship, tc=tc, tsim=tsim)
+    if save_dir is not None:
+        snowball.save_dir = os.path.join(save_dir, '')
+    # Checkpoint once, at the end
+    with snowball:
+        if workers <= 1:
+            updates = snowball.train_annotations(annotations, documents_dir=documents)
+        else:
+            changes = list(annotation_changes(snowball, annotations, documents_dir=documents))
+            updates = len(changes)
+            snowball.train_sharded(split_shards(changes, workers), workers=workers)
+    log.info('Trained on %s annotated sentences, %s clusters' % (updates, len(snowball.clusters)))
+    if stats is not None:
+        write_stats(snowball, stats)
+
+
+@relex_cli.command()
+@click.option('--relationship', '-r', help='ChemicalRelationship of a .snowball model, as module:attribute.')
+@click.option('--output', '-o', type=click.File('w', encoding='utf8'), help='Output JSON file.', default=sys.stdout)
+@click.argument('model', type=click.Path(exists=True, dir_okay=False), required=True)
+@click.pass_obj
+def stats(ctx, relationship, output, model):
+    """Show the size, parameters and cluster histograms of a Snowball model as JSON."""
+    from ..relex import Snowball
+    log.info('chemdataextractor.relex.stats')
+    if relationship is not None:
+        relationship = load_relationship(relationship)
+    write_stats(Snowball.load(model, relationship=relationship), output)
@@ -15,6 +15,7 @@ from __future__ import unicode_literals
 from abc import ABCMeta, abstractproperty
 import collections
 import io
+import itertools
 import json
 import logging
 
@@ -62,13 +63,24 @@ class BaseDocument(six.with_metaclass(ABCMeta, collections.Sequence)):
 class Document(BaseDocument):
     """A document to extract data from. Contains a list of document elements."""
 
-    def __init__(self, *elements):
+    #: Trained Snowball models (see chemdataextractor.relex) whose relations are added to the records. Empty by default,
+    #: pass them to the constructor, from_file or from_string of each document that should use them.
+    snowballs = ()
+
+    def __init__(self, *elements, **kwargs):
         """Initialize a Document manually by passing one or more Document elements (Paragraph, Heading, Table, etc.)
 
         Strings that are passed to this constructor are automatically wrapped into Paragraph elements.
 
         :param list[chemdataextractor.doc.element.BaseElement|string] elements: Elements in this Document.
+        :param list[chemdataextractor.relex.Snowball] snowballs: (Optional) Snowball models to add relations to the
+                                                                 records with.
         """
+        snowballs = kwargs.pop('snowballs', None)
+        if kwargs:
+            raise TypeError('Unexpected keyword arguments: %s' % ', '.join(sorted(kwargs)))
+        if snowballs is not None:
+            self.snowballs = tuple(snowballs)
         self._elements = []
         for element in elements:
             # Convert raw text to Paragraph elements
@@ -84,7 +96,7 @@ class Document(BaseDocument):
         log.debug('%s: Initializing with %s elements' % (self.__class__.__name__, len(self.elements)))
 
     @classmethod
-    def from_file(cls, f, fname=None, readers=None):
+    def from_file(cls, f, fname=None, readers=None, snowballs=None):
         """Create a Document from a file.
 
         Usage::
@@ -99,15 +111,17 @@ class Document(BaseDocument):
         :param file|string f: A file-like object or path to a file.
         :param string fname: (Optional) The filename. Used to help determine file format.
         :param list[chemdataextractor.reader.base.BaseReader] readers: (Optional) List of readers to use.
+        :param list[chemdataextractor.relex.Snowball] snowballs: (Optional) Snowball models to add relations to the
+                                                                 records with.
         """
         if isinstance(f, six.string_types):
             f = io.open(f, 'rb')
         if not fname and hasattr(f, 'name'):
             fname = f.name
-        return cls.from_string(f.read(), fname=fname, readers=readers)
+        return cls.from_string(f.read(), fname=fname, readers=readers, snowballs=snowballs)
 
     @classmethod
-    def from_string(cls, fstring, fname=None, readers=None):
+    def from_string(cls, fstring, fname=None, readers=None, snowballs=None):
         """Create a Document from a byte string containing the contents of a file.
 
         Usage::
@@ -122,6 +136,8 @@ class Document(BaseDocument):
         :param bytes fstring: A byte string containing the contents of a file.
         :param string fname: (Optional) The filename. Used to help determine file format.
         :param list[chemdataextractor.reader.base.BaseReader] readers: (Optional) List of readers to use.
+        :param list[chemdataextractor.relex.Snowball] snowballs: (Optional) Snowball models to add relations to the
+                                                                 records with.
         """
         if readers is None:
             from ..reader import DEFAULT_READERS
@@ -137,6 +153,8 @@ class Document(BaseDocument):
             try:
                 d = reader.readstring(fstring)
                 log.debug('Parsed document with %s' % reader.__class__.__name__)
+                if snowballs is not None:
+                    d.snowballs = tuple(snowballs)
                 return d
             except ReaderError:
                 pass
@@ -157,6 +175,7 @@ class Document(BaseDocument):
         head_def_record_i = None
         last_product_record = None
         title_record = None
+        snowball_records = self.snowball_records()
         for i, el in enumerate(self.elements):
             last_id_record = None
 
@@ -187,22 +206,8 @@ class Document(BaseDocument):
                         head_def_record = sent_record
                         head_def_record_i = i
 
-            # Use Snowball to correct for unidentified records
-            # if (isinstance(el, Paragraph)) and el.records:
-            #     unidentified_records_idx = [el.records.index(x) for x in el.records if x.is_unidentified]
-            #     if unidentified_records_idx:
-            #         #print("Snowballing")
-            #         snowball_records = el.snowball()
-            #         if snowball_records:
-            #             # delete unidentified records
-            #             for uid in unidentified_records_idx:
-            #                 el.records.pop(uid)
-            #                 # add snowball records to list of models
-            #             for sb_rec in snowball_records:
-            #                 records.append(sb_rec)
-
-            # Interdependency resolution
-            for record in el.records:
+            # Interdependency resolution, including the records of Snowball relations found in the element
+            for record in itertools.chain(el.records, snowball_records.get(i, [])):
                 # Keep track of the most recent record with labels
                 if isinstance(el, Paragraph) and record.labels:
                     last_id_record = record
@@ -326,6 +331,25 @@ class Document(BaseDocument):
             i += 1
         return records
 
+    def snowball_records(self):
+        """Return the records of the relations that the Snowball models find in each Paragraph, by element index.
+
+        The sentences of the whole document are extracted from in one batch per model, with the model frozen.
+        """
+        records = {}
+        if not self.snowballs:
+            return records
+        sentences = []
+        element_indexes = []
+        for i, el in enumerate(self.elements):
+            if isinstance(el, Paragraph):
+                sentences.extend(el.sentences)
+                element_indexes.extend([i] * len(el.sentences))
+        for snowball in self.snowballs:
+            for i, sentence_records in zip(element_indexes, snowball.records(sentences)):
+                records.setdefault(i, []).extend(sentence_records)
+        return records
+
     def get_element_with_id(self, id):
         """Return the element with the specified ID."""
         # Should we maintain a hashmap of ids to make this more efficient? Probably overkill.
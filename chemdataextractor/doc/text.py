@@ -274,16 +274,6 @@ class Paragraph(Text):
     def _repr_html_(self):
         return '<p class="cde-paragraph">' + self.text + '</p>'
 
-    # def snowball(self):
-    #     """ Run this paragraph through Snowball pipeline """
-    #     t0 = time.time()
-    #     snowball_records = []
-    #     for snowball_system in snowball_systems:
-    #         recs = snowball_system.records(element=self)
-    #         for r in recs:
-    #             snowball_records.append(r)
-    #     return snowball_records
-
 
 class Footnote(Text):
 
@@ -432,7 +422,7 @@ class Sentence(BaseText):
         # log.debug('Getting cems')
         spans = []
         # print(self.text.encode('utf8'))
-        for result in chemical_name.scan(self.tagged_tokens):
+        for result in chemical_name.scan(self.tagged_tokens, materialize=False):
             # parser scan yields (result, startindex, endindex) - we just use the indexes here
             tokens = self.tokens[result[1]:result[2]]
             start = tokens[0].start
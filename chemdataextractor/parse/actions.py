@@ -14,10 +14,10 @@ from __future__ import unicode_literals
 import logging
 import re
 
-from lxml.builder import E
 from lxml.etree import strip_tags
 
 from ..text import HYPHENS
+from .elements import ResultNode
 
 
 log = logging.getLogger(__name__)
@@ -26,7 +26,11 @@ log = logging.getLogger(__name__)
 def flatten(tokens, start, result):
     """Replace all child results with their text contents."""
     for e in result:
-        strip_tags(e, '*')
+        if isinstance(e, ResultNode):
+            e.text = ''.join(e.itertext()) or e.text
+            e.children = []
+        else:
+            strip_tags(e, '*')
     return result
 
 
@@ -38,7 +42,7 @@ def join(tokens, start, result):
             for child in e.iter():
                 if child.text is not None:
                     texts.append(child.text)
-        return [E(result[0].tag, ' '.join(texts))]
+        return [ResultNode(result[0].tag, ' '.join(texts))]
 
 
 def merge(tokens, start, result):
@@ -49,7 +53,7 @@ def merge(tokens, start, result):
             for child in e.iter():
                 if child.text is not None:
                     texts.append(child.text)
-        return [E(result[0].tag, ''.join(texts))]
+        return [ResultNode(result[0].tag, ''.join(texts))]
 
 
 def strip_stop(tokens, start, result):
@@ -20,15 +20,22 @@ log = logging.getLogger(__name__)
 class BaseParser(object):
     """"""
 
+    #: Whether parse passes interpret the lxml elements of the results of root. Parsers whose interpret only uses the
+    #: parts of the element API that ResultNode supports set it to False, so that parse passes the nodes instead,
+    #: which saves making an lxml element for every result.
+    materialize_results = True
+
     @abstractproperty
     def root(self):
         pass
 
     @abstractmethod
     def interpret(self, result, start, end):
+        """Yield models for a result of root matching tokens start to end, which is an lxml element, or a ResultNode
+        if materialize_results is False."""
         pass
 
     def parse(self, tokens):
-        for result in self.root.scan(tokens):
+        for result in self.root.scan(tokens, materialize=self.materialize_results):
             for model in self.interpret(*result):
                 yield model
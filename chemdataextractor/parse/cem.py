@@ -341,6 +341,7 @@ class CompoundParser(BaseParser):
     """Chemical name possibly with an associated label."""
 
     root = cem_phrase
+    materialize_results = False
 
     def interpret(self, result, start, end):
         #print(etree.tostring(result))
@@ -373,6 +374,7 @@ class ChemicalLabelParser(BaseParser):
     """Chemical label occurrences with no associated name."""
 
     root = chemical_label_phrase
+    materialize_results = False
 
     def interpret(self, result, start, end):
         #print(etree.tostring(result))
@@ -385,6 +387,7 @@ class CompoundHeadingParser(BaseParser):
     """Better matching of abbreviated names in dedicated compound headings."""
 
     root = compound_heading_phrase
+    materialize_results = False
 
     def interpret(self, result, start, end):
         roles = [standardize_role(r) for r in result.xpath('./role/text()')]
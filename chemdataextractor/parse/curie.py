@@ -155,6 +155,7 @@ ct_phrase = (multiple_ct_phrase | cem_after_ct_and_value_phrase | ct_before_cem_
 class CtParser(BaseParser):
     """"""
     root = ct_phrase
+    materialize_results = False
 
     def interpret(self, result, start, end):
         #print(etree.tostring(result))
@@ -15,8 +15,10 @@ import collections
 import copy
 import logging
 import re
+import threading
+import weakref
 
-from lxml.builder import E
+from lxml import etree
 import six
 import types
 
@@ -62,9 +64,413 @@ def safe_name(name):
     return XML_SAFE_TAGS.get(name, name)
 
 
+#: A step of the simple paths that ResultNode.xpath answers itself: a child tag or *, and an optional position
+_XPATH_STEP = re.compile(r'^(\*|[^\W\d][\w.\-]*)(?:\[([1-9]\d*)\])?$', re.U)
+#: Simple paths by expression, as (steps, whether text() is selected), or None for other expressions
+_xpath_paths = {}
+
+
+def _compile_xpath(path):
+    """The steps of a simple relative path like ./name/text(), or None if path is any other expression"""
+    if path in _xpath_paths:
+        return _xpath_paths[path]
+    parts = (path[2:] if path.startswith('./') else path).split('/')
+    text = parts[-1] == 'text()'
+    if text:
+        parts.pop()
+    steps = []
+    for part in parts:
+        m = _XPATH_STEP.match(part)
+        if m is None:
+            steps = None
+            break
+        steps.append((m.group(1), int(m.group(2)) if m.group(2) else None))
+    compiled = (steps, text) if steps is not None else None
+    _xpath_paths[path] = compiled
+    return compiled
+
+
+class ResultNode(object):
+    """A parse result, which is much cheaper to build than the lxml element it stands for
+
+    Parser elements build result nodes while they match, so the results of alternatives and lookaheads that are
+    later thrown away never allocate lxml elements. Nodes keep the (start, end) token span of the parser element
+    that created them. They support the parts of the lxml element API that actions and BaseParser.interpret
+    implementations use: tag, text, children by index and iteration, append, iter, itertext, find, findall and
+    xpath for simple relative paths such as ./name/text(). Anything else is answered by to_element, the lxml
+    element for the node. Children can also be lxml elements, for example those created by actions.
+    """
+
+    __slots__ = ('tag', 'text', 'children', 'start', 'end')
+
+    tail = None
+
+    def __init__(self, tag, text=None, children=None, start=None, end=None):
+        """
+        Arguments:
+            tag {str} -- Name of the result
+
+        Keyword Arguments:
+            text {str} -- Text of the result (default: {None})
+            children {list} -- Child results (default: {None, no children})
+            start {int} -- Index of the first token of the result (default: {None, unknown})
+            end {int} -- Index after the last token of the result (default: {None, unknown})
+        """
+        self.tag = tag
+        self.text = text
+        self.children = children if children is not None else []
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return '<ResultNode %s at 0x%x>' % (self.tag, id(self))
+
+    def __len__(self):
+        return len(self.children)
+
+    def __iter__(self):
+        return iter(self.children)
+
+    def __getitem__(self, i):
+        return self.children[i]
+
+    def __deepcopy__(self, memo):
+        return self.clone()
+
+    def clone(self):
+        """A copy of this node with copies of its descendants, which share only the strings of this node."""
+        return ResultNode(self.tag, self.text, copy_results(self.children) if self.children else [], self.start,
+                          self.end)
+
+    def append(self, child):
+        self.children.append(child)
+
+    def extend(self, children):
+        self.children.extend(children)
+
+    def iter(self, tag=None):
+        """Yield this node and its descendants in document order, or those named tag."""
+        if tag == '*':
+            tag = None
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if not isinstance(node, ResultNode):
+                for element in (node.iter(tag) if tag is not None else node.iter()):
+                    yield element
+                continue
+            if tag is None or node.tag == tag:
+                yield node
+            stack.extend(reversed(node.children))
+
+    def itertext(self):
+        """Yield the texts of this node and its descendants in document order."""
+        for node in self.iter():
+            if not isinstance(node, ResultNode):
+                # lxml elements also have tail texts, which itertext of the element yields
+                for text in node.itertext():
+                    yield text
+                continue
+            if node.text is not None:
+                yield node.text
+
+    def find(self, path):
+        """The first result that path selects, or None."""
+        results = self.findall(path)
+        return results[0] if results else None
+
+    def findall(self, path):
+        """The results that path selects, like xpath without text()."""
+        compiled = _compile_xpath(path)
+        if compiled is None or compiled[1]:
+            return self.to_element().findall(path)
+        return self._select(compiled[0])
+
+    def xpath(self, path):
+        """Evaluate an XPath expression on this node.
+
+        Relative paths of child steps, which are tag names or * with an optional position, and optionally ending
+        in text(), are evaluated on the nodes, so the results are nodes and strings. Other expressions are
+        evaluated on a copy of the result as an lxml element.
+        """
+        compiled = _compile_xpath(path)
+        if compiled is None:
+            return self.to_element().xpath(path)
+        steps, text = compiled
+        nodes = self._select(steps)
+        if not text:
+            return nodes
+        texts = []
+        for node in nodes:
+            if isinstance(node, ResultNode):
+                if node.text is not None:
+                    texts.append(node.text)
+            else:
+                texts.extend(node.xpath('text()'))
+        return texts
+
+    def _select(self, steps):
+        nodes = [self]
+        for tag, position in steps:
+            selected = []
+            for node in nodes:
+                children = [c for c in node if tag == '*' or c.tag == tag]
+                if position is not None:
+                    children = children[position - 1:position]
+                selected.extend(children)
+            nodes = selected
+        return nodes
+
+    def to_element(self, spans=None):
+        """The lxml element for this node, with elements for all its descendants.
+
+        Keyword Arguments:
+            spans {dict} -- Records the token span of every new element that has one, keyed by element
+                            (default: {None})
+        """
+        element = etree.Element(self.tag)
+        if self.text is not None:
+            element.text = self.text
+        for child in self.children:
+            if isinstance(child, ResultNode):
+                child = child.to_element(spans)
+            elif child.getparent() is not None:
+                # Already part of an element made for this node before
+                child = copy.deepcopy(child)
+            element.append(child)
+        if spans is not None and self.start is not None:
+            spans[element] = (self.start, self.end)
+        return element
+
+
+def copy_results(results):
+    """Copies of a list of results, which can be ResultNode objects or lxml elements, that actions can change."""
+    return [e.clone() if type(e) is ResultNode else copy.deepcopy(e) for e in results]
+
+
+def materialize_results(results, spans=None):
+    """The lxml elements for a list of results, which can be ResultNode objects or lxml elements already.
+
+    Keyword Arguments:
+        spans {dict} -- Records the token span of every new element that has one, keyed by element (default: {None})
+    """
+    if results is None:
+        return None
+    return [e.to_element(spans) if isinstance(e, ResultNode) else e for e in results]
+
+
+def record_spans(results, spans):
+    """Record the token spans of a list of results and all their descendant nodes in spans, keyed by node."""
+    for result in results:
+        if isinstance(result, ResultNode):
+            for node in result.iter():
+                if isinstance(node, ResultNode) and node.start is not None:
+                    spans[node] = (node.start, node.end)
+
+
+class _ScanState(threading.local):
+    """For each thread, the dict that the current scan records result element token spans in and the packrat cache
+    it memoizes results in, if any."""
+    spans = None
+    packrat = None
+
+
+_scan_state = _ScanState()
+
+#: Packrat cache hits and misses of all finished scans, updated while holding _packrat_counts_lock
+packrat_counts = collections.Counter()
+_packrat_counts_lock = threading.Lock()
+
+
+class PackratCache(object):
+    """Memoized results of parser elements at token positions, for one list of tokens
+
+    Each memoized element is parsed once at each token index, and later parses of the element at the index get a
+    copy of the results, or the same failure. The hits and misses attributes count both. Results are keyed
+    by element and whether its actions are run. Lookaheads run the actions too, so actions should not depend on
+    anything but their arguments.
+    """
+
+    __slots__ = ('elements', 'tokens', 'results', 'hits', 'misses')
+
+    def __init__(self, elements=None):
+        """
+        Keyword Arguments:
+            elements {set} -- The parser elements to memoize (default: {None, the shared elements of the first
+                              scanned grammar, see BaseParserElement.shared_elements})
+        """
+        self.elements = elements
+        self.tokens = None
+        self.results = {}
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.tokens = None
+        self.results = {}
+
+    def match(self, element, tokens, i, actions=True):
+        """Match tokens with element, or return its memoized match"""
+        if tokens is not self.tokens:
+            self.clear()
+            self.tokens = tokens
+        spans = _scan_state.spans
+        key = (element, i, actions)
+        memo = self.results.get(key)
+        if memo is not None:
+            if memo is False:
+                self.hits += 1
+                return None
+            result, end, result_spans = memo
+            # Results memoized by a scan that did not record spans are matched again
+            if spans is None or result_spans is not None:
+                self.hits += 1
+                result = copy_results(result) if result is not None else None
+                if spans is not None and result is not None:
+                    descendants = [d for e in result for d in e.iter()]
+                    for descendant, span in zip(descendants, result_spans):
+                        if span is not None and descendant not in spans:
+                            spans[descendant] = span
+                return result, end
+        self.misses += 1
+        match = element._match_uncached(tokens, i, actions)
+        if match is None:
+            self.results[key] = False
+            return None
+        result, end = match
+        if result is not None:
+            result_spans = None
+            if spans is not None:
+                result_spans = [spans.get(d) for e in result for d in e.iter()]
+            # Callers add results to their own elements and may rename them, so memoize a copy
+            self.results[key] = (copy_results(result), end, result_spans)
+        else:
+            self.results[key] = (None, end, [])
+        return match
+
+    def try_match(self, element, tokens, i):
+        """The end index of a match of tokens with element, or None, which is memoized with actions, so that
+        lookaheads and the matches that follow them share it"""
+        memo = self.results.get((element, i, True)) if tokens is self.tokens else None
+        if memo is None:
+            match = self.match(element, tokens, i)
+            return match[1] if match is not None else None
+        self.hits += 1
+        return memo[1] if memo is not False else None
+
+
+class FirstSet(object):
+    """The tokens that a parser element can begin a match with
+
+    A token can begin a match if its text is one of words, its lowercase text is one of lower_words, its tag is one
+    of tags or its text matches one of regexes. If any is set, every token can. If empty is set, the element can also
+    match without using any tokens, so that the tokens that begin whatever follows it can begin a match too.
+    """
+
+    __slots__ = ('words', 'lower_words', 'tags', 'regexes', 'any', 'empty')
+
+    def __init__(self, words=(), lower_words=(), tags=(), regexes=(), any=False, empty=False):
+        self.words = frozenset(words)
+        self.lower_words = frozenset(lower_words)
+        self.tags = frozenset(tags)
+        self.regexes = tuple(regexes)
+        self.any = any
+        self.empty = empty
+
+    def union(self, other, empty=None):
+        """The tokens that either set begins with, which is empty if either is, unless empty is given"""
+        if empty is None:
+            empty = self.empty or other.empty
+        if self.any or other.any:
+            return FirstSet(any=True, empty=empty)
+        regexes = list(self.regexes)
+        regexes.extend(regex for regex in other.regexes if regex not in regexes)
+        return FirstSet(self.words | other.words, self.lower_words | other.lower_words, self.tags | other.tags,
+                        regexes, empty=empty)
+
+    def then(self, other):
+        """The tokens that this set followed by other begins with"""
+        if not self.empty:
+            return self
+        return self.union(other, empty=other.empty)
+
+    def positions(self, tokens):
+        """The indexes of the tokens that can begin a match"""
+        if self.any:
+            return list(range(len(tokens)))
+        words, lower_words, tags, regexes = self.words, self.lower_words, self.tags, self.regexes
+        positions = []
+        for i, token in enumerate(tokens):
+            text = token[0]
+            if (text in words or token[1] in tags or (lower_words and text.lower() in lower_words) or
+                    any(regex.search(text) for regex in regexes)):
+                positions.append(i)
+        return positions
+
+
+#: Sets of elements that match anything, or nothing, before they are streamlined
+ANY_FIRST = FirstSet(any=True)
+EMPTY_FIRST = FirstSet(empty=True)
+
+class AlternativeIndex(object):
+    """The alternatives of an Or or First that can begin a match with each token, by their first sets
+
+    Alternatives that can match nothing, begin with any token or with a token matching a regex are always tried.
+    The others are only tried at tokens with one of their words, lowercase words or tags.
+    """
+
+    __slots__ = ('always', 'words', 'lower_words', 'tags')
+
+    #: Smallest number of alternatives to index, below which it is quicker to try them all
+    min_alternatives = 4
+
+    def __init__(self, exprs):
+        self.always = []
+        self.words = {}
+        self.lower_words = {}
+        self.tags = {}
+        for n, e in enumerate(exprs):
+            first_set = e.first_set
+            if first_set.any or first_set.empty or first_set.regexes:
+                self.always.append(n)
+                continue
+            for word in first_set.words:
+                self.words.setdefault(word, []).append(n)
+            for word in first_set.lower_words:
+                self.lower_words.setdefault(word, []).append(n)
+            for tag in first_set.tags:
+                self.tags.setdefault(tag, []).append(n)
+        for index in (self.words, self.lower_words, self.tags):
+            for key, positions in index.items():
+                index[key] = sorted(set(positions + self.always))
+
+    def positions(self, tokens, i):
+        """The positions of the alternatives that can begin a match at token i, in order"""
+        if i >= len(tokens):
+            return self.always
+        text, tag = tokens[i][0], tokens[i][1]
+        found = [positions for positions in (self.words.get(text), self.lower_words.get(text.lower()),
+                                             self.tags.get(tag)) if positions is not None]
+        if not found:
+            return self.always
+        if len(found) == 1:
+            return found[0]
+        return sorted(set(found[0]).union(*found[1:]))
+
+
 class BaseParserElement(object):
     """Abstract base parser element class."""
 
+    #: Whether scans memoize results in a PackratCache by default. It is set for grammars whose alternatives parse
+    #: the same subexpressions again, like the cem and temperature phrases of mp_phrase and tg_phrase, where
+    #: memoizing them makes scans quicker.
+    packrat = False
+    _shared_elements = None
+    #: The tokens that this element can begin a match with, worked out when it is streamlined
+    first_set = ANY_FIRST
+    #: The parse expressions that contain this element, which are streamlined again when it changes
+    _parents = None
+
     def __init__(self):
         self.name = None
         self.actions = []
@@ -81,6 +487,7 @@ class BaseParserElement(object):
     def copy(self):
         new = copy.copy(self)
         new.actions = self.actions[:]
+        new._shared_elements = None
         return new
 
     def set_name(self, name):
@@ -88,46 +495,181 @@ class BaseParserElement(object):
         new.name = name
         return new
 
-    def scan(self, tokens, max_matches=six.MAXSIZE, overlap=False):
-        """"""
-        if not self.streamlined:
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Copies and unpickled elements have no parents until they are added to a parse expression
+        state.pop('_parents', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def _add_parent(self, parent):
+        if self._parents is None:
+            self._parents = weakref.WeakSet()
+        self._parents.add(parent)
+
+    def scan(self, tokens, max_matches=six.MAXSIZE, overlap=False, spans=None, packrat=None, materialize=True):
+        """Yield (results, start, end) for each match in tokens.
+
+        Matches are only tried at the indexes of tokens in the first set of this element. If a spans dict is given,
+        the (start, end) token span of every result element is recorded in it, keyed by the element. Elements keep
+        the span of the parser element that created them.
+
+        Results are lxml elements, which are only made for the matches that are yielded. If materialize is False,
+        the ResultNode objects built while parsing are yielded instead, which is quicker if they are only read with
+        xpath paths like ./name/text(), or not at all.
+
+        If packrat is True, or None and the packrat attribute of this element is set, the results of the shared
+        subexpressions of the grammar are memoized at every token index for the rest of the scan, so alternatives
+        and lookaheads that contain them, and later start indexes, do not parse them again. A PackratCache can also
+        be given, to read its hits and misses afterwards.
+        """
+        if self.needs_streamline():
             self.streamline()
+        if packrat is None:
+            packrat = self.packrat
+        if packrat is True:
+            packrat = PackratCache()
+        elif not packrat:
+            packrat = None
+        if packrat is not None and packrat.elements is None:
+            packrat.elements = self.shared_elements()
         matches = 0
         i = 0
-        length = len(tokens)
-        while i < length and matches < max_matches:
-            try:
-                results, next_i = self.parse(tokens, i)
-            except ParseException as err:
-                i += 1
-            else:
+        positions = self.first_set.positions(tokens)
+        p = 0
+        length = len(positions)
+        hits, misses = (packrat.hits, packrat.misses) if packrat is not None else (0, 0)
+        try:
+            while p < length and matches < max_matches:
+                if positions[p] < i:
+                    p += 1
+                    continue
+                i = positions[p]
+                previous_spans, previous_packrat = _scan_state.spans, _scan_state.packrat
+                _scan_state.spans = spans
+                _scan_state.packrat = packrat
+                try:
+                    match = self._match(tokens, i)
+                finally:
+                    _scan_state.spans, _scan_state.packrat = previous_spans, previous_packrat
+                p += 1
+                if match is None:
+                    continue
+                results, next_i = match
                 if next_i > i:
                     matches += 1
+                    if materialize:
+                        results = materialize_results(results, spans)
+                    elif spans is not None:
+                        record_spans(results, spans)
                     if len(results) == 1:
                         results = results[0]
                     yield results, i, next_i
-                    if overlap:
-                        i += 1
-                    else:
+                    if not overlap:
                         i = next_i
-                else:
-                    i += 1
+        finally:
+            if packrat is not None:
+                with _packrat_counts_lock:
+                    packrat_counts['hits'] += packrat.hits - hits
+                    packrat_counts['misses'] += packrat.misses - misses
 
     def parse(self, tokens, i, actions=True):
-        start = i
-        try:
-            result, i = self._parse_tokens(tokens, i, actions)
-        except IndexError:
-            raise ParseException(tokens, i, 'IndexError', self)
+        """Parse tokens from index i, returning (results, end index), or raise a ParseException.
+
+        Results are lxml elements. Subclasses that implement _match_tokens should call _match instead, which returns
+        ResultNode objects that have not been made into elements.
+        """
+        match = self._match(tokens, i, actions)
+        if match is None:
+            raise ParseException(tokens, i, 'Expected %s' % (self.name or self.__class__.__name__), self)
+        return materialize_results(match[0], _scan_state.spans), match[1]
+
+    def _match(self, tokens, i, actions=True):
+        """Like parse, but return None if there is no match, which is much quicker than raising. Used internally."""
+        packrat = _scan_state.packrat
+        if packrat is not None and self in packrat.elements:
+            return packrat.match(self, tokens, i, actions)
+        return self._match_uncached(tokens, i, actions)
+
+    def _match_uncached(self, tokens, i, actions=True):
+        match = self._match_tokens(tokens, i, actions)
+        if match is None:
+            return None
+        return self._finish_match(tokens, i, match, actions)
+
+    def _finish_match(self, tokens, start, match, actions=True):
+        """Run the actions on the results of _match_tokens from index start, and record their spans."""
+        result, i = match
         if actions:
             for action in self.actions:
                 action_result = action(tokens, start, result)
                 if action_result is not None:
                     result = action_result
+        if result:
+            spans = _scan_state.spans
+            for element in result:
+                if isinstance(element, ResultNode):
+                    if element.start is None:
+                        element.start = start
+                        element.end = i
+                elif spans is not None and element not in spans:
+                    spans[element] = (start, i)
         return result, i
 
+    def shared_elements(self):
+        """The parse expressions that are part of more than one expression of this grammar
+
+        Only these can be parsed again at the same token index by a different expression, which makes them the ones
+        worth memoizing. Single token matches are quicker to parse again than to look up. The set is worked out
+        again when the element is streamlined again.
+        """
+        if self._shared_elements is None:
+            parents = collections.Counter()
+            seen = set()
+            stack = [self]
+            while stack:
+                element = stack.pop()
+                if element in seen:
+                    continue
+                seen.add(element)
+                if isinstance(element, ParseExpression):
+                    children = element.exprs
+                elif isinstance(element, ParseElementEnhance) and element.expr is not None:
+                    children = [element.expr]
+                else:
+                    continue
+                for child in children:
+                    parents[child] += 1
+                    stack.append(child)
+            self._shared_elements = frozenset(e for e, n in parents.items() if n > 1 and
+                                              isinstance(e, (ParseExpression, ParseElementEnhance)))
+        return self._shared_elements
+
     def try_parse(self, tokens, i):
-        return self.parse(tokens, i, actions=False)[1]
+        end = self._try_match(tokens, i)
+        if end is None:
+            raise ParseException(tokens, i, 'Expected %s' % (self.name or self.__class__.__name__), self)
+        return end
+
+    def _try_match(self, tokens, i):
+        """Like try_parse, but return None if there is no match."""
+        packrat = _scan_state.packrat
+        if packrat is not None and self in packrat.elements:
+            return packrat.try_match(self, tokens, i)
+        match = self._match_uncached(tokens, i, actions=False)
+        return match[1] if match is not None else None
+
+    def _match_tokens(self, tokens, i, actions=True):
+        """Implemented by subclasses, returning (results, end index) or None if there is no match.
+
+        Subclasses can implement _parse_tokens instead, and raise ParseException if there is no match.
+        """
+        try:
+            return self._parse_tokens(tokens, i, actions)
+        except (ParseException, IndexError):
+            return None
 
     def _parse_tokens(self, tokens, i, actions=True):
         """Implemented by subclasses. """
@@ -136,8 +678,38 @@ class BaseParserElement(object):
 
     def streamline(self):
         self.streamlined = True
+        self.first_set = self._first_set()
+        self._shared_elements = None
         return self
 
+    def needs_streamline(self):
+        """Whether this element was not streamlined, or one of its parts was changed since it was"""
+        return not self.streamlined
+
+    def _changed(self):
+        """Forget what was worked out when this element and the parse expressions that contain it were streamlined,
+        after its parts were changed"""
+        seen = set()
+        stack = [self]
+        while stack:
+            element = stack.pop()
+            if element in seen:
+                continue
+            seen.add(element)
+            element._unstreamline()
+            if element._parents is not None:
+                stack.extend(element._parents)
+
+    def _unstreamline(self):
+        """Forget what was worked out when this element was streamlined"""
+        self.streamlined = False
+        self.first_set = ANY_FIRST
+        self._shared_elements = None
+
+    def _first_set(self):
+        """Implemented by subclasses that only match some tokens, from the first sets of their streamlined parts."""
+        return ANY_FIRST
+
     def __add__(self, other):
         if isinstance(other, six.text_type):
             other = Word(other)
@@ -209,8 +781,10 @@ class BaseParserElement(object):
 class Any(BaseParserElement):
     """Always match a single token."""
 
-    def _parse_tokens(self, tokens, i, actions=True):
-        return [E(self.name or safe_name(tokens[i][1]), tokens[i][0])], i + 1
+    def _match_tokens(self, tokens, i, actions=True):
+        if i >= len(tokens):
+            return None
+        return [ResultNode(self.name or safe_name(tokens[i][1]), tokens[i][0])], i + 1
 
 
 class Word(BaseParserElement):
@@ -220,11 +794,16 @@ class Word(BaseParserElement):
         super(Word, self).__init__()
         self.match = match
 
-    def _parse_tokens(self, tokens, i, actions=True):
+    def _match_tokens(self, tokens, i, actions=True):
+        if i >= len(tokens):
+            return None
         token_text = tokens[i][0]
         if token_text == self.match:
-            return [E(self.name or safe_name(tokens[i][1]), token_text)], i + 1
-        raise ParseException(tokens, i, 'Expected %s, got %s' % (self.match, token_text), self)
+            return [ResultNode(self.name or safe_name(tokens[i][1]), token_text)], i + 1
+        return None
+
+    def _first_set(self):
+        return FirstSet(words=[self.match])
 
 
 class Tag(BaseParserElement):
@@ -234,11 +813,16 @@ class Tag(BaseParserElement):
         super(Tag, self).__init__()
         self.match = match
 
-    def _parse_tokens(self, tokens, i, actions=True):
+    def _match_tokens(self, tokens, i, actions=True):
+        if i >= len(tokens):
+            return None
         token = tokens[i]
         if token[1] == self.match:
-            return [E(self.name or safe_name(token[1]), token[0])], i + 1
-        raise ParseException(tokens, i, 'Expected %s, got %s' % (self.match, token[1]), self)
+            return [ResultNode(self.name or safe_name(token[1]), token[0])], i + 1
+        return None
+
+    def _first_set(self):
+        return FirstSet(tags=[self.match])
 
 
 class IWord(Word):
@@ -247,11 +831,16 @@ class IWord(Word):
     def __init__(self, match):
         super(IWord, self).__init__(match.lower())
 
-    def _parse_tokens(self, tokens, i, actions=True):
+    def _match_tokens(self, tokens, i, actions=True):
+        if i >= len(tokens):
+            return None
         token_text = tokens[i][0]
         if token_text.lower() == self.match:
-            return [E(self.name or safe_name(tokens[i][1]), tokens[i][0])], i + 1
-        raise ParseException(tokens, i, 'Expected %s, got %s' % (self.match, tokens[i][0]), self)
+            return [ResultNode(self.name or safe_name(tokens[i][1]), tokens[i][0])], i + 1
+        return None
+
+    def _first_set(self):
+        return FirstSet(lower_words=[self.match])
 
 
 class Regex(BaseParserElement):
@@ -267,13 +856,18 @@ class Regex(BaseParserElement):
             self.pattern = pattern.pattern
         self.group = group
 
-    def _parse_tokens(self, tokens, i, actions=True):
+    def _match_tokens(self, tokens, i, actions=True):
+        if i >= len(tokens):
+            return None
         token_text = tokens[i][0]
         result = self.regex.search(token_text)
         if result:
             text = tokens[i][0] if self.group is None else result.group(self.group)
-            return [E(self.name or safe_name(tokens[i][1]), text)], i + 1
-        raise ParseException(tokens, i, 'Expected %s, got %s' % (self.pattern, token_text), self)
+            return [ResultNode(self.name or safe_name(tokens[i][1]), text)], i + 1
+        return None
+
+    def _first_set(self):
+        return FirstSet(regexes=[self.regex])
 
 
 class Start(BaseParserElement):
@@ -282,11 +876,14 @@ class Start(BaseParserElement):
     def __init__(self):
         super(Start, self).__init__()
 
-    def _parse_tokens(self, tokens, i, actions=True):
+    def _match_tokens(self, tokens, i, actions=True):
         if i != 0:
-            raise ParseException(tokens, i, 'Expected start of tokens', self)
+            return None
         return [], i
 
+    def _first_set(self):
+        return EMPTY_FIRST
+
 
 class End(BaseParserElement):
     """Match at end of tokens."""
@@ -294,11 +891,49 @@ class End(BaseParserElement):
     def __init__(self):
         super(End, self).__init__()
 
-    def _parse_tokens(self, tokens, i, actions=True):
+    def _match_tokens(self, tokens, i, actions=True):
         if i < len(tokens):
-            raise ParseException(tokens, i, 'Expected end of tokens', self)
+            return None
         return [], i
 
+    def _first_set(self):
+        return EMPTY_FIRST
+
+
+class ExpressionList(list):
+    """The sub-expressions of a parse expression, which is streamlined again when they are changed"""
+
+    def __init__(self, owner, exprs=()):
+        super(ExpressionList, self).__init__(exprs)
+        self.owner = owner
+        for e in self:
+            e._add_parent(owner)
+
+    def _changed(self):
+        for e in self:
+            e._add_parent(self.owner)
+        self.owner._changed()
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+def _changes_expressions(name):
+    method = getattr(list, name)
+
+    def changed(self, *args):
+        result = method(self, *args)
+        self._changed()
+        return result
+    changed.__name__ = str(name)
+    return changed
+
+
+for _name in ('append', 'extend', 'insert', 'pop', 'remove', 'reverse', 'sort', '__setitem__', '__delitem__',
+              '__iadd__', '__imul__', 'clear', '__setslice__', '__delslice__'):
+    if hasattr(list, _name):
+        setattr(ExpressionList, _name, _changes_expressions(_name))
+
 
 class ParseExpression(BaseParserElement):
     """Abstract class for combining and post-processing parsed tokens."""
@@ -322,28 +957,73 @@ class ParseExpression(BaseParserElement):
     def __getitem__(self, i):
         return self.exprs[i]
 
+    def __setattr__(self, name, value):
+        if name == 'exprs':
+            self._set_exprs(value)
+            self._changed()
+        else:
+            super(ParseExpression, self).__setattr__(name, value)
+
+    def __getstate__(self):
+        state = super(ParseExpression, self).__getstate__()
+        if 'exprs' in state:
+            state['exprs'] = list(state['exprs'])
+        return state
+
+    def __setstate__(self, state):
+        super(ParseExpression, self).__setstate__(state)
+        if 'exprs' in state:
+            self._set_exprs(state['exprs'])
+
+    def _set_exprs(self, exprs):
+        """Set the sub-expressions, without forgetting what was worked out when this expression was streamlined"""
+        self.__dict__['exprs'] = ExpressionList(self, exprs)
+
     def append(self, other):
         self.exprs.append(other)
         return self
 
     def copy(self):
+        """A copy of this expression with its own list of sub-expressions, which are the same objects.
+
+        Sub-expressions used to be copied too. They are shared so that a sub-expression of a named phrase, like the
+        cem of mp_phrase, is still one element that scans can memoize. Appending to the copy, or renaming it, does
+        not change this expression.
+        """
         ret = super(ParseExpression, self).copy()
-        ret.exprs = [e.copy() for e in self.exprs]
+        ret._set_exprs(self.exprs)
         return ret
 
     def streamline(self):
-        super(ParseExpression, self).streamline()
         for e in self.exprs:
-            e.streamline()
+            if e.needs_streamline():
+                e.streamline()
         # collapse nested exprs from e.g. And(And(And(a, b), c), d) to And(a,b,c,d)
         if len(self.exprs) == 2:
             other = self.exprs[0]
             if isinstance(other, self.__class__) and not other.actions and other.name is None:
-                self.exprs = other.exprs[:] + [self.exprs[1]]
+                self._set_exprs(other.exprs[:] + [self.exprs[1]])
             other = self.exprs[-1]
             if isinstance(other, self.__class__) and not other.actions and other.name is None:
-                self.exprs = self.exprs[:-1] + other.exprs[:]
-        return self
+                self._set_exprs(self.exprs[:-1] + other.exprs[:])
+        return super(ParseExpression, self).streamline()
+
+
+def index_alternatives(exprs):
+    """An AlternativeIndex of exprs, or None if there are too few of them to be worth it"""
+    if len(exprs) < AlternativeIndex.min_alternatives:
+        return None
+    return AlternativeIndex(exprs)
+
+
+def alternatives_first_set(exprs):
+    """The tokens that any of exprs can begin a match with"""
+    if not exprs:
+        return ANY_FIRST
+    first_set = exprs[0].first_set
+    for e in exprs[1:]:
+        first_set = first_set.union(e.first_set)
+    return first_set
 
 
 class And(ParseExpression):
@@ -352,13 +1032,24 @@ class And(ParseExpression):
     def __init__(self, exprs):
         super(And, self).__init__(exprs)
 
-    def _parse_tokens(self, tokens, i, actions=True):
+    def _match_tokens(self, tokens, i, actions=True):
         results = []
         for e in self.exprs:
-            exprresults, i = e.parse(tokens, i)
+            match = e._match(tokens, i)
+            if match is None:
+                return None
+            exprresults, i = match
             if exprresults is not None:
                 results.extend(exprresults)
-        return ([E(self.name, *results)] if self.name else results), i
+        return ([ResultNode(self.name, None, results)] if self.name else results), i
+
+    def _first_set(self):
+        first_set = EMPTY_FIRST
+        for e in self.exprs:
+            first_set = first_set.then(e.first_set)
+            if not first_set.empty:
+                break
+        return first_set
 
     def __iadd__(self, other):
         if isinstance(other, six.text_type):
@@ -369,40 +1060,60 @@ class And(ParseExpression):
 class Or(ParseExpression):
     """Match the longest."""
 
-    def _parse_tokens(self, tokens, i, actions=True):
-        furthest_exception_i = -1
-        furthest_match_i = -1
-        furthest_exception = None
-        for e in self.exprs:
-            try:
-                end_i = e.try_parse(tokens, i)
-            except ParseException as err:
-                if err.i > furthest_exception_i:
-                    furthest_exception = err
-                    furthest_exception_i = err.i
-            except IndexError:
-                if len(tokens) > furthest_exception_i:
-                    furthest_exception = ParseException(tokens, len(tokens), '', self)
-                    furthest_exception_i = len(tokens)
-            else:
-                if end_i > furthest_match_i:
-                    furthest_match_i = end_i
-                    furthest_match = e
+    _named_exprs = None
+    _alternative_index = None
 
-        if furthest_match_i < 0:
-            if furthest_exception is not None:
-                raise furthest_exception
-            else:
-                raise ParseException(tokens, i, 'No alternatives match', self)
+    def copy(self):
+        ret = super(Or, self).copy()
+        ret._named_exprs = None
+        return ret
 
-        # If a name is assigned to an Or, it replaces the name of the contained result
-        if self.name:
-            furthest_match = furthest_match.set_name(self.name)
+    def streamline(self):
+        super(Or, self).streamline()
+        self._named_exprs = None
+        self.named_exprs()
+        self._alternative_index = index_alternatives(self.exprs)
+        return self
 
-        result, result_i = furthest_match.parse(tokens, i, actions=actions)
-        # if self.name:
-        #     result.tag = self.name
-        return result, result_i
+    def _unstreamline(self):
+        super(Or, self)._unstreamline()
+        self._named_exprs = None
+        self._alternative_index = None
+
+    def named_exprs(self):
+        """The alternatives, renamed like this Or if it has a name, which replaces the name of their results"""
+        if not self.name:
+            return self.exprs
+        if self._named_exprs is None:
+            self._named_exprs = [e.set_name(self.name) for e in self.exprs]
+        return self._named_exprs
+
+    def _match_tokens(self, tokens, i, actions=True):
+        # Each alternative is matched once, and only the longest gets its actions run
+        packrat = _scan_state.packrat
+        furthest_match = None
+        furthest_match_i = -1
+        exprs = self.named_exprs()
+        if self._alternative_index is not None:
+            exprs = [exprs[n] for n in self._alternative_index.positions(tokens, i)]
+        for e in exprs:
+            if packrat is not None and e in packrat.elements:
+                match = packrat.match(e, tokens, i, actions)
+                finished = True
+            else:
+                match = e._match_tokens(tokens, i, actions)
+                finished = False
+            if match is not None and match[1] > furthest_match_i:
+                furthest_match = match
+                furthest_match_i = match[1]
+                furthest_e = e
+                furthest_finished = finished
+        if furthest_match is None or furthest_finished:
+            return furthest_match
+        return furthest_e._finish_match(tokens, i, furthest_match, actions)
+
+    def _first_set(self):
+        return alternatives_first_set(self.exprs)
 
     def __ixor__(self, other):
         if isinstance(other, six.text_type):
@@ -413,29 +1124,42 @@ class Or(ParseExpression):
 class First(ParseExpression):
     """Match the first."""
 
+    _alternative_index = None
+
     def __init__(self, exprs):
         super(First, self).__init__(exprs)
 
-    def _parse_tokens(self, tokens, i, actions=True):
-        furthest_i = -1
-        furthest_exception = None
-        for e in self.exprs:
-            try:
-                result, result_i = e.parse(tokens, i, actions=True)
+    def streamline(self):
+        super(First, self).streamline()
+        self._alternative_index = index_alternatives(self.exprs)
+        return self
+
+    def _unstreamline(self):
+        super(First, self)._unstreamline()
+        self._alternative_index = None
+
+    def _match_tokens(self, tokens, i, actions=True):
+        exprs = self.exprs
+        if self._alternative_index is not None:
+            exprs = [exprs[n] for n in self._alternative_index.positions(tokens, i)]
+        for e in exprs:
+            match = e._match(tokens, i, actions=True)
+            if match is not None:
                 # If a name is assigned to a First, it replaces the name of the contained result
-                if self.name:
-                    for e in result:
-                        e.tag = self.name
-                return result, result_i
-            except ParseException as err:
-                if err.i > furthest_i:
-                    furthest_exception = err
-                    furthest_i = err.i
-        else:
-            if furthest_exception is not None:
-                raise furthest_exception
-            else:
-                raise ParseException(tokens, i, 'No alternatives match', self)
+                if self.name and match[0]:
+                    results = match[0]
+                    packrat = _scan_state.packrat
+                    if packrat is not None and e in packrat.elements:
+                        # Rename copies, so that the memoized results keep their names
+                        results = copy_results(results)
+                    for result in results:
+                        result.tag = self.name
+                    return results, match[1]
+                return match
+        return None
+
+    def _first_set(self):
+        return alternatives_first_set(self.exprs)
 
     def __ior__(self, other):
         if isinstance(other, six.text_type):
@@ -452,72 +1176,90 @@ class ParseElementEnhance(BaseParserElement):
             expr = Word(expr)
         self.expr = expr
 
-    def _parse_tokens(self, tokens, i, actions=True):
+    def __setattr__(self, name, value):
+        super(ParseElementEnhance, self).__setattr__(name, value)
+        if name == 'expr':
+            if value is not None:
+                value._add_parent(self)
+            self._changed()
+
+    def __setstate__(self, state):
+        super(ParseElementEnhance, self).__setstate__(state)
+        if state.get('expr') is not None:
+            state['expr']._add_parent(self)
+
+    def _match_tokens(self, tokens, i, actions=True):
         if self.expr is not None:
-            return self.expr.parse(tokens, i)
-        else:
-            raise ParseException('', i, 'Error', self)
+            return self.expr._match(tokens, i)
+        return None
 
     def streamline(self):
-        super(ParseElementEnhance, self).streamline()
-        if self.expr is not None:
+        if self.expr is not None and self.expr.needs_streamline():
             self.expr.streamline()
-        return self
+        return super(ParseElementEnhance, self).streamline()
+
+    def _first_set(self):
+        if self.expr is None:
+            return ANY_FIRST
+        return self.expr.first_set
 
 
 class FollowedBy(ParseElementEnhance):
     """Check ahead if matches."""
 
-    def _parse_tokens(self, tokens, i, actions=True):
-        self.expr.try_parse(tokens, i)
+    def _match_tokens(self, tokens, i, actions=True):
+        if self.expr._try_match(tokens, i) is None:
+            return None
         return [], i
 
+    def _first_set(self):
+        return EMPTY_FIRST
+
 
 class Not(ParseElementEnhance):
     """Check ahead to disallow a match with the given parse expression."""
 
-    def _parse_tokens(self, tokens, i, actions=True):
-        try:
-            self.expr.try_parse(tokens, i)
-        except (ParseException, IndexError):
-            pass
-        else:
-            raise ParseException(tokens, i, 'Encountered disallowed token', self)
+    def _match_tokens(self, tokens, i, actions=True):
+        if self.expr._try_match(tokens, i) is not None:
+            return None
         return [], i
 
+    def _first_set(self):
+        return EMPTY_FIRST
+
 
 class ZeroOrMore(ParseElementEnhance):
     """Optional repetition of zero or more of the given expression."""
 
-    def _parse_tokens(self, tokens, i, actions=True):
+    def _match_tokens(self, tokens, i, actions=True):
         results = []
-        try:
-            results, i = self.expr.parse(tokens, i, actions)
-            while 1:
-                start_i = i
-                tmpresults, i = self.expr.parse(tokens, start_i, actions)
-                if tmpresults:
-                    results.extend(tmpresults)
-        except (ParseException, IndexError):
-            pass
-        return ([E(self.name, *results)] if self.name else results), i
+        match = self.expr._match(tokens, i, actions)
+        while match is not None:
+            if match[0]:
+                results.extend(match[0])
+            i = match[1]
+            match = self.expr._match(tokens, i, actions)
+        return ([ResultNode(self.name, None, results)] if self.name else results), i
+
+    def _first_set(self):
+        return self.expr.first_set.union(EMPTY_FIRST)
 
 
 class OneOrMore(ParseElementEnhance):
     """Repetition of one or more of the given expression."""
 
-    def _parse_tokens(self, tokens, i, actions=True):
+    def _match_tokens(self, tokens, i, actions=True):
         # must be at least one
-        results, i = self.expr.parse(tokens, i, actions)
-        try:
-            while 1:
-                start_i = i
-                tmpresults, i = self.expr.parse(tokens, start_i, actions)
-                if tmpresults:
-                    results.extend(tmpresults)
-        except (ParseException, IndexError):
-            pass
-        return ([E(self.name, *results)] if self.name else results), i
+        match = self.expr._match(tokens, i, actions)
+        if match is None:
+            return None
+        results = []
+        while match is not None:
+            if match[0]:
+                results.extend(match[0])
+            i = match[1]
+            match = self.expr._match(tokens, i, actions)
+        return ([ResultNode(self.name, None, results)] if self.name else results), i
 
 
 class Optional(ParseElementEnhance):
@@ -525,21 +1267,25 @@ class Optional(ParseElementEnhance):
     def __init__(self, expr):
         super(Optional, self).__init__(expr)
 
-    def _parse_tokens(self, tokens, i, actions=True):
-        results = []
-        try:
-            results, i = self.expr.parse(tokens, i, actions)
-        except (ParseException, IndexError):
-            pass
-        return results, i
+    def _match_tokens(self, tokens, i, actions=True):
+        match = self.expr._match(tokens, i, actions)
+        if match is None:
+            return [], i
+        return match
+
+    def _first_set(self):
+        return self.expr.first_set.union(EMPTY_FIRST)
 
 
 class Group(ParseElementEnhance):
     """"""
 
-    def _parse_tokens(self, tokens, i, actions=True):
-        results, i = self.expr.parse(tokens, i, actions)
-        return ([E(self.name, *results)] if self.name else results), i
+    def _match_tokens(self, tokens, i, actions=True):
+        match = self.expr._match(tokens, i, actions)
+        if match is None:
+            return None
+        results, i = match
+        return ([ResultNode(self.name, None, results)] if self.name else results), i
 
 
 class SkipTo(ParseElementEnhance):
@@ -548,29 +1294,34 @@ class SkipTo(ParseElementEnhance):
         super(SkipTo, self).__init__(expr)
         self.include = include
 
-    def _parse_tokens(self, tokens, i, actions=True):
+    def _match_tokens(self, tokens, i, actions=True):
         start_i = i
         tokens_length = len(tokens)
         while i <= tokens_length:
-            try:
-                self.expr.parse(tokens, i, actions=False)
-                results = [E(safe_name(t[1]), t[0]) for t in tokens[start_i:i]]
-                if self.include:
-                    match_result, i = self.expr.parse(tokens, i, actions)
-                    if match_result:
-                        results.extend(match_result)
-                return results, i
-            except (ParseException, IndexError):
-                i += 1
-        raise ParseException(tokens, i, '', self)
+            if self.expr._match(tokens, i, actions=False) is not None:
+                results = [ResultNode(safe_name(t[1]), t[0]) for t in tokens[start_i:i]]
+                if not self.include:
+                    return results, i
+                match = self.expr._match(tokens, i, actions)
+                if match is not None:
+                    if match[0]:
+                        results.extend(match[0])
+                    return results, match[1]
+            i += 1
+        return None
+
+    def _first_set(self):
+        return ANY_FIRST
 
 
 class Hide(ParseElementEnhance):
     """Converter for ignoring the results of a parsed expression."""
 
-    def _parse_tokens(self, tokens, i, actions=True):
-        results, i = super(Hide, self)._parse_tokens(tokens, i)
-        return [], i
+    def _match_tokens(self, tokens, i, actions=True):
+        match = super(Hide, self)._match_tokens(tokens, i)
+        if match is None:
+            return None
+        return [], match[1]
 
     def hide(self):
         return self
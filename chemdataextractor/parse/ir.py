@@ -14,14 +14,12 @@ from __future__ import unicode_literals
 import logging
 import re
 
-from lxml.builder import E
-
 from ..model import Compound, IrSpectrum, IrPeak
 from .base import BaseParser
 from ..utils import first
 from .actions import join, merge, strip_stop
 from .common import hyphen
-from .elements import W, I, T, R, Optional, ZeroOrMore, OneOrMore, Not
+from .elements import W, I, T, R, Optional, ZeroOrMore, OneOrMore, Not, ResultNode
 from .cem import chemical_name
 
 
@@ -33,7 +31,7 @@ def extract_units(tokens, start, result):
     for e in result:
         for child in e.iter():
             if 'cm−1' in child.text:
-                return [E('units', 'cm−1')]
+                return [ResultNode('units', 'cm−1')]
     return []
 
 
@@ -83,6 +81,7 @@ ir = (prelude + peaks + Optional(delim) + Optional(units))('ir')
 class IrParser(BaseParser):
     """"""
     root = ir
+    materialize_results = False
 
     def interpret(self, result, start, end):
         c = Compound()
@@ -49,10 +49,12 @@ to_give_mp_phrase = ((I('to') + (I('give') | I('afford') | I('yield') | I('obtai
 obtained_mp_phrase = ((cem | chemical_label) + (I('is') | I('are') | I('was')).hide() + (I('afforded') | I('obtained') | I('yielded')).hide() + ZeroOrMore(Not(mp) + Not(cem) + Any()).hide() + mp)('mp_phrase')
 
 mp_phrase = cem_mp_phrase | to_give_mp_phrase | obtained_mp_phrase
+mp_phrase.packrat = True
 
 class MpParser(BaseParser):
     """"""
     root = mp_phrase
+    materialize_results = False
 
     def interpret(self, result, start, end):
         compound = Compound(
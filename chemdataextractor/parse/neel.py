@@ -220,6 +220,7 @@ nt_phrase =  (nt_ratio | multiple_nt_phrase | cem_after_nt_and_value_phrase | nt
 class NtParser(BaseParser):
     """"""
     root = nt_phrase
+    materialize_results = False
 
     def interpret(self, result, start, end):
         #print(etree.tostring(result))
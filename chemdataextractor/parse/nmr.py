@@ -114,6 +114,7 @@ class NmrParser(BaseParser):
     """"""
 
     root = nmr
+    materialize_results = False
 
     def __init__(self):
         pass
@@ -13,7 +13,6 @@ from __future__ import print_function
 from __future__ import unicode_literals
 import logging
 import re
-from lxml.builder import E
 
 from .common import delim
 from .common import lbrct, dt, rbrct
@@ -23,7 +22,7 @@ from ..model import ElectrochemicalPotential, IrSpectrum, IrPeak
 from .actions import join, merge, fix_whitespace
 from .base import BaseParser
 from .cem import chemical_label, label_before_name, chemical_name, chemical_label_phrase, solvent_name, lenient_chemical_label
-from .elements import R, I, W, Optional, ZeroOrMore, Any, OneOrMore, Start, End, Group, Not
+from .elements import R, I, W, Optional, ZeroOrMore, Any, OneOrMore, Start, End, Group, Not, ResultNode
 
 log = logging.getLogger(__name__)
 
@@ -100,7 +99,7 @@ quantum_yield_cell = (quantum_yield_value + Optional(quantum_yield_units))('quan
 def split_uvvis_shape(tokens, start, result):
     """"""
     if result[0].text.endswith('sh') or result[0].text.endswith('br'):
-        result.append(E('shape', result[0].text[-2:]))
+        result.append(ResultNode('shape', result[0].text[-2:]))
         result[0].text = result[0].text[:-2]
 
 
@@ -229,6 +228,7 @@ caption_context = Group(subject_phrase | solvent_phrase | temp_phrase)('caption_
 class CompoundHeadingParser(BaseParser):
     """"""
     root = compound_heading
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -238,6 +238,7 @@ class CompoundHeadingParser(BaseParser):
 class SolventHeadingParser(BaseParser):
     """"""
     root = solvent_heading
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -247,6 +248,7 @@ class SolventHeadingParser(BaseParser):
 class UvvisAbsDisallowedHeadingParser(BaseParser):
     """"""
     root = uvvis_abs_disallowed
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -256,6 +258,7 @@ class UvvisAbsDisallowedHeadingParser(BaseParser):
 class SolventInHeadingParser(BaseParser):
     """"""
     root = solvent_in_heading
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -276,6 +279,7 @@ class SolventInHeadingParser(BaseParser):
 class TempInHeadingParser(BaseParser):
     """"""
     root = temp_with_units
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -294,6 +298,7 @@ class TempInHeadingParser(BaseParser):
 class SolventCellParser(BaseParser):
     """"""
     root = solvent_cell
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -314,6 +319,7 @@ class SolventCellParser(BaseParser):
 class CompoundCellParser(BaseParser):
     """"""
     root = compound_cell
+    materialize_results = False
 
     def interpret(self, result, start, end):
         for cem_el in result.xpath('./cem'):
@@ -327,6 +333,7 @@ class CompoundCellParser(BaseParser):
 class UvvisEmiHeadingParser(BaseParser):
     """"""
     root = uvvis_emi_heading
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -339,6 +346,7 @@ class UvvisEmiHeadingParser(BaseParser):
 class UvvisAbsHeadingParser(BaseParser):
     """"""
     root = uvvis_abs_heading
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -355,6 +363,7 @@ class UvvisAbsHeadingParser(BaseParser):
 class ExtinctionHeadingParser(BaseParser):
     """"""
     root = extinction_heading
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -370,6 +379,7 @@ class ExtinctionHeadingParser(BaseParser):
 class IrHeadingParser(BaseParser):
     """"""
     root = ir_heading
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -385,6 +395,7 @@ class IrHeadingParser(BaseParser):
 class IrCellParser(BaseParser):
     """"""
     root = ir_cell
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -405,6 +416,7 @@ class IrCellParser(BaseParser):
 class QuantumYieldHeadingParser(BaseParser):
     """"""
     root = quantum_yield_heading
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -422,6 +434,7 @@ class QuantumYieldHeadingParser(BaseParser):
 class QuantumYieldCellParser(BaseParser):
     """"""
     root = quantum_yield_cell
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -438,6 +451,7 @@ class QuantumYieldCellParser(BaseParser):
 class UvvisEmiCellParser(BaseParser):
     """"""
     root = uvvis_emi_cell
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -449,6 +463,7 @@ class UvvisEmiCellParser(BaseParser):
 class UvvisAbsCellParser(BaseParser):
     """"""
     root = uvvis_abs_cell
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -470,6 +485,7 @@ class UvvisAbsCellParser(BaseParser):
 class ExtinctionCellParser(BaseParser):
     """"""
     root = extinction_cell
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -489,6 +505,7 @@ class ExtinctionCellParser(BaseParser):
 class UvvisAbsEmiQuantumYieldHeadingParser(BaseParser):
     """"""
     root = uvvis_abs_emi_quantum_yield_heading
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -510,6 +527,7 @@ class UvvisAbsEmiQuantumYieldHeadingParser(BaseParser):
 class UvvisAbsEmiQuantumYieldCellParser(BaseParser):
     """"""
     root = uvvis_abs_emi_quantum_yield_cell
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -536,6 +554,7 @@ class UvvisAbsEmiQuantumYieldCellParser(BaseParser):
 class UvvisEmiQuantumYieldHeadingParser(BaseParser):
     """"""
     root = uvvis_emi_quantum_yield_heading
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -546,6 +565,7 @@ class UvvisEmiQuantumYieldHeadingParser(BaseParser):
 class UvvisEmiQuantumYieldCellParser(BaseParser):
     """"""
     root = uvvis_emi_quantum_yield_cell
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -561,6 +581,7 @@ class UvvisEmiQuantumYieldCellParser(BaseParser):
 class FluorescenceLifetimeHeadingParser(BaseParser):
     """"""
     root = fluorescence_lifetime_heading
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -576,6 +597,7 @@ class FluorescenceLifetimeHeadingParser(BaseParser):
 class FluorescenceLifetimeCellParser(BaseParser):
     """"""
     root = fluorescence_lifetime_cell
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -591,6 +613,7 @@ class FluorescenceLifetimeCellParser(BaseParser):
 class MeltingPointHeadingParser(BaseParser):
     """"""
     root = melting_point_heading
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -606,6 +629,7 @@ class MeltingPointHeadingParser(BaseParser):
 class MeltingPointCellParser(BaseParser):
     """"""
     root = melting_point_cell
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -623,6 +647,7 @@ class MeltingPointCellParser(BaseParser):
 class NeelTemperatureHeadingParser(BaseParser):
     """"""
     root = neel_temp_heading
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -638,6 +663,7 @@ class NeelTemperatureHeadingParser(BaseParser):
 class NeelTemperatureCellParser(BaseParser):
     """"""
     root = neel_temp_cell
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -656,6 +682,7 @@ class NeelTemperatureCellParser(BaseParser):
 class CurieTemperatureHeadingParser(BaseParser):
     """"""
     root = curie_temp_heading
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -671,6 +698,7 @@ class CurieTemperatureHeadingParser(BaseParser):
 class CurieTemperatureCellParser(BaseParser):
     """"""
     root = curie_temp_cell
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -690,6 +718,7 @@ class CurieTemperatureCellParser(BaseParser):
 class GlassTransitionHeadingParser(BaseParser):
     """"""
     root = glass_transition_heading
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -704,6 +733,7 @@ class GlassTransitionHeadingParser(BaseParser):
 class GlassTransitionCellParser(BaseParser):
     """"""
     root = glass_transition_cell
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -721,6 +751,7 @@ class GlassTransitionCellParser(BaseParser):
 class ElectrochemicalPotentialHeadingParser(BaseParser):
     """"""
     root = electrochemical_potential_heading
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -738,6 +769,7 @@ class ElectrochemicalPotentialHeadingParser(BaseParser):
 class ElectrochemicalPotentialCellParser(BaseParser):
     """"""
     root = electrochemical_potential_cell
+    materialize_results = False
 
     def interpret(self, result, start, end):
         """"""
@@ -755,6 +787,7 @@ class ElectrochemicalPotentialCellParser(BaseParser):
 class CaptionContextParser(BaseParser):
     """"""
     root = caption_context
+    materialize_results = False
 
     def __init__(self):
         pass
@@ -49,11 +49,13 @@ obtained_tg_phrase = ((cem | chemical_label) + (I('is') | I('are') | I('was')).h
 
 #tg_phrase = cem_tg_phrase | method1_phrase | method2_phrase | method3_phrase | obtained_tg_phrase
 tg_phrase = cem_tg_phrase | obtained_tg_phrase
+tg_phrase.packrat = True
 
 
 class TgParser(BaseParser):
     """"""
     root = tg_phrase
+    materialize_results = False
 
     #print ('outside parser', tg_phrase, type(tg_phrase))
 
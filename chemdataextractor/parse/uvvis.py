@@ -51,6 +51,7 @@ uvvis = (prelude + peaks + Optional(delim) + Optional(units) + Optional(insolven
 class UvvisParser(BaseParser):
     """"""
     root = uvvis
+    materialize_results = False
 
     def interpret(self, result, start, end):
         c = Compound()
@@ -19,6 +19,7 @@ from.entity import Entity
 from .phrase import Phrase
 from .cluster import Cluster
 from .pattern import Pattern
+from .delta import Delta
 
 
 __title__ = 'ChemDataExtractor'
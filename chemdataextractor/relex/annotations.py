@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+chemdataextractor.relex.annotations
+Bulk Snowball training from annotation files
+
+Each annotation chooses the relations of one sentence, like an answer to the Snowball.parse prompt. Annotations
+are read from JSON lines files, one object per line, or from tab separated files with a header row. Every
+annotation identifies its sentence in one of these ways:
+
+    tokens (and optionally tags) -- The sentence tokens, so the sentence is not tokenized or tagged again
+    text -- The sentence text
+    document, element, sentence -- The index of a sentence in a text element of a document
+    document, element, start, end -- The character offsets of a sentence in a text element of a document
+
+where document is the path to the document, relative to a documents directory if one is given. The chosen relations
+are given either as
+
+    candidates -- The indices of the chosen candidates, numbered as in the Snowball.parse prompt
+    relations -- Entity spans, a list with one list of [text, tag, start, end] token spans per relation (or the
+                 relations of a journal 'update' line)
+
+and relations are used if both are given. In tab separated files candidates are comma separated and relations are
+JSON. Snowball.parse writes annotations with tokens, tags, candidates and relations, and the change journal can be
+read as an annotation file too, since its 'update' lines hold tokens, tags and relations.
+"""
+import csv
+import io
+import json
+import logging
+import os
+
+import six
+
+from ..doc.text import Sentence, Text
+from .corpus import read_document
+from .entity import Entity
+from .relationship import Relation
+
+log = logging.getLogger(__name__)
+
+
+def annotation_record(document, element, sentence_index, sentence, tagged_tokens, candidates, chosen):
+    """An annotation for a sentence answered interactively
+
+    Arguments:
+        document {str} -- The document path
+        element {int} -- Index of the text element of the document
+        sentence_index {int} -- Index of the sentence in the element
+        sentence {Sentence} -- The sentence
+        tagged_tokens {list} -- Its tagged tokens
+        candidates {list} -- The candidate Relations offered
+        chosen {list} -- Indices of the chosen candidates
+
+    Returns:
+        dict -- JSON serializable annotation
+    """
+    return {'document': document,
+            'element': element,
+            'sentence': sentence_index,
+            'text': sentence.text,
+            'tokens': [token for token, tag in tagged_tokens],
+            'tags': [tag for token, tag in tagged_tokens],
+            'candidates': chosen,
+            'relations': [[[e.text, e.tag, e.start, e.end] for e in candidates[i].entities] for i in chosen]}
+
+
+def read_tsv(f):
+    """Yield annotations from a tab separated file with a header row, read from a text stream"""
+    lines = f
+    if six.PY2:
+        # The Python 2 csv module only reads byte strings
+        lines = (line.encode('utf-8') for line in f)
+    for row in csv.DictReader(lines, delimiter='\t'):
+        if six.PY2:
+            row = dict((key.decode('utf-8') if isinstance(key, bytes) else key,
+                        value.decode('utf-8') if isinstance(value, bytes) else value) for key, value in row.items())
+        annotation = dict((key, value) for key, value in row.items() if value not in (None, ''))
+        for key in ('element', 'sentence', 'start', 'end'):
+            if key in annotation:
+                annotation[key] = int(annotation[key])
+        if 'candidates' in annotation:
+            annotation['candidates'] = [int(i) for i in annotation['candidates'].split(',') if i.strip()]
+        if 'relations' in annotation:
+            annotation['relations'] = json.loads(annotation['relations'])
+        yield annotation
+
+
+def read_annotations(path):
+    """Yield the annotations of a JSON lines (.jsonl, .json, .journal) or tab separated (.tsv) file"""
+    with io.open(path, 'r', encoding='utf-8', newline='') as f:
+        if os.path.splitext(path)[1].lower() in ('.tsv', '.tab'):
+            for annotation in read_tsv(f):
+                yield annotation
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class AnnotationReader(object):
+    """Turn annotations into the 'update' changes that Snowball.apply_change learns from"""
+
+    def __init__(self, snowball, documents_dir=None, documents=None):
+        """
+        Arguments:
+            snowball {Snowball} -- The model being trained, whose relationship finds the candidates
+
+        Keyword Arguments:
+            documents_dir {str} -- Directory that document paths are relative to (default: {None})
+            documents {dict} -- Documents that are already loaded, by document id (default: {None})
+        """
+        self.snowball = snowball
+        self.documents_dir = documents_dir
+        self.documents = documents or {}
+        self.parse_expressions = dict((e.name, e) for e in snowball.relationship.entities)
+        self._document_id = None
+        self._document = None
+
+    def document(self, document_id):
+        """Read a document, keeping the last one since annotations are usually grouped by document"""
+        if document_id in self.documents:
+            return self.documents[document_id]
+        if document_id != self._document_id:
+            path = document_id
+            if self.documents_dir is not None:
+                path = os.path.join(self.documents_dir, document_id)
+            self._document = read_document(path)
+            self._document_id = document_id
+        return self._document
+
+    def sentence(self, annotation):
+        """Find the Sentence that an annotation refers to"""
+        if 'text' in annotation and 'document' not in annotation:
+            return Sentence(annotation['text'])
+        if 'document' not in annotation or 'element' not in annotation:
+            raise ValueError('Annotation does not identify a sentence: %s' % annotation)
+        element = self.document(annotation['document']).elements[annotation['element']]
+        if not isinstance(element, Text):
+            raise ValueError('Element %s of %s is not text' % (annotation['element'], annotation['document']))
+        if 'start' in annotation:
+            for sentence in element.sentences:
+                if sentence.start == annotation['start'] and sentence.end == annotation['end']:
+                    return sentence
+            raise ValueError('No sentence at %s-%s in element %s of %s' % (annotation['start'], annotation['end'],
+                                                                          annotation['element'], annotation['document']))
+        return element.sentences[annotation['sentence']]
+
+    def relations(self, annotation, tagged_tokens):
+        """The chosen Relations of an annotation, each with confidence 1"""
+        if 'relations' in annotation:
+            relations = []
+            for entities in annotation['relations']:
+                if isinstance(entities, dict):
+                    # Relations encoded by the journal
+                    entities = entities['entities']
+                relations.append(Relation([Entity(text, tag, self.parse_expressions[tag], start, end)
+                                           for text, tag, start, end in entities], confidence=1.0))
+            return relations
+        candidates = self.snowball.relationship.get_candidates(tagged_tokens)
+        chosen = []
+        for i in annotation.get('candidates', []):
+            chosen.append(candidates[int(i)].with_confidence(1.0))
+        return chosen
+
+    def change(self, annotation):
+        """The 'update' change for an annotation, or None if it chooses no relations
+
+        Arguments:
+            annotation {dict} -- The annotation
+
+        Returns:
+            dict -- The change, in the format written to the journal
+        """
+        if 'tokens' in annotation:
+            tokens = annotation['tokens']
+            tags = annotation.get('tags')
+            tagged_tokens = list(zip(tokens, tags)) if tags is not None else None
+            if tagged_tokens is None and 'relations' not in annotation:
+                tagged_tokens = Sentence(' '.join(tokens)).tagged_tokens
+                tags = [tag for token, tag in tagged_tokens]
+        else:
+            sentence = self.sentence(annotation)
+            tokens = sentence.raw_tokens
+            tagged_tokens = sentence.tagged_tokens
+            tags = [tag for token, tag in tagged_tokens]
+        relations = self.relations(annotation, tagged_tokens)
+        if not relations:
+            return None
+        change = {'op': 'update', 'tokens': list(tokens), 'relations': self.snowball.encode_relations(relations)}
+        if tags is not None:
+            change['tags'] = list(tags)
+        return change
+
+    def changes(self, annotations):
+        """Yield the 'update' changes for annotations, skipping those without chosen relations"""
+        for annotation in annotations:
+            if annotation.get('op', 'update') != 'update':
+                # Other journal changes are not annotations
+                continue
+            change = self.change(annotation)
+            if change is not None:
+                yield change
+
+
+def annotation_changes(snowball, sources, documents_dir=None):
+    """Yield 'update' changes for the annotations in some files
+
+    Arguments:
+        snowball {Snowball} -- The model being trained
+        sources {list} -- Annotation file paths, or iterables of annotation dicts
+
+    Keyword Arguments:
+        documents_dir {str} -- Directory that document paths are relative to (default: {None})
+
+    Yields:
+        dict -- 'update' changes, in the order of the annotations
+    """
+    reader = AnnotationReader(snowball, documents_dir=documents_dir)
+    for source in sources:
+        annotations = read_annotations(source) if isinstance(source, six.string_types) else source
+        for change in reader.changes(annotations):
+            yield change
+
+
+def train_annotations(snowball, sources, documents_dir=None):
+    """Train a Snowball on annotation files without prompting
+
+    All updates are journaled as usual, and the model is checkpointed once at the end.
+
+    Arguments:
+        snowball {Snowball} -- The model to train
+        sources {list} -- Annotation file paths, or iterables of annotation dicts
+
+    Keyword Arguments:
+        documents_dir {str} -- Directory that document paths are relative to (default: {None})
+
+    Returns:
+        int -- The number of sentences learned from
+    """
+    if snowball.frozen:
+        raise ValueError("Cannot train a frozen Snowball, call unfreeze() first")
+    updates = 0
+    with snowball:
+        for change in annotation_changes(snowball, sources, documents_dir=documents_dir):
+            snowball.apply_change(change)
+            updates += 1
+    log.debug('Learned from %s annotated sentences' % updates)
+    return updates
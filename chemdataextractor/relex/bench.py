@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+chemdataextractor.relex.bench
+Reproducible benchmarks of the Snowball hot paths
+
+Times model loading, candidate generation, extraction and cluster updates on a corpus of sentences, for the model
+itself and for synthetic copies of it with many more clusters, and reports throughput, latency percentiles and peak
+memory. See `cde bench relex` for running it on the bundled Curie temperature model and training set.
+
+"""
+import io
+import os
+import pickle
+import random
+import shutil
+import sys
+import tempfile
+from collections import OrderedDict
+from timeit import default_timer
+
+import numpy as np
+
+from ..doc.text import Text
+from .cluster import Cluster
+from .corpus import read_document
+from .phrase import Phrase
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+
+class TaggedSentence(object):
+    """A sentence whose tokens were tagged in advance, so that tagging is not part of the timings"""
+
+    __slots__ = ('raw_tokens', 'tagged_tokens')
+
+    def __init__(self, tagged_tokens):
+        self.tagged_tokens = list(tagged_tokens)
+        self.raw_tokens = [token for token, tag in self.tagged_tokens]
+
+
+def read_sentences(paths, limit=None):
+    """Read and tag the sentences of some documents
+
+    Arguments:
+        paths {list} -- Paths of the documents
+
+    Keyword Arguments:
+        limit {int} -- Largest number of sentences to read (default: {None, all of them})
+
+    Returns:
+        list -- TaggedSentence objects, in document order
+    """
+    sentences = []
+    for path in paths:
+        for element in read_document(path).elements:
+            if not isinstance(element, Text):
+                continue
+            for sentence in element.sentences:
+                if limit is not None and len(sentences) >= limit:
+                    return sentences
+                sentences.append(TaggedSentence(sentence.tagged_tokens))
+    return sentences
+
+
+def phrase_updates(snowball, n, seed=0):
+    """Sample the sentences and relations of n phrases of a model, to replay as updates
+
+    Arguments:
+        snowball {Snowball} -- The model to sample from
+        n {int} -- Number of updates
+
+    Keyword Arguments:
+        seed {int} -- Seed of the sample (default: {0})
+
+    Returns:
+        list -- (sentence tokens, relations, tagged tokens) arguments of Snowball.update
+    """
+    phrases = [phrase for cluster in snowball.clusters for phrase in cluster.phrases]
+    if not phrases:
+        return []
+    rng = random.Random(seed)
+    updates = []
+    for i in range(n):
+        phrase = rng.choice(phrases)
+        tagged_tokens = list(zip(phrase.sentence_tokens, phrase.tags)) if phrase.tags is not None else None
+        updates.append((phrase.sentence_tokens, phrase.relations, tagged_tokens))
+    return updates
+
+
+def vary_phrase(phrase, rng, marker):
+    """A copy of a phrase with one of the tokens outside its entities replaced by a synthetic token
+
+    Arguments:
+        phrase {Phrase} -- The phrase to copy
+        rng {random.Random} -- Picks the token to replace
+        marker {str} -- Appended to the replaced token
+
+    Returns:
+        Phrase -- The varied copy
+    """
+    tokens = list(phrase.sentence_tokens)
+    entity_positions = set()
+    for relation in phrase.relations:
+        for entity in relation.entities:
+            entity_positions.update(range(entity.start, entity.end))
+    positions = [i for i in range(len(tokens)) if i not in entity_positions]
+    if positions:
+        i = rng.choice(positions)
+        tokens[i] = tokens[i] + marker
+    tagged_tokens = list(zip(tokens, phrase.tags)) if phrase.tags is not None else None
+    return Phrase(tokens, phrase.relations, phrase.prefix_length, phrase.suffix_length, tagged_tokens=tagged_tokens)
+
+
+def scale_model(snowball, factor, seed=0):
+    """A copy of a model with factor times as many clusters
+
+    Every cluster gets factor - 1 synthetic variants, whose phrases each have one token outside the entities
+    changed. The variants keep the entity order and pattern confidence of their cluster, so they compete with it
+    when phrases are matched, like the clusters of a larger model would.
+
+    Arguments:
+        snowball {Snowball} -- The model to scale
+        factor {int} -- How many times as many clusters the copy has
+
+    Keyword Arguments:
+        seed {int} -- Seed of the token variations (default: {0})
+
+    Returns:
+        Snowball -- The scaled copy, which does not journal or checkpoint its updates
+    """
+    scaled = pickle.loads(pickle.dumps(snowball, protocol=pickle.HIGHEST_PROTOCOL))
+    scaled.unfreeze()
+    scaled.journaling = False
+    scaled.checkpoint_every = None
+    scaled.checkpoint_interval = None
+    rng = random.Random(seed)
+    for k in range(1, factor):
+        marker = '~%s' % k
+        for cluster in snowball.clusters:
+            if not cluster.phrases:
+                continue
+            variant = Cluster(cluster.label + marker, learning_rate=cluster.learning_rate, max_phrases=cluster.max_phrases)
+            variant.restore([vary_phrase(phrase, rng, marker) for phrase in cluster.phrases],
+                            cluster.pattern.confidence, cluster.old_pattern_confidence)
+            scaled.add_cluster(variant)
+    return scaled
+
+
+def latency_summary(latencies, memory=None):
+    """Throughput and latency percentiles of some timed calls
+
+    Arguments:
+        latencies {list} -- Seconds taken by each call
+
+    Keyword Arguments:
+        memory {int} -- Peak memory allocated during the calls, in bytes (default: {None, not measured})
+
+    Returns:
+        OrderedDict -- Number of calls, total seconds, calls per second, mean, median, 90th and 99th percentile and
+                       longest latency in milliseconds, and peak memory in MiB
+    """
+    latencies = np.asarray(latencies, dtype=float)
+    summary = OrderedDict([('calls', len(latencies)), ('seconds', float(latencies.sum()))])
+    if len(latencies):
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+        summary['throughput'] = len(latencies) / summary['seconds'] if summary['seconds'] else None
+        summary['mean_ms'] = float(latencies.mean() * 1000)
+        summary['p50_ms'] = float(p50)
+        summary['p90_ms'] = float(p90)
+        summary['p99_ms'] = float(p99)
+        summary['max_ms'] = float(latencies.max() * 1000)
+    summary['peak_memory_mb'] = memory / 2.0 ** 20 if memory is not None else None
+    return summary
+
+
+def measure(make_call, items, repeat=1, memory=True):
+    """Time a function on each of some items
+
+    Arguments:
+        make_call {callable} -- Returns the function to time. It is called before every pass over the items, so
+                                that passes which change a model can start from a fresh copy.
+        items {list} -- The arguments of the timed calls
+
+    Keyword Arguments:
+        repeat {int} -- Number of timed passes over the items (default: {1})
+        memory {bool} -- Measure the peak memory allocated in an extra, untimed pass, which needs tracemalloc
+                         (default: {True})
+
+    Returns:
+        OrderedDict -- See latency_summary
+    """
+    latencies = []
+    for i in range(repeat):
+        call = make_call()
+        for item in items:
+            start = default_timer()
+            call(item)
+            latencies.append(default_timer() - start)
+    peak = None
+    if memory and tracemalloc is not None and not tracemalloc.is_tracing():
+        call = make_call()
+        tracemalloc.start()
+        try:
+            for item in items:
+                call(item)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return latency_summary(latencies, memory=peak)
+
+
+def bench_relex(snowball, sentences, scales=(1, 10, 100), updates=100, repeat=1, memory=True, seed=0):
+    """Benchmark a model and scaled copies of it
+
+    Candidate generation does not depend on the clusters, so it is only timed once. For each scale, loading is
+    timed on a pickled copy of the scaled model, extraction (without learning) on the frozen copy, and updates on
+    fresh unfrozen copies.
+
+    Arguments:
+        snowball {Snowball} -- The model to benchmark
+        sentences {list} -- Tagged sentences to extract from (see TaggedSentence)
+
+    Keyword Arguments:
+        scales {list} -- Multiples of the number of clusters to benchmark (default: {(1, 10, 100)})
+        updates {int} -- Number of cluster updates to time, replaying phrases of the model (default: {100})
+        repeat {int} -- Number of timed passes of each stage (default: {1})
+        memory {bool} -- Also measure the peak memory of each stage (default: {True})
+        seed {int} -- Seed of the synthetic clusters and the sampled updates (default: {0})
+
+    Returns:
+        OrderedDict -- JSON serializable report
+    """
+    update_args = phrase_updates(snowball, updates, seed=seed)
+    report = OrderedDict([('sentences', len(sentences)), ('updates', len(update_args)), ('repeat', repeat)])
+    relationship = snowball.relationship
+    if not relationship.parser.streamlined:
+        relationship.parser.streamline()
+    report['get_candidates'] = measure(lambda: relationship.get_candidates,
+                                       [s.tagged_tokens for s in sentences], repeat=repeat, memory=memory)
+    report['scales'] = []
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for factor in scales:
+            scaled = scale_model(snowball, factor, seed=seed)
+            result = OrderedDict([('scale', factor), ('clusters', len(scaled.clusters))])
+            path = os.path.join(tmp_dir, 'scaled_%s.pkl' % factor)
+            with io.open(path, 'wb') as f:
+                pickle.dump(scaled, f, protocol=pickle.HIGHEST_PROTOCOL)
+            data = pickle.dumps(scaled, protocol=pickle.HIGHEST_PROTOCOL)
+            result['load'] = measure(lambda: scaled.load, [path], repeat=repeat, memory=memory)
+
+            frozen = pickle.loads(data)
+            start = default_timer()
+            frozen.freeze()
+            result['freeze_seconds'] = default_timer() - start
+            result['extract'] = measure(lambda: lambda s: frozen.extract(s, learn=False), sentences,
+                                        repeat=repeat, memory=memory)
+            del frozen
+
+            def fresh_update():
+                model = pickle.loads(data)
+                return lambda args: model.update(*args)
+            result['update'] = measure(fresh_update, update_args, repeat=repeat, memory=memory)
+            report['scales'].append(result)
+    finally:
+        shutil.rmtree(tmp_dir)
+    if resource is not None:
+        # Kilobytes on Linux, bytes on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        report['max_rss_mb'] = max_rss / 2.0 ** 20 if sys.platform == 'darwin' else max_rss / 2.0 ** 10
+    return report
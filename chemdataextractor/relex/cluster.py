@@ -3,31 +3,42 @@
 chemdataextractor.relex.cluster
 Cluster of phrase objects and associated cluster dictionaries
 """
+import random
 from collections import OrderedDict
 
-import numpy as np
-from lxml import etree
-from scipy import spatial
-
-from ..doc import Sentence
-from ..utils import first
 from .entity import Entity
 from .pattern import Pattern
+from .prefilter import lower_tokens
 from .relationship import Relation
-from .utils import mode_rows, subfinder
+from .stats import stats
+from .utils import subfinder
 
 class Cluster:
     """
     Base Snowball Cluster, used to combine similar phrases
+
+    Clusters loaded from a compact model file (see relex.store) only hold their centroid pattern until they are
+    needed for learning, when the attributes in lazy_attributes are read from the file.
+
+    With max_phrases set, only a uniform random sample (a reservoir) of the phrases is kept. The token dictionaries
+    still count every phrase that was added. Only the token sets of kept phrases have rows, which also count the
+    phrases with the same token set that were not kept, so the centroid pattern is the modal token set among the
+    sampled ones. The pattern confidence is estimated from the sampled phrases, and the pattern takes the relations of
+    the newest phrase added, whether it was kept or not.
+
+    The centroid pattern is maintained incrementally. Two phrases have the same token vector for an element exactly
+    when they contain the same set of tokens, so the modal vector of each element is tracked by counting the distinct
+    token sets, and the medoid is the first phrase seen with the modal token set.
     """
 
-    def __init__(self, label=None, order=None, learning_rate=0.5):
+    def __init__(self, label=None, order=None, learning_rate=0.5, max_phrases=None):
         """Create a new cluster
         
         Keyword Arguments:
             label {str} -- The label of this cluster (default: {None})
             order {list} -- The order of entities that all phrases in this cluster must share (default: {None})
             learning_rate {float} -- How quickly to update confidences based on new information (default: {0.5})
+            max_phrases {int} -- The largest number of phrases to keep (default: {None, keep all})
         """
 
         self.label = label
@@ -38,21 +49,184 @@ class Cluster:
         self.order = None
         self.old_pattern_confidence = 1.0
         self.learning_rate = learning_rate
+        self.element_rows = {}  # element -> {token set: [count, medoid element, number of kept phrases]}
+        self.modal_rows = {}  # element -> (token set, count)
+        self.token_positions = {}  # element -> {token: position in the token dict}
+        self.confidence_signature = None  # signature of the pattern that phrase_matches was computed with
+        self.phrase_matches = []  # number of relations the pattern finds in each phrase
+        self.max_phrases = max_phrases
+        self.phrases_seen = 0  # number of phrases added, including those not kept
+        self.phrases_dropped = 0  # number of phrases not kept, or replaced, because of max_phrases
+        self.matched_phrases = 0  # number of phrases added because they matched the pattern of this cluster
+        self._random = None
+
+    #: Attributes that are read from the model file on first access
+    lazy_attributes = ('phrases', 'dictionaries', 'element_rows', 'modal_rows', 'token_positions',
+                       'confidence_signature', 'phrase_matches')
+
+    def __getattr__(self, name):
+        store = self.__dict__.get('_store')
+        if store is None or name not in self.lazy_attributes:
+            raise AttributeError(name)
+        store.load_cluster_data(self)
+        return getattr(self, name)
+
+    def __getstate__(self):
+        if '_store' in self.__dict__:
+            self._store.load_cluster_data(self)
+        return self.__dict__.copy()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Clusters pickled before the centroid was maintained incrementally, or before rows counted kept phrases
+        if 'element_rows' not in state or any(len(row) < 3 for rows in self.element_rows.values()
+                                              for row in rows.values()):
+            self.element_rows = {}
+            self.modal_rows = {}
+            self.token_positions = {}
+            for phrase in self.phrases:
+                self.update_rows(phrase)
+        if 'phrase_matches' not in state:
+            self.confidence_signature = None
+            self.phrase_matches = []
+        if 'phrases_seen' not in state:
+            self.max_phrases = None
+            self.phrases_seen = len(self.phrases)
+            self.phrases_dropped = 0
+            self._random = None
+        if 'matched_phrases' not in state:
+            self.matched_phrases = 0
 
     def add_phrase(self, phrase):
         """ Add phrase to this cluster,
-        update the word dictionary and token weights
+        update the word dictionary, modal rows and centroid pattern
 
         :param phrase: The phrase to add to the cluster
         :type phrase: chemdataextractor.relex.phrase.Phrase
         """
-        self.phrases.append(phrase)
+        kept = self.store_phrase(phrase)
         self.order = phrase.order
         self.entities = phrase.entities
         self.update_dictionaries(phrase)
         self.update_weights()
-        self.update_pattern()
-        self.update_pattern_confidence()
+        self.update_rows(phrase, kept)
+        self.update_pattern(phrase.relations)
+        with stats.timer('confidence_update'):
+            self.update_pattern_confidence()
+        return
+
+    def add_match(self, phrase, pattern_rejects=False):
+        """Add a phrase that matched the pattern of this cluster, and count the match
+
+        :param phrase: The phrase to add to the cluster
+        :type phrase: chemdataextractor.relex.phrase.Phrase
+        :param pattern_rejects: Whether the sentence of the phrase is known to lack literal tokens of the pattern, so
+                                it is not scanned while the pattern keeps the same literal tokens
+        :type pattern_rejects: bool
+        """
+        self.matched_phrases += 1
+        if not pattern_rejects:
+            self.add_phrase(phrase)
+            return
+        self._rejected = (phrase, self.pattern.token_filter)
+        try:
+            self.add_phrase(phrase)
+        finally:
+            del self._rejected
+        return
+
+    def store_phrase(self, phrase):
+        """Keep a new phrase, or a uniform random sample of the phrases if there are more than max_phrases
+
+        Reservoir sampling: the n-th phrase replaces a random kept phrase with probability max_phrases / n. Replaced
+        phrases are removed with their match counts and rows, and kept phrases are appended so the newest is last.
+
+        Returns:
+            bool -- Whether the phrase was kept
+        """
+        self.phrases_seen += 1
+        if self.max_phrases is None or len(self.phrases) < self.max_phrases:
+            self.phrases.append(phrase)
+            return True
+        self.phrases_dropped += 1
+        if self._random is None:
+            # Seeded by label so that replaying the same updates keeps the same sample
+            self._random = random.Random(self.label)
+        j = self._random.randrange(self.phrases_seen)
+        if j >= self.max_phrases:
+            return False
+        self.release_rows(self.phrases.pop(j))
+        if j < len(self.phrase_matches):
+            del self.phrase_matches[j]
+        self.phrases.append(phrase)
+        return True
+
+    def restore(self, phrases, confidence, old_confidence=None, relations=None):
+        """Fill an empty cluster with already clustered phrases and a known pattern confidence
+
+        The dictionaries, modal rows and centroid pattern are rebuilt from the phrases, but the confidence is taken
+        as given rather than computed again.
+
+        Arguments:
+            phrases {list} -- The phrases of the cluster, in the order they were added
+            confidence {float} -- The confidence of the centroid pattern
+
+        Keyword Arguments:
+            old_confidence {float} -- The previous pattern confidence (default: {confidence})
+            relations {list} -- The relations of the centroid pattern (default: {the relations of the last phrase})
+        """
+        for phrase in phrases:
+            kept = self.store_phrase(phrase)
+            self.update_dictionaries(phrase)
+            self.update_rows(phrase, kept)
+        self.update_weights()
+        self.order = phrases[-1].order
+        self.entities = phrases[-1].entities
+        self.update_pattern(relations if relations is not None else phrases[-1].relations)
+        self.pattern.confidence = confidence
+        self.old_pattern_confidence = confidence if old_confidence is None else old_confidence
+        return
+
+    def merge(self, other):
+        """Add the phrases of an equivalent cluster, for example one trained on another part of a corpus
+
+        An empty cluster becomes a copy of the other. Otherwise the pattern confidences of the two clusters are
+        averaged, weighted by their number of phrases, and the result is updated with the confidence of the merged
+        centroid pattern like after add_phrase.
+
+        Arguments:
+            other {Cluster} -- The cluster to merge into this one
+        """
+        if not self.phrases:
+            self.restore(other.phrases, other.pattern.confidence, other.old_pattern_confidence,
+                         other.pattern.relations)
+            self.count_unkept(other)
+            if len(self.phrases) == len(other.phrases) and other.confidence_signature is not None and \
+                    other.confidence_signature == self.pattern_signature():
+                self.confidence_signature = other.confidence_signature
+                self.phrase_matches = list(other.phrase_matches)
+            return
+        n, other_n = len(self.phrases), len(other.phrases)
+        self.old_pattern_confidence = (n * self.pattern.confidence + other_n * other.pattern.confidence) / (n + other_n)
+        for phrase in other.phrases:
+            kept = self.store_phrase(phrase)
+            self.update_dictionaries(phrase)
+            self.update_rows(phrase, kept)
+        self.count_unkept(other)
+        self.update_weights()
+        # The newest phrase of the other cluster may not have been kept, but its pattern has the relations of it
+        self.order = other.order
+        self.entities = other.entities
+        self.update_pattern(other.pattern.relations)
+        with stats.timer('confidence_update'):
+            self.update_pattern_confidence()
+        return
+
+    def count_unkept(self, other):
+        """Count the phrases that another cluster saw but did not keep, and its matches, after merging it"""
+        self.phrases_seen += other.phrases_seen - len(other.phrases)
+        self.phrases_dropped += other.phrases_dropped
+        self.matched_phrases += other.matched_phrases
         return
 
     def update_dictionaries(self, phrase):
@@ -93,6 +267,79 @@ class Cluster:
                 dictionary['token dict'][token][0] += 1
         return
 
+    def update_rows(self, phrase, kept=True):
+        """Count the token set of each phrase element and update the modal rows
+
+        A phrase that was not kept is only counted in the rows of the kept phrases with the same token set.
+
+        :param phrase: The phrase that was added
+        :type phrase: chemdataextractor.relex.phrase.Phrase
+        :param kept: Whether the phrase was kept
+        :type kept: bool
+        """
+        for element, element_data in phrase.elements.items():
+            positions = self.token_positions.setdefault(element, {})
+            for token in element_data['tokens']:
+                if token not in positions:
+                    positions[token] = len(positions)
+            rows = self.element_rows.setdefault(element, {})
+            key = frozenset(element_data['tokens'])
+            if key in rows:
+                rows[key][0] += 1
+                if kept:
+                    rows[key][2] += 1
+            elif kept:
+                rows[key] = [1, element_data, 1]
+            else:
+                continue
+            count = rows[key][0]
+            if element not in self.modal_rows:
+                self.modal_rows[element] = (key, count)
+                continue
+            modal_key, modal_count = self.modal_rows[element]
+            if count > modal_count or (count == modal_count and key != modal_key and
+                                       self.precedes(positions, key, modal_key)):
+                self.modal_rows[element] = (key, count)
+        return
+
+    def release_rows(self, phrase):
+        """Remove a phrase from the rows of its token sets, and drop the rows that no kept phrase has any more
+
+        :param phrase: The phrase that is no longer kept
+        :type phrase: chemdataextractor.relex.phrase.Phrase
+        """
+        for element, element_data in phrase.elements.items():
+            rows = self.element_rows[element]
+            key = frozenset(element_data['tokens'])
+            rows[key][2] -= 1
+            if rows[key][2] > 0:
+                continue
+            del rows[key]
+            if self.modal_rows[element][0] != key:
+                continue
+            # Find the modal row again among the rows that are left
+            positions = self.token_positions[element]
+            modal = None
+            for other_key, row in rows.items():
+                if modal is None or row[0] > modal[1] or (row[0] == modal[1] and
+                                                          self.precedes(positions, other_key, modal[0])):
+                    modal = (other_key, row[0])
+            if modal is None:
+                del self.modal_rows[element]
+            else:
+                self.modal_rows[element] = modal
+        return
+
+    @staticmethod
+    def precedes(positions, key, other_key):
+        """Whether the row of token set key sorts before the row of other_key
+
+        Ties between equally frequent rows are broken like numpy.unique on the weight vectors: at the first
+        dictionary token where the rows differ, the row without the token comes first.
+        """
+        first_difference = min(key ^ other_key, key=positions.__getitem__)
+        return first_difference not in key
+
     def update_weights(self):
         """ Update the weights on each token in the phrases"""
         for element in self.dictionaries.keys():
@@ -103,81 +350,82 @@ class Cluster:
 
         return
 
-    def update_pattern(self):
-        """ Use the cluster phrases to generate a new centroid extraction Pattern object
-
-        :param relations: List of known relations to look for
-        :type: list of Relation objects
-        :param sentences: List of sentences known to contain relations
-        :type sentences: List of str"""
-
-        vectors = {}
-        # print("Updating pattern")
-        pattern_elements = {}
-
-        # Create a dict of vectors for all phrases in the cluster
-        for phrase in self.phrases:
-            for element in phrase.elements.keys():  # Prefix, ,iddles, suffix
-                if element not in vectors.keys():
-                    vectors[element] = []
-                phrase_element_vector = []
-                for token in self.dictionaries[element]['token dict'].keys():
-                    if token in phrase.elements[element]['tokens']:
-                        phrase_element_vector.append(self.dictionaries[element]['token dict'][token][1])
-                    else:
-                        phrase_element_vector.append(0)
-                
-                vectors[element].append(phrase_element_vector)
-
-        # print("Vectors", vectors)
-
-        # Find the centroid vector for prefix, middles, suffix
-        for element in vectors.keys():
-            element_array = np.array(vectors[element])
-            # print("Element", element)
-            # print("Element Array", element_array)
-            # compute mode of vectors
-            if element_array.any():
-                element_mode = mode_rows(element_array)
-            else:
-                element_mode = np.array([])
-            # print("Mode", element_mode)
-            medoid_idx = spatial.KDTree(element_array).query(element_mode)[1]
-            # print("Idx", medoid_idx)
-            pattern_elements[element] = self.phrases[medoid_idx].elements[element]
-            # print("Pattern element", pattern_elements[element])
-        
-        self.pattern = Pattern(elements=pattern_elements,
-                               entities=self.entities,
-                               label=self.label,
-                               order=self.order,
-                               relations=phrase.relations,
-                               confidence=0) 
-        # print(self.pattern)
-        
+    def update_pattern(self, relations=None):
+        """ Use the modal rows of the cluster phrases to generate a new centroid extraction Pattern object
+
+        :param relations: The relations of the newest phrase added, which may not have been kept
+                          (default: the relations of the last kept phrase)
+        :type relations: list of Relation objects
+        """
+        if relations is None:
+            relations = self.phrases[-1].relations
+        with stats.timer('pattern_rebuild'):
+            pattern_elements = {}
+            # The medoid of each element is a phrase element with the modal token set
+            for element, (key, count) in self.modal_rows.items():
+                pattern_elements[element] = self.element_rows[element][key][1]
+
+            self.pattern = Pattern(elements=pattern_elements,
+                                   entities=self.entities,
+                                   label=self.label,
+                                   order=self.order,
+                                   relations=relations,
+                                   confidence=0)
         return
-    
+
+    def pattern_signature(self):
+        """Everything about the centroid pattern that determines which relations get_relations finds
+
+        This is the pattern tokens and, for each entity of the pattern relations, its tag and which entity of that
+        tag it is, since that decides which parse result is used for it.
+        """
+        elements = tuple((element, tuple(data['tokens'])) for element, data in sorted(self.pattern.elements.items()))
+        entity_type_indexes = {}
+        relations = []
+        for relation in self.pattern.relations:
+            entities = []
+            for entity in relation.entities:
+                seen = entity_type_indexes.setdefault(entity.tag, [])
+                if entity not in seen:
+                    seen.append(entity)
+                entities.append((entity.tag, seen.index(entity)))
+            relations.append(tuple(entities))
+        return elements, tuple(self.order), tuple(relations)
+
+    def count_matches(self, phrase):
+        """Count the relations of a phrase that the centroid pattern finds in its sentence
+
+        :param phrase: The phrase to compare with the pattern
+        :type phrase: chemdataextractor.relex.phrase.Phrase
+        """
+        rejected = self.__dict__.get('_rejected')
+        if rejected is not None and phrase is rejected[0] and self.pattern.token_filter.tokens == rejected[1].tokens:
+            # Found to lack the literal tokens of the pattern before it was added
+            stats.count('prefilter_rejects')
+            return 0
+        matches = 0
+        for fr in self.get_relations(phrase.tagged_tokens):
+            if fr in phrase.relations:
+                matches += 1
+        return matches
+
     def update_pattern_confidence(self):
         """Determine the confidence of this centroid pattern
+
+        The number of matches in each phrase is kept, so while the pattern stays the same only phrases added since
+        the last update are compared with it.
         """
-        # print("updating pattern confidence")
-        # print("Old confidence:", self.old_pattern_confidence)
-        total_matches = 0
         total_relations = sum([len(phrase.relations) for phrase in self.phrases])
-        # print("Total relations in cluster: %d" % total_relations)
-        # compare the centroid pattern to all sentences found in the phrases
-        for phrase in self.phrases:
-            # print("Phrase", phrase)
-            sentence = Sentence(phrase.full_sentence)
-            relations = phrase.relations
-            found_relations = self.get_relations(sentence.tagged_tokens)
-            # print("Found relations", found_relations)
-            for fr in found_relations:
-                if fr in relations:
-                    total_matches += 1
-        
+        signature = self.pattern_signature()
+        if signature != self.confidence_signature:
+            # The pattern changed, so compare it to all sentences found in the phrases
+            self.confidence_signature = signature
+            self.phrase_matches = []
+        for phrase in self.phrases[len(self.phrase_matches):]:
+            self.phrase_matches.append(self.count_matches(phrase))
+        total_matches = sum(self.phrase_matches)
+
         new_pattern_confidence = float(total_matches / total_relations)
-        # print("new confidence", new_pattern_confidence)
         # Make sure new cluster begins with confidence 1.0
         if len(self.phrases) == 1:
             self.pattern.confidence = new_pattern_confidence
@@ -199,8 +447,16 @@ class Cluster:
         # print("Getting relations from", ' '.join([t[0] for t in tokens]))
         relations = []
         entity_type_indexes = {}
+        if not self.pattern.token_filter.accepts(lower_tokens(tokens)):
+            # The sentence lacks some of the literal pattern tokens, so it cannot match
+            stats.count('prefilter_rejects')
+            return relations
+        stats.count('pattern_scans')
 
-        for res in self.pattern.parse_expression.scan(tokens):
+        # The token span of every parse result element, so entities are located without tokenizing them again
+        spans = {}
+        words = [t[0] for t in tokens]
+        for res in self.pattern.parse_expression.scan(tokens, spans=spans, materialize=False):
             match = res[0]
             for pattern_relation in self.pattern.relations:
                 found_entities = []
@@ -214,13 +470,20 @@ class Cluster:
                         xpath_str = '/'.join([i for i in pattern_entity.tag.split('__')])
                     else:
                         xpath_str = pattern_entity.tag
-                    entity_matches = match.xpath('./' + xpath_str + '/text()')
+                    entity_matches = [(text, element) for element in match.xpath('./' + xpath_str)
+                                      for text in element.xpath('text()')]
                     if len(entity_matches) > 0:
-                        entity_text = entity_matches[entity_type_indexes[pattern_entity.tag].index(pattern_entity)]
+                        entity_text, element = entity_matches[entity_type_indexes[pattern_entity.tag].index(pattern_entity)]
                     else:
-                        entity_text = entity_matches[0]
-                    entity_tokens = [s[0] for s in Sentence(entity_text).tagged_tokens]
-                    start_idx, end_idx = subfinder([t[0] for t in tokens], entity_tokens)
+                        entity_text, element = entity_matches[0]
+                    start_idx, end_idx = spans[element]
+                    # Like candidate entities, the entity is only the tokens of its text, not those the parse
+                    # expression matched without adding them to the text (such as hidden brackets)
+                    entity_words = entity_text.split(' ')
+                    offset, _ = subfinder(words[start_idx:end_idx], entity_words)
+                    if offset is not None:
+                        start_idx += offset
+                        end_idx = start_idx + len(entity_words)
                     found_entity = Entity(entity_text, pattern_entity.tag, pattern_entity.parse_expression, start_idx, end_idx)
                     found_entities.append(found_entity)
                 found_relation = Relation(found_entities, confidence=0)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+chemdataextractor.relex.corpus
+Extract Snowball relations from a whole corpus of documents, optionally in parallel
+
+"""
+import io
+import logging
+import multiprocessing
+
+import six
+
+from ..doc.document import Document
+from ..doc.text import Text
+from ..errors import ReaderError
+
+log = logging.getLogger(__name__)
+
+# Set in each worker process by _init_worker
+_worker_state = {}
+
+
+def relation_record(relation):
+    """JSON serializable description of a Relation
+
+    Arguments:
+        relation {Relation} -- The relation to describe
+
+    Returns:
+        dict -- The relation confidence and the text, tag and token span of each entity
+    """
+    return {'confidence': relation.confidence,
+            'entities': [{'text': e.text, 'tag': e.tag, 'start': e.start, 'end': e.end} for e in relation.entities]}
+
+
+def read_document(source):
+    """Return the Document for a corpus source, reading it if it is a path"""
+    if isinstance(source, Document):
+        return source
+    with io.open(source, 'rb') as f:
+        return Document.from_file(f, fname=source)
+
+
+def extract_document(snowball, source, index, include_empty=False):
+    """Extract relations from every sentence of a document without learning
+
+    Arguments:
+        snowball {Snowball} -- The model to extract with
+        source {str or Document} -- Path to the document, or the Document itself
+        index {int} -- Position of the document in the corpus
+
+    Keyword Arguments:
+        include_empty {bool} -- Whether to also return sentences where no relation was found (default: {False})
+
+    Returns:
+        list -- One record per sentence, with its provenance and relations
+    """
+    try:
+        document = read_document(source)
+    except ReaderError as e:
+        log.warning('Skipping %s: %s' % (source, e))
+        return []
+    document_id = source if isinstance(source, six.string_types) else index
+    records = []
+    for element_index, element in enumerate(document.elements):
+        if not isinstance(element, Text):
+            continue
+        for sentence_index, sentence in enumerate(element.sentences):
+            relations = snowball.extract(sentence, learn=False) or []
+            if not relations and not include_empty:
+                continue
+            records.append({'document': document_id,
+                            'element': element_index,
+                            'sentence': sentence_index,
+                            'text': sentence.text,
+                            'relations': [relation_record(r) for r in relations]})
+    return records
+
+
+def _init_worker(snowball, sources, include_empty):
+    # With the fork start method these are inherited rather than pickled, so all workers share the loaded model
+    _worker_state['snowball'] = snowball
+    _worker_state['sources'] = sources
+    _worker_state['include_empty'] = include_empty
+
+
+def _extract_source(index):
+    return extract_document(_worker_state['snowball'], _worker_state['sources'][index], index,
+                            include_empty=_worker_state['include_empty'])
+
+
+def extract_corpus(snowball, sources, workers=1, ordered=True, include_empty=False, chunksize=1):
+    """Extract relations from a corpus with a read-only Snowball model
+
+    The model is frozen while extracting, so every document is processed with the same model regardless of the
+    order in which documents are handled, and nothing is learned.
+
+    Arguments:
+        snowball {Snowball} -- The model to extract with
+        sources {list} -- Paths to documents and/or Document objects
+
+    Keyword Arguments:
+        workers {int} -- Number of worker processes, 1 to extract in this process (default: {1})
+        ordered {bool} -- Yield records in corpus order. Otherwise the records of each document are yielded as soon
+                          as it is done (default: {True})
+        include_empty {bool} -- Whether to also yield sentences where no relation was found (default: {False})
+        chunksize {int} -- Number of documents sent to a worker at a time (default: {1})
+
+    Yields:
+        dict -- Sentence records with 'document' (path, or index for Document objects), 'element' and 'sentence'
+                indexes, the sentence 'text' and its 'relations'
+    """
+    sources = list(sources)
+    was_frozen = snowball.frozen
+    snowball.freeze()
+    try:
+        if workers <= 1:
+            for index, source in enumerate(sources):
+                for record in extract_document(snowball, source, index, include_empty=include_empty):
+                    yield record
+            return
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(snowball, sources, include_empty))
+        try:
+            imap = pool.imap if ordered else pool.imap_unordered
+            for records in imap(_extract_source, range(len(sources)), chunksize):
+                for record in records:
+                    yield record
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        if not was_frozen:
+            snowball.unfreeze()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+chemdataextractor.relex.delta
+Knowledge base updates collected during frozen extraction
+
+"""
+
+
+class Delta(object):
+    """Updates that a Snowball model would have learned, to be merged into it later
+
+    Each change uses the same JSON serializable description as the Snowball change journal, so deltas can be
+    returned from worker processes, combined and applied with Snowball.merge().
+    """
+
+    def __init__(self, changes=None):
+        """Create a new Delta
+
+        Keyword Arguments:
+            changes {list} -- Journal style changes to start with (default: {None})
+        """
+        self.changes = list(changes) if changes else []
+
+    def __len__(self):
+        return len(self.changes)
+
+    def __iter__(self):
+        return iter(self.changes)
+
+    def __repr__(self):
+        return '<Delta: %d changes>' % len(self.changes)
+
+    def add(self, change):
+        """Record a change
+
+        Arguments:
+            change {dict} -- JSON serializable description of the change
+        """
+        self.changes.append(change)
+        return
+
+    def extend(self, other):
+        """Append the changes of another Delta, e.g. one collected by a different worker
+
+        Arguments:
+            other {Delta} -- The delta to append
+        """
+        self.changes.extend(other.changes)
+        return
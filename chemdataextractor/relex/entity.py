@@ -3,14 +3,47 @@
 chemdataextractor.relex.pattern.py
 Extraction pattern object
 """
-import copy
 import six
 from ..parse import Group, join
 
+def tagged_expression(parse_expression, tag):
+    """The parse expression that identifies entities with a tag
+
+    Named expressions are used as they are. Unnamed ones are wrapped in a group named like the tag (nested groups
+    for a tuple of tags), which is built once and kept on the expression, so it is shared by all entities of the tag
+    and goes away with the expression.
+
+    Arguments:
+        parse_expression -- how the entity is identified in text
+        tag {str or tuple} -- name of the entity
+    """
+    if parse_expression.name is not None:
+        return parse_expression
+    # tag -> (expression, tagged expression); a shallow copy of the expression shares the dict, so check which one
+    cache = parse_expression.__dict__.get('_tagged_expressions')
+    cached = cache.get(tag) if cache is not None else None
+    if cached is not None and cached[0] is parse_expression:
+        return cached[1]
+    if cached is not None or cache is None:
+        cache = parse_expression._tagged_expressions = {}
+    if isinstance(tag, tuple):
+        tagged = parse_expression
+        for sub_tag in tag:
+            tagged = Group(tagged)(sub_tag)
+    else:
+        tagged = Group(parse_expression)(tag).add_action(join)
+    cache[tag] = (parse_expression, tagged)
+    return tagged
+
+
 class Entity(object):
     """A base entity, the fundamental unit of a Relation
+
+    Entities are immutable. Two entities are equal if they have the same text and token span, so they can be used
+    in sets and as dictionary keys.
     """
 
+    __slots__ = ('text', 'tag', 'parse_expression', 'start', 'end', '_hash')
 
     def __init__(self, text, tag, parse_expression, start ,end):
         """Create a new Entity
@@ -21,30 +54,54 @@ class Entity(object):
             start {int} -- The index of the Entity in tokens
             end {int} -- The end index of the entity in tokens
         """
-        self.text = six.text_type(text)
-        self.tag = tag
-        self.parse_expression = copy.copy(parse_expression)
-        if self.parse_expression.name is None:
-            if isinstance(self.tag, tuple):
-                for sub_tag in self.tag:
-                    self.parse_expression = Group(self.parse_expression)(sub_tag)
-            else:
-                self.parse_expression = Group(self.parse_expression)(self.tag).add_action(join)
-        
-        self.end = end
-        self.start = start
+        text = six.text_type(text)
+        set_slot = object.__setattr__
+        set_slot(self, 'text', text)
+        set_slot(self, 'tag', tag)
+        if parse_expression is not None:
+            parse_expression = tagged_expression(parse_expression, tag)
+        set_slot(self, 'parse_expression', parse_expression)
+        set_slot(self, 'end', end)
+        set_slot(self, 'start', start)
+        set_slot(self, '_hash', hash((text, start, end)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Entity objects are immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('Entity objects are immutable')
+
+    def __reduce__(self):
+        return (type(self), (self.text, self.tag, self.parse_expression, self.start, self.end))
+
+    def __setstate__(self, state):
+        # Entities pickled before they were immutable
+        tag, parse_expression = state['tag'], state.get('parse_expression')
+        if parse_expression is None and not isinstance(tag, (six.string_types, tuple)):
+            # Older entities kept the named parse expression as their tag
+            tag, parse_expression = tag.name, tag
+        self.__init__(state['text'], tag, parse_expression, state['start'], state['end'])
 
     def __eq__(self, other):
-        if self.text == other.text and self.end == other.end and self.start == other.start:
+        if self is other:
             return True
-        else:
-            return False
+        if not isinstance(other, Entity):
+            return NotImplemented
+        return (self._hash == other._hash and self.text == other.text and self.end == other.end and
+                self.start == other.start)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return self._hash
 
     def __repr__(self):
         return '(' + self.text + ',' + self.tag + ',' + str(self.start) + ',' + str(self.end) + ')'
     def __str__(self):
         return self.__repr__()
-    
+
     def serialize(self):
         output = current = {}
         if '__' in self.tag:
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+chemdataextractor.relex.lsh
+Approximate nearest cluster search with MinHash locality sensitive hashing
+
+"""
+import weakref
+from operator import attrgetter
+import zlib
+
+import numpy as np
+
+#: The Mersenne prime 2^31 - 1, small enough that a * x + b never overflows 64 bits
+_PRIME = (1 << 31) - 1
+
+
+class ClusterLSH(object):
+    """Shortlist the clusters whose patterns could be similar to a phrase
+
+    Every phrase element (prefix, middles, suffix) is a set of (element, token) features, the same features that
+    the ClusterMatcher vectors are built from. A MinHash signature of bands * rows hashes estimates the Jaccard
+    similarity of these feature sets, and a cluster is shortlisted for a phrase if all rows of at least one band
+    agree. A cluster whose features have Jaccard similarity s with the phrase is shortlisted with probability
+    1 - (1 - s^rows)^bands, so more bands raise the recall and more rows make the shortlist shorter.
+
+    Hashes are seeded, and features are hashed with CRC32, so shortlists are the same in every process. Like the
+    ClusterMatcher, cached tables are used without checking the cluster patterns once frozen.
+    """
+
+    def __init__(self, bands=16, rows=4, seed=0):
+        """
+        Keyword Arguments:
+            bands {int} -- Number of bands of the signature (default: {16})
+            rows {int} -- Number of hashes in each band (default: {4})
+            seed {int} -- Seed of the hash functions (default: {0})
+        """
+        if bands < 1 or rows < 1:
+            raise ValueError("LSH bands and rows must be at least 1")
+        self.bands = bands
+        self.rows = rows
+        self.seed = seed
+        random_state = np.random.RandomState(seed)
+        self._a = random_state.randint(1, _PRIME, size=bands * rows).astype(np.int64)
+        self._b = random_state.randint(0, _PRIME, size=bands * rows).astype(np.int64)
+        self._keys = weakref.WeakKeyDictionary()  # cluster -> (pattern, band keys)
+        self._tables = {}  # order -> (patterns, band tables, clusters without features)
+        self.frozen = False
+
+    def __getstate__(self):
+        # The hash functions and tables are rebuilt from the settings
+        return {'bands': self.bands, 'rows': self.rows, 'seed': self.seed}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __repr__(self):
+        return '<ClusterLSH: %s bands of %s rows>' % (self.bands, self.rows)
+
+    @staticmethod
+    def features(elements):
+        """The hashed (element, token) features of phrase or pattern elements"""
+        features = set()
+        for element, data in elements.items():
+            for token in data['tokens']:
+                key = ('%s\x00%s' % (element, token)).encode('utf-8')
+                features.add((zlib.crc32(key) & 0xffffffff) % _PRIME)
+        return features
+
+    def band_keys(self, elements):
+        """The band keys of the MinHash signature of some elements, or None if they have no tokens"""
+        features = self.features(elements)
+        if not features:
+            return None
+        x = np.fromiter(features, dtype=np.int64, count=len(features))
+        signature = ((np.outer(self._a, x) + self._b[:, None]) % _PRIME).min(axis=1)
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def _cluster_keys(self, cluster):
+        """The band keys of a cluster pattern, cached until the pattern changes"""
+        cached = self._keys.get(cluster)
+        if cached is not None and cached[0] is cluster.pattern:
+            return cached[1]
+        keys = self.band_keys(cluster.pattern.elements)
+        self._keys[cluster] = (cluster.pattern, keys)
+        return keys
+
+    def table(self, clusters):
+        """Return the band tables for clusters sharing an entity order, rebuilt when one of their patterns changes
+
+        Arguments:
+            clusters {list} -- Clusters that all share the same entity order
+
+        Returns:
+            (dict, list) -- Cluster positions by band key, and the positions of clusters without any tokens
+        """
+        key = tuple(clusters[0].order)
+        cached = self._tables.get(key)
+        if self.frozen and cached is not None:
+            return cached[1], cached[2]
+        patterns = tuple(map(attrgetter('pattern'), clusters))
+        # Patterns compare by identity
+        if cached is not None and cached[0] == patterns:
+            return cached[1], cached[2]
+
+        tables = {}
+        unhashed = []
+        for position, cluster in enumerate(clusters):
+            keys = self._cluster_keys(cluster)
+            if keys is None:
+                unhashed.append(position)
+                continue
+            for band_key in keys:
+                tables.setdefault(band_key, []).append(position)
+        self._tables[key] = (patterns, tables, unhashed)
+        return tables, unhashed
+
+    def shortlist(self, phrases, clusters):
+        """Decide which clusters to score against each phrase
+
+        All phrases and clusters must share the same entity order.
+
+        Arguments:
+            phrases {list} -- Phrase objects
+            clusters {list} -- Cluster objects
+
+        Returns:
+            np.ndarray -- Boolean array of shape (len(phrases), len(clusters)), True for the shortlisted pairs
+        """
+        mask = np.zeros((len(phrases), len(clusters)), dtype=bool)
+        if not phrases or not clusters:
+            return mask
+        tables, unhashed = self.table(clusters)
+        for row, phrase in enumerate(phrases):
+            keys = self.band_keys(phrase.elements)
+            if keys is None:
+                # Nothing to hash, so nothing to rule out
+                mask[row, :] = True
+                continue
+            mask[row, unhashed] = True
+            for band_key in keys:
+                mask[row, tables.get(band_key, [])] = True
+        return mask
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+chemdataextractor.relex.matcher
+Batch similarity scoring of phrases against cluster extraction patterns
+
+"""
+import weakref
+from operator import attrgetter
+
+import numpy as np
+from scipy import sparse
+
+from .stats import stats
+
+
+class ClusterMatcher(object):
+    """Score many phrases against many clusters with a single sparse matrix product
+
+    The similarity computed by relex.utils.match is a weighted sum of cosine similarities between the
+    binary token vectors of each phrase element (prefix, middles, suffix) and the matching element of
+    the cluster centroid pattern. Here every (element, token) pair is a column in a vocabulary shared by all
+    clusters, so each cluster pattern becomes a single normalised sparse row. The rows of clusters that share an
+    entity order are stacked into one matrix, which is only rebuilt when one of their patterns changes. Once frozen,
+    patterns are assumed not to change and cached matrices are used without checking them.
+    """
+
+    def __init__(self):
+        #: (element, token) -> column index, shared by all clusters
+        self.vocabulary = {}
+        self._rows = weakref.WeakKeyDictionary()  # cluster -> (pattern, columns, values)
+        self._buckets = {}  # order -> (patterns, matrix)
+        self.frozen = False
+
+    def __getstate__(self):
+        # Everything here is a cache and is rebuilt on demand
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    @staticmethod
+    def element_weights(elements, prefix_weight, middle_weight, suffix_weight):
+        """The weight of each phrase element in the similarity score"""
+        number_of_middles = len([e for e in elements if e.startswith('middle')])
+        weights = {}
+        for element in elements:
+            if element == 'prefix':
+                weights[element] = prefix_weight
+            elif element == 'suffix':
+                weights[element] = suffix_weight
+            else:
+                weights[element] = middle_weight / number_of_middles
+        return weights
+
+    def _pattern_row(self, cluster):
+        """Return the columns and values of the normalised (unweighted) row for the cluster pattern"""
+        cached = self._rows.get(cluster)
+        if cached is not None and cached[0] is cluster.pattern:
+            return cached[1], cached[2]
+        columns = []
+        values = []
+        for element, data in cluster.pattern.elements.items():
+            tokens = set(data['tokens'])
+            norm = 1.0 / np.sqrt(len(tokens))
+            for token in tokens:
+                key = (element, token)
+                if key not in self.vocabulary:
+                    self.vocabulary[key] = len(self.vocabulary)
+                columns.append(self.vocabulary[key])
+                values.append(norm)
+        self._rows[cluster] = (cluster.pattern, columns, values)
+        return columns, values
+
+    def cluster_matrix(self, clusters):
+        """Return the sparse pattern matrix (clusters x vocabulary) for clusters sharing an entity order
+
+        Arguments:
+            clusters {list} -- Clusters that all share the same entity order
+
+        Returns:
+            scipy.sparse.csr_matrix -- One normalised row per cluster
+        """
+        key = tuple(clusters[0].order)
+        cached = self._buckets.get(key)
+        if self.frozen and cached is not None:
+            return cached[1]
+        patterns = tuple(map(attrgetter('pattern'), clusters))
+        # Patterns compare by identity
+        if cached is not None and cached[0] == patterns:
+            return cached[1]
+        with stats.timer('vectorisation'):
+            matrix = self._cluster_matrix(clusters)
+        self._buckets[key] = (patterns, matrix)
+        return matrix
+
+    def _cluster_matrix(self, clusters):
+        indptr = [0]
+        indices = []
+        data = []
+        for cluster in clusters:
+            columns, values = self._pattern_row(cluster)
+            indices.extend(columns)
+            data.extend(values)
+            indptr.append(len(indices))
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(clusters), len(self.vocabulary)))
+
+    def phrase_entries(self, phrase, weights, n_columns=None):
+        """Return the (column, value) entries of the weighted row of a phrase
+
+        Tokens that are not in the vocabulary (or not in its first n_columns) cannot match any pattern and are left
+        out, but still count towards the normalisation of their element.
+        """
+        entries = []
+        for element, element_data in phrase.elements.items():
+            tokens = set(element_data['tokens'])
+            value = weights[element] / np.sqrt(len(tokens))
+            for token in tokens:
+                column = self.vocabulary.get((element, token))
+                if column is not None and (n_columns is None or column < n_columns):
+                    entries.append((column, value))
+        return entries
+
+    def phrase_matrix(self, phrases, n_columns, prefix_weight, middle_weight, suffix_weight):
+        """Return the weighted sparse matrix (phrases x vocabulary) of the phrase elements"""
+        weights = self.element_weights(phrases[0].elements.keys(), prefix_weight, middle_weight, suffix_weight)
+        indptr = [0]
+        indices = []
+        data = []
+        for phrase in phrases:
+            for column, value in self.phrase_entries(phrase, weights, n_columns):
+                indices.append(column)
+                data.append(value)
+            indptr.append(len(indices))
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(phrases), n_columns))
+
+    def scores(self, phrases, clusters, prefix_weight, middle_weight, suffix_weight, mask=None):
+        """Compute the similarity of every phrase to every cluster
+
+        All phrases and clusters must share the same entity order.
+
+        Arguments:
+            phrases {list} -- Phrase objects
+            clusters {list} -- Cluster objects
+
+        Keyword Arguments:
+            mask {np.ndarray} -- Boolean array of shape (len(phrases), len(clusters)). Only the pairs that are True
+                                 are scored, one by one, and the others score 0 (default: {None})
+
+        Returns:
+            np.ndarray -- Array of shape (len(phrases), len(clusters)), identical to calling relex.utils.match
+                          on each (scored) pair
+        """
+        if not phrases or not clusters:
+            return np.zeros((len(phrases), len(clusters)))
+        if mask is not None:
+            return self.masked_scores(phrases, clusters, prefix_weight, middle_weight, suffix_weight, mask)
+        pattern_matrix = self.cluster_matrix(clusters)
+        with stats.timer('vectorisation'):
+            phrase_matrix = self.phrase_matrix(phrases, pattern_matrix.shape[1], prefix_weight, middle_weight,
+                                               suffix_weight)
+        return (phrase_matrix * pattern_matrix.T).toarray()
+
+    def masked_scores(self, phrases, clusters, prefix_weight, middle_weight, suffix_weight, mask):
+        """Compute the similarity of the phrase and cluster pairs selected by a mask, and 0 for the other pairs
+
+        The products are summed in the same order as in the sparse matrix product, so the scores are the same.
+        """
+        weights = self.element_weights(phrases[0].elements.keys(), prefix_weight, middle_weight, suffix_weight)
+        scores = np.zeros((len(phrases), len(clusters)))
+        for row, phrase in enumerate(phrases):
+            # Pattern rows first, they add their tokens to the vocabulary
+            rows = [(position, self._pattern_row(clusters[position])) for position in np.flatnonzero(mask[row])]
+            entries = self.phrase_entries(phrase, weights)
+            for position, (columns, values) in rows:
+                pattern_values = dict(zip(columns, values))
+                score = 0.0
+                for column, value in entries:
+                    if column in pattern_values:
+                        score += value * pattern_values[column]
+                scores[row, position] = score
+        return scores
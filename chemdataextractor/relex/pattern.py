@@ -12,6 +12,7 @@ Extraction pattern object
 
 import re
 from ..parse.elements import I, W, R, Any, And, Start, OneOrMore, Group
+from .prefilter import TokenFilter
 
 
 class Pattern:
@@ -30,7 +31,41 @@ class Pattern:
         self.order = order
         self.relations = relations
         self.confidence = confidence
-        self.parse_expression = self.generate_cde_parse_expression()
+        self._parse_expression = None
+        self._token_filter = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # The parse expression and token filter are rebuilt from the elements and entities when needed
+        state['_parse_expression'] = None
+        state['_token_filter'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Patterns pickled when the parse expression was built eagerly
+        self.__dict__.pop('parse_expression', None)
+        self._parse_expression = None
+        self._token_filter = None
+
+    @property
+    def parse_expression(self):
+        """The CDE parse expression for this extraction pattern, generated on first use"""
+        if self._parse_expression is None:
+            self._parse_expression = self.generate_cde_parse_expression()
+        return self._parse_expression
+
+    @property
+    def token_filter(self):
+        """TokenFilter for the literal tokens of this pattern, which any sentence it matches must contain in order"""
+        if self._token_filter is None:
+            self._token_filter = TokenFilter(self.literal_tokens())
+        return self._token_filter
+
+    def literal_tokens(self):
+        """The prefix, middle and suffix tokens that the parse expression matches literally, in order"""
+        elements = ['prefix'] + ['middle_' + str(i + 1) for i in range(self.number_of_entities - 1)] + ['suffix']
+        return [token for element in elements for token in self.elements[element]['tokens'] if token != '<Blank>']
 
     def __repr__(self):
         return self.to_string()
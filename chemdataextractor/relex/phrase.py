@@ -6,9 +6,34 @@ Phrase object
 """
 import re
 
+from ..doc.text import Sentence
+from ..nlp.tokenize import BaseTokenizer
+
+#: Shared tag strings, so that stored phrases hold one copy of each tag
+_TAGS = {}
+
+
+class PhraseTokenizer(BaseTokenizer):
+    """Splits the full sentence of a phrase into the phrase tokens, which it is the space separated join of"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    def span_tokenize(self, s):
+        spans = []
+        start = 0
+        for token in self.tokens:
+            spans.append((start, start + len(token)))
+            start += len(token) + 1
+        return spans
+
+
 class Phrase(object):
 
-    def __init__(self, sentence_tokens, relations, prefix_length, suffix_length):
+    __slots__ = ('sentence_tokens', 'full_sentence', 'tags', 'number_of_entities', 'relations', 'elements',
+                 'entities', 'order', 'prefix_length', 'suffix_length')
+
+    def __init__(self, sentence_tokens, relations, prefix_length, suffix_length, tagged_tokens=None):
         """Phrase Object
 
         Class for handling which relations and entities appear in a sentence, the base type used for clustering and generating extraction patterns
@@ -18,12 +43,19 @@ class Phrase(object):
             relations {list} -- List of Relation objects to be tagged in the sentence
             prefix_length {int} -- Number of tokens to assign to the prefix
             suffix_length {int} -- Number of tokens to assign to the suffix
+
+        Keyword Arguments:
+            tagged_tokens {list} -- (token, tag) pairs for the sentence tokens. Only the tags are stored, and they are
+                                    used instead of tagging the sentence again (default: {None})
         """
 
         self.sentence_tokens = sentence_tokens
         self.full_sentence = ' '.join(sentence_tokens)
+        #: Tags of the sentence tokens, None if they have not been computed yet
+        self.tags = None
+        if tagged_tokens is not None:
+            self.set_tags([tag for token, tag in tagged_tokens])
 
-        self.cluster_assignments = set()  # Set of cluster labels, describing which clusters this belongs to
         self.number_of_entities = 0
         self.relations = relations
         self.elements = {}
@@ -34,9 +66,40 @@ class Phrase(object):
         if sentence_tokens and relations:
             self.create()
 
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        # Phrases pickled before they were slotted may not have tags
+        self.tags = None
+        for name, value in state.items():
+            if name in self.__slots__:
+                setattr(self, name, value)
+
     def __repr__(self):
         return self.to_string()
 
+    @property
+    def tagged_tokens(self):
+        """The (token, tag) pairs of the sentence, tagging it on first use if no tags were given
+
+        The phrase tokens themselves are tagged, so the tags always line up with them even where the sentence
+        tokenizer would split the sentence differently.
+        """
+        if self.tags is None:
+            sentence = Sentence(self.full_sentence, word_tokenizer=PhraseTokenizer(self.sentence_tokens))
+            self.set_tags([tag for token, tag in sentence.tagged_tokens])
+        return list(zip(self.sentence_tokens, self.tags))
+
+    def set_tags(self, tags):
+        """Store the tags of the sentence tokens
+
+        Arguments:
+            tags {list} -- One tag per sentence token
+        """
+        self.tags = tuple(_TAGS.setdefault(tag, tag) for tag in tags)
+        return
+
     def to_string(self):
         output_string = ''
         output_string += ' '.join(self.elements['prefix']['tokens']) + ' '
@@ -56,13 +119,15 @@ class Phrase(object):
         # print("Creating phrase")
 
         combined_entity_list = []
+        seen = set()
         for relation in relations:
             # print(relation)
             for entity in relation:
                 # print(entity)
-                if entity in combined_entity_list:
+                if entity in seen:
                     continue
                 else:
+                    seen.add(entity)
                     if entity.tag not in entity_counter.keys():
                         entity_counter[entity.tag] = 1
                     else:
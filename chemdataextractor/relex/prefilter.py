@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+chemdataextractor.relex.prefilter
+Reject sentences that cannot match an extraction pattern before scanning them with its parse expression
+
+"""
+from .utils import is_subsequence
+
+
+def lower_tokens(tokens):
+    """Lowercase token texts, from plain or (token, tag) tokens"""
+    return [(t[0] if isinstance(t, tuple) else t).lower() for t in tokens]
+
+
+class TokenFilter(object):
+    """The literal tokens a pattern requires, in order
+
+    A pattern parse expression is a sequence of case-insensitive literal tokens around the entity expressions, so a
+    sentence can only match if it contains every literal token, in the same relative order.
+    """
+
+    def __init__(self, tokens):
+        """
+        Arguments:
+            tokens {list} -- The literal tokens of the pattern, in order
+        """
+        self.tokens = tuple(t.lower() for t in tokens)
+        self.required = frozenset(self.tokens)
+
+    def __repr__(self):
+        return '<TokenFilter: %s>' % ' '.join(self.tokens)
+
+    def accepts(self, lowered, token_set=None):
+        """Whether a sentence could match the pattern
+
+        Arguments:
+            lowered {list} -- The lowercase sentence tokens
+
+        Keyword Arguments:
+            token_set {set} -- The set of lowercase sentence tokens, if already known (default: {None})
+        """
+        if token_set is None:
+            token_set = set(lowered)
+        if not self.required <= token_set:
+            return False
+        return is_subsequence(self.tokens, lowered)
+
+
+
+class PrefilterIndex(object):
+    """Find the patterns that a sentence could match, among many
+
+    Each filter is indexed under one of its required tokens, so a sentence only has to look up its own tokens. Filters
+    without literal tokens accept every sentence.
+    """
+
+    def __init__(self):
+        self.postings = {}  # token -> [(key, filter)]
+        self.unfiltered = []  # keys of filters without literal tokens
+        self.order = {}  # key -> insertion order
+        self.filters = {}  # key -> filter
+        self.added = 0  # number of keys ever added, which orders the next one
+
+    def __len__(self):
+        return len(self.order)
+
+    @staticmethod
+    def posting_token(token_filter):
+        """The required token a filter is indexed under, the longest one, which is usually the least common"""
+        return max(sorted(token_filter.required), key=len)
+
+    def add(self, key, token_filter):
+        """Index a filter, replacing the filter of key if it has one, which keeps its place in the order
+
+        Arguments:
+            key -- What to return for sentences the filter accepts, such as a cluster
+            token_filter {TokenFilter} -- The filter
+        """
+        if key in self.order:
+            self.discard(key, keep_order=True)
+        else:
+            self.order[key] = self.added
+            self.added += 1
+        self.filters[key] = token_filter
+        if not token_filter.required:
+            self.unfiltered.append(key)
+            return
+        self.postings.setdefault(self.posting_token(token_filter), []).append((key, token_filter))
+        return
+
+    def discard(self, key, keep_order=False):
+        """Remove the filter of key from the index, if it has one
+
+        Arguments:
+            key -- The key the filter was added with
+
+        Keyword Arguments:
+            keep_order {bool} -- Keep the place of key in the order, for a filter that replaces it (default: {False})
+        """
+        token_filter = self.filters.pop(key, None)
+        if token_filter is None:
+            return
+        if not keep_order:
+            del self.order[key]
+        if not token_filter.required:
+            self.unfiltered.remove(key)
+            return
+        token = self.posting_token(token_filter)
+        postings = [posting for posting in self.postings[token] if posting[0] is not key]
+        if postings:
+            self.postings[token] = postings
+        else:
+            del self.postings[token]
+        return
+
+    def candidates(self, tokens):
+        """The keys of the filters that accept a sentence, in the order they were added
+
+        Arguments:
+            tokens {list} -- The sentence tokens, plain or (token, tag)
+
+        Returns:
+            list -- The accepted keys
+        """
+        lowered = lower_tokens(tokens)
+        token_set = set(lowered)
+        accepted = list(self.unfiltered)
+        for token in token_set:
+            for key, token_filter in self.postings.get(token, ()):
+                if token_filter.accepts(lowered, token_set):
+                    accepted.append(key)
+        return sorted(accepted, key=self.order.__getitem__)
@@ -5,10 +5,12 @@ Chemdataextractor.relex.relationship
 Classes for defining new chemical relationships
 """
 import copy
+from collections import OrderedDict
 from itertools import product
 
 from .entity import Entity
-from .utils import KnuthMorrisPratt
+from .stats import stats
+from .utils import locate_sequences
 
 
 class ChemicalRelationship(object):
@@ -54,10 +56,16 @@ class ChemicalRelationship(object):
         Returns
             relations {list} -- list of relations found in the text
         """
+        with stats.timer('candidate_generation'):
+            candidate_relationships = self._get_candidates(tokens)
+        stats.observe('candidates_per_sentence', len(candidate_relationships))
+        return candidate_relationships
+
+    def _get_candidates(self, tokens):
         candidate_relationships = []
         # Scan the tagged tokens with the parser
         detected = []
-        for result in self.parser.scan(tokens):
+        for result in self.parser.scan(tokens, materialize=False):
             for e in self.entities:
                 text_list = result[0].xpath('./' + e.name + '/text()')
                 for i, text in enumerate(text_list):
@@ -65,28 +73,31 @@ class ChemicalRelationship(object):
                         continue
                     detected.append((text, e.name, e))
 
-        entities_dict = {}
-
         if not detected:
             return []
 
-        detected = list(set(detected))  # Remove duplicate entries (handled by indexing)
+        # Remove duplicate entries (handled by indexing), keeping the order in which they were found
+        detected = list(OrderedDict.fromkeys(detected))
+        # Locate every occurrence of every detected entity in one pass over the tokens
+        toks = [tok[0] for tok in tokens]
+        occurrences = locate_sequences(toks, [tuple(text.split(' ')) for text, tag, p in detected])
+
+        entities_dict = {}
+        seen = set()
         for text, tag, p in detected:
             text_length = len(text.split(' '))
-            toks = [tok[0] for tok in tokens]
-            start_indices = [s for s in KnuthMorrisPratt(toks, text.split(' '))]
-
             # Add specifier to dictionary  if it doesn't exist
             if tag not in entities_dict.keys():
                 entities_dict[tag] = []
-            entities = [Entity(text, tag, p, index, index + text_length) for index in start_indices]
             # Add entities to dictionary if new
-            for entity in entities:
-                if entity not in entities_dict[tag]:
-                    entities_dict[tag].append(entity)
+            for index in occurrences[tuple(text.split(' '))]:
+                key = (tag, text, index, index + text_length)
+                if key not in seen:
+                    seen.add(key)
+                    entities_dict[tag].append(Entity(text, tag, p, index, index + text_length))
 
         # check all required entities are present
-        if not all(e.tag in entities_dict.keys() for e in self.entities):
+        if not all(e.name in entities_dict.keys() for e in self.entities):
             return []
 
         # Construct all valid combinations of entities
@@ -115,11 +126,13 @@ class ChemicalRelationship(object):
         del_indices = []
 
         for rel in candidate_rels:
-            for entity_name in self.rule_values:  # Loop through entity names and create new attribute for each
-                setattr(self, str(entity_name), next(filter(lambda x: x.tag == entity_name, rel)))
+            # Find the entity for each name (kept local so that extraction does not modify the relationship)
+            named = {}
+            for entity_name in self.rule_values:
+                named[entity_name] = next(filter(lambda x: x.tag == entity_name, rel))
             conditions = []
             for j in range(n_rules - 1):
-                conditions.append(getattr(self, str(self.rule_values[j])).start < getattr(self, str(self.rule_values[j + 1])).start)
+                conditions.append(named[self.rule_values[j]].start < named[self.rule_values[j + 1]].start)
             if all(conditions):
                 del_indices.append(True)
             else:
@@ -132,9 +145,14 @@ class ChemicalRelationship(object):
 class Relation(object):
     """Relation class
 
-    Essentially a placeholder for a number of entities
+    Essentially a placeholder for a number of entities. Relations are immutable; use with_confidence to change the
+    confidence. A relation equals another if the texts of its entities are among those of the other. Since that
+    makes relations with different texts equal to a common one, they all have the same hash, so sets and dictionary
+    keys of relations work but compare them one by one.
     """
 
+    __slots__ = ('entities', 'confidence', '_texts')
+
     def __init__(self, entities, confidence):
         """Init
 
@@ -142,9 +160,29 @@ class Relation(object):
             entities {list} -- List of Entity objects that are present in this relationship
             confidence {float} -- The confidence of the relation
         """
+        entities = tuple(entities)
+        texts = frozenset(entity.text for entity in entities)
+        set_slot = object.__setattr__
+        set_slot(self, 'entities', entities)
+        set_slot(self, 'confidence', confidence)
+        set_slot(self, '_texts', texts)
 
-        self.entities = copy.copy(entities)
-        self.confidence = confidence
+    def __setattr__(self, name, value):
+        raise AttributeError('Relation objects are immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('Relation objects are immutable')
+
+    def __reduce__(self):
+        return (type(self), (self.entities, self.confidence))
+
+    def __setstate__(self, state):
+        # Relations pickled before they were immutable
+        self.__init__(state['entities'], state['confidence'])
+
+    def with_confidence(self, confidence):
+        """A copy of this relation with another confidence"""
+        return type(self)(self.entities, confidence)
 
     def __len__(self):
         return len(self.entities)
@@ -152,19 +190,26 @@ class Relation(object):
     def __getitem__(self, idx):
         return self.entities[idx]
 
-    def __setitem__(self, idx, value):
-        self.entities[idx] = value
+    def __iter__(self):
+        return iter(self.entities)
 
     def __repr__(self):
         return '<' + ', '.join([str(i) for i in self.entities]) + '>'
 
     def __eq__(self, other):
         # compare the text of all entities
-        other_entities = other.entities
-        for entity in self.entities:
-            if not entity.text in [i.text for i in other_entities]:
-                return False
-        return True
+        if self is other:
+            return True
+        if not isinstance(other, Relation):
+            return NotImplemented
+        return self._texts <= other._texts
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash(Relation)
 
     def __str__(self):
         return self.__repr__()
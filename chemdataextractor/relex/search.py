@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+chemdataextractor.relex.search
+Branch and bound search for the best combination of candidate relations in a sentence
+
+"""
+import numpy as np
+
+from .phrase import Phrase
+from .stats import stats
+from .utils import is_subsequence
+
+#: Slack for rounding errors when comparing confidences with their upper bounds
+TOLERANCE = 1e-9
+
+
+class CombinationSearch(object):
+    """Find the combination of candidate relations whose phrase has the highest confidence
+
+    Combinations are explored depth first in the same lexicographic order as itertools.combinations. Adding
+    relations to a combination can only insert entities into its entity order, so a combination can only be extended
+    into phrases whose order has its own order as a subsequence. While no match score can be above 1, which holds
+    when the prefix, middle and suffix weights add up to at most 1, the confidence of any phrase is at most
+    1 - prod(1 - c) over the confidences c of the clusters sharing its order, so a branch is pruned when no reachable
+    order can beat the best phrase found so far. With larger weights every combination is scored.
+
+    Ties are broken as if all combinations were scored smallest first, in lexicographic order, so an exhaustive
+    search gives exactly the same phrase as scoring every combination.
+    """
+
+    def __init__(self, snowball, sentence_tokens, candidate_relations, tagged_tokens=None, max_size=None,
+                 max_nodes=None):
+        """Set up a search
+
+        Arguments:
+            snowball {Snowball} -- The model whose clusters are used to score phrases
+            sentence_tokens {list} -- The tokens of the sentence
+            candidate_relations {list} -- The candidate Relations found in the sentence
+
+        Keyword Arguments:
+            tagged_tokens {list} -- The tagged sentence tokens, stored on the candidate phrases (default: {None})
+            max_size {int} -- The largest number of relations in a combination (default: {all candidates})
+            max_nodes {int} -- The largest number of combinations to score (default: {no limit})
+        """
+        self.snowball = snowball
+        self.sentence_tokens = sentence_tokens
+        self.candidate_relations = candidate_relations
+        self.tagged_tokens = tagged_tokens
+        self.max_size = len(candidate_relations) if max_size is None else max_size
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.best_phrase = None
+        self.best_score = 0
+        self.best_cluster = None
+        self.best_combination = None
+        self.order_bounds = {}
+        self.bounds = {}
+        weights = (snowball.prefix_weight, snowball.middle_weight, snowball.suffix_weight)
+        # The highest possible match score, since every element similarity is at most 1
+        self.bounded = sum(max(weight, 0) for weight in weights) <= 1.0 + TOLERANCE
+        for order, clusters in snowball.order_index.items():
+            if clusters:
+                self.order_bounds[order] = 1.0 - np.prod([1.0 - c.pattern.confidence for c in clusters])
+
+    def upper_bound(self, order):
+        """The highest confidence of any phrase whose order contains the given order, infinite if unknown"""
+        if not self.bounded:
+            return float('inf')
+        order = tuple(order)
+        if order not in self.bounds:
+            bound = 0.0
+            for other, other_bound in self.order_bounds.items():
+                if other_bound > bound and len(other) >= len(order) and is_subsequence(order, other):
+                    bound = other_bound
+            self.bounds[order] = bound
+        return self.bounds[order]
+
+    def better(self, score, combination):
+        """Whether a phrase beats the best one, preferring fewer relations and then lexicographic order on ties"""
+        if score > self.best_score:
+            return True
+        if self.best_combination is None or score < self.best_score:
+            return False
+        if len(combination) != len(self.best_combination):
+            return len(combination) < len(self.best_combination)
+        return combination < self.best_combination
+
+    def can_improve(self, combination, bound):
+        """Whether any extension of the combination could beat the best phrase"""
+        if bound + TOLERANCE < self.best_score:
+            return False
+        if self.best_combination is None:
+            return bound > 0
+        if bound - TOLERANCE > self.best_score:
+            return True
+        # At best a tie, which only the smallest, lexicographically first combination wins
+        size = len(combination) + 1
+        best = self.best_combination
+        if size != len(best):
+            return size < len(best)
+        return combination <= best[:len(combination)]
+
+    def run(self):
+        """Run the search
+
+        Returns:
+            tuple -- The best Phrase, its confidence and its best matching cluster. The phrase is None if no
+                     combination has a positive confidence.
+        """
+        with stats.timer('combination_enumeration'):
+            if self.max_size > 0:
+                self.expand(())
+        stats.observe('combinations_per_sentence', self.nodes)
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            stats.count('combination_limit_reached')
+        return self.best_phrase, self.best_score, self.best_cluster
+
+    def expand(self, combination):
+        """Score the extensions of a combination by one more relation, and search below the promising ones"""
+        start = combination[-1] + 1 if combination else 0
+        children = []
+        for i in range(start, len(self.candidate_relations)):
+            if self.max_nodes is not None and self.nodes >= self.max_nodes:
+                break
+            self.nodes += 1
+            child = combination + (i,)
+            relations = [self.candidate_relations[j] for j in child]
+            with stats.timer('vectorisation'):
+                phrase = Phrase(self.sentence_tokens, relations, self.snowball.prefix_length,
+                                self.snowball.suffix_length, tagged_tokens=self.tagged_tokens)
+            children.append((child, phrase))
+        scores = self.snowball.score_phrases([phrase for child, phrase in children])
+        for (child, phrase), (score, cluster) in zip(children, scores):
+            if self.better(score, child):
+                self.best_phrase = phrase
+                self.best_score = score
+                self.best_cluster = cluster
+                self.best_combination = child
+        for child, phrase in children:
+            if len(child) >= self.max_size:
+                continue
+            if self.max_nodes is not None and self.nodes >= self.max_nodes:
+                return
+            if self.can_improve(child, self.upper_bound(phrase.order)):
+                self.expand(child)
+        return
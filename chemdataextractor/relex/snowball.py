@@ -4,26 +4,40 @@ Chemdataextractor.relex.snowball
 
 The Snowball Relationship Extraction algorithm
 """
-import copy
 import io
+import json
 import os
 import pickle
+import time
 from collections import OrderedDict
-from itertools import combinations
 
 import numpy as np
 import six
 
 from ..doc.document import Document, Paragraph
 from ..doc.text import Sentence
-from ..model import Compound
+from ..model import Compound, ListType, ModelList, ModelType
 from ..parse import Any, I, OneOrMore, Optional, R, W, ZeroOrMore, join, merge
 from ..parse.cem import chemical_name
+from .annotations import annotation_record, train_annotations
 from .cluster import Cluster
+from .corpus import extract_corpus
 from .entity import Entity
+from .lsh import ClusterLSH
+from .matcher import ClusterMatcher
 from .phrase import Phrase
+from .prefilter import PrefilterIndex
 from .relationship import Relation
-from .utils import match, vectorise
+from .search import CombinationSearch
+from .stats import histogram_dict, stats
+from .store import is_model_file, load_model, save_model
+from .training import train_sharded
+
+try:
+    replace_file = os.replace
+except AttributeError:
+    # Python 2, where rename replaces the file atomically on POSIX
+    replace_file = os.rename
 
 
 class Snowball(object):
@@ -45,6 +59,49 @@ class Snowball(object):
         prefix_length: Number of tokens to use in the phrase prefix
         suffix_length: number of tokens to use in phrase suffix
         learning_rate: How fast new confidences update based on new data (1 means new confidence is always taken, 0 means no update, )
+        max_candidate_combinations: The largest number of combinations of candidate relations scored per sentence
+        checkpoint_every: Write a full checkpoint after this many knowledge base updates (None to disable)
+        checkpoint_interval: Write a full checkpoint once this many seconds have passed since the last one (None to disable)
+        max_phrases_per_cluster: Keep a random sample of at most this many phrases in each cluster (None to keep all)
+        max_clusters: The largest number of clusters. When a new cluster goes over the limit, the other cluster that
+                      the fewest phrases matched is merged into its most similar cluster, or evicted if none matches
+                      (None for no limit)
+        lsh_bands: Only score phrases against the clusters shortlisted by a MinHash index with this many bands (see
+                   relex.lsh). More bands find more of the matching clusters (None for exact scoring of all clusters)
+        lsh_rows: Number of hashes per LSH band. More rows make the shortlist shorter, and scoring faster
+        cluster_class: The Cluster subclass used for new clusters
+
+    ::checkpoints:
+        Every update to the knowledge base is appended to a change journal (save_dir/<name>.journal) that is replayed by
+        Snowball.load, and the full model is only pickled according to the checkpoint policy, or explicitly with
+        save() / flush(). Journal entries are numbered and checkpoints record the last entry they contain, so entries
+        left in the journal by an interrupted save are not applied twice. Use the Snowball as a context manager to defer checkpoints until the end of a batch:
+        ```with snowball: snowball.extract(...)```
+        Set journaling to False for throwaway models that should never write to save_dir.
+        The human readable cluster, pattern and relation reports are written on demand with export_reports().
+        save_model() writes a compact, versioned model file (see relex.store) that loads quickly for inference:
+        ```snowball = Snowball.load('model.snowball', relationship=my_relationship)```
+
+    ::inference:
+        freeze() makes the model read-only, so it can be shared by threads or inherited by forked worker processes.
+        extract() then never updates the clusters; pass a Delta to collect the updates it would have made, and apply
+        them afterwards with merge(). Use extract(s, learn=False) for a single side-effect free extraction.
+        extract_corpus() runs frozen extraction over many documents, optionally in a process pool.
+        To add the relations to the Compound records of documents, in the field named like the relationship:
+        ```Document.from_file(f, snowballs=[snowball])``` or ```Document(*elements, snowballs=[snowball])```
+
+    ::stats:
+        Timers, counters and histograms of candidate generation, combination search, matching, pattern and
+        confidence updates and saves are recorded in relex.stats.stats, which is shared by the models in a process.
+        stats_report() adds the size and parameters of this model, to help tune tsim, tc and
+        max_candidate_combinations:
+        ```print(json.dumps(snowball.stats_report(), indent=2))```
+
+    ::sharded training:
+        train_sharded() trains independent copies of the model on shards of annotated sentences, in parallel, and
+        merges them back with merge_model(). Clusters of the shard models are merged into the most similar cluster
+        with the same entity order if their patterns match with at least tsim, so the result only depends on the
+        shards and their order.
     """
 
     def __init__(self, relationship,
@@ -57,16 +114,41 @@ class Snowball(object):
                  suffix_length=1,
                  learning_rate=0.5,
                  max_candidate_combinations=400,
-                 save_dir='chemdataextractor/relex/data/'):
+                 save_dir='chemdataextractor/relex/data/',
+                 checkpoint_every=100,
+                 checkpoint_interval=None,
+                 max_phrases_per_cluster=None,
+                 max_clusters=None,
+                 lsh_bands=None,
+                 lsh_rows=4,
+                 cluster_class=Cluster):
         self.relationship = relationship
+        self.cluster_class = cluster_class
         self.relations = []
         self.phrases = []
         self.clusters = []
+        self.order_index = {}  # entity order -> clusters sharing that order
+        self.matcher = ClusterMatcher()
         self.cluster_counter = 0
         self.sentences = []
         self.max_candidate_combinations = max_candidate_combinations
         self.save_dir = save_dir
         self.save_file_name = relationship.name
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        self.updates_since_checkpoint = 0
+        self.last_checkpoint_time = time.time()
+        self.journal_seq = 0  # number of the last journaled change
+        self._replaying = False
+        self._checkpoint_depth = 0
+        self.frozen = False
+        self.journaling = True
+        self.max_phrases_per_cluster = max_phrases_per_cluster
+        self.max_clusters = max_clusters
+        self.clusters_evicted = 0
+        self.clusters_merged = 0
+        self._pattern_index = None
+        self.set_lsh(lsh_bands, lsh_rows)
 
         # params
         if not 0 <= tc <= 1.0:
@@ -97,45 +179,648 @@ class Snowball(object):
         self.learning_rate = learning_rate
 
     @classmethod
-    def load(cls, path):
+    def load(cls, path, relationship=None, mmap=True, cluster_class=None):
         """Load a snowball instance from file
 
+        A pickled model replays the journal with the same name in the same directory, and save_dir and
+        save_file_name are set so that its later checkpoints and journal are written there too.
+
         Arguments:
-            path {str} -- path to the pkl file
+            path {str} -- path to the pkl file, or to a compact model file written by save_model()
+
+        Keyword Arguments:
+            relationship {ChemicalRelationship} -- The relationship the model was trained for, required for compact
+                                                   model files (default: {None})
+            mmap {bool} -- Memory map compact model files instead of reading them into memory (default: {True})
+            cluster_class {type} -- The Cluster subclass of a compact model file, pickled models keep their own
+                                    (default: {None, the default of this class})
 
         Returns:
             self -- A Snowball Instance
         """
+        if is_model_file(path):
+            if relationship is None:
+                raise ValueError("A relationship is needed to load the compact model file %s" % path)
+            # Model files are snapshots, the change journal belongs to the pickled checkpoints
+            return load_model(cls, path, relationship, use_mmap=mmap, cluster_class=cluster_class)
+        with open(path, 'rb') as f:
+            snowball = pickle.load(f)
+        # The checkpoints and journal of the model are kept next to the file it was loaded from
+        directory, name = os.path.split(os.path.splitext(path)[0])
+        snowball.save_dir = os.path.join(directory or os.curdir, '')
+        snowball.save_file_name = name
+        if os.path.exists(snowball.journal_path):
+            snowball.replay_journal(snowball.journal_path)
+        return snowball
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Transient checkpointing state
+        state.pop('_replaying', None)
+        state.pop('_checkpoint_depth', None)
+        state.pop('_pattern_index', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._replaying = False
+        self._checkpoint_depth = 0
+        self._pattern_index = None
+        # Instances pickled before the order index existed
+        if 'order_index' not in state:
+            self.rebuild_order_index()
+        if 'matcher' not in state:
+            self.matcher = ClusterMatcher()
+        if 'journaling' not in state:
+            self.journaling = True
+        if 'lsh' not in state:
+            self.lsh_bands = None
+            self.lsh_rows = 4
+            self.lsh = None
+        if 'max_clusters' not in state:
+            self.max_phrases_per_cluster = None
+            self.max_clusters = None
+            self.clusters_evicted = 0
+            self.clusters_merged = 0
+        if 'checkpoint_every' not in state:
+            self.checkpoint_every = 100
+            self.checkpoint_interval = None
+            self.updates_since_checkpoint = 0
+            self.last_checkpoint_time = time.time()
+        if 'journal_seq' not in state:
+            self.journal_seq = 0
+        if 'cluster_class' not in state:
+            self.cluster_class = Cluster
+        if self.__dict__.get('frozen'):
+            # The matcher caches are not pickled
+            self.freeze()
+        else:
+            self.frozen = False
+
+    def __enter__(self):
+        """Defer checkpoints until the end of the with block"""
+        self._checkpoint_depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._checkpoint_depth -= 1
+        if self._checkpoint_depth == 0:
+            self.flush()
+        return False
+
+    def freeze(self):
+        """Make the model read-only for inference
+
+        All lazily built state used by extract (the pattern matrices of the cluster matcher, the LSH tables and the
+        streamlined candidate parser) is built now, so that extraction no longer modifies anything.
+
+        Returns:
+            self -- This Snowball
+        """
+        if not self.relationship.parser.streamlined:
+            self.relationship.parser.streamline()
+        for order, clusters in self.order_index.items():
+            if clusters:
+                self.matcher.cluster_matrix(clusters)
+                if self.lsh is not None:
+                    self.lsh.table(clusters)
+        self.pattern_index()
+        self.matcher.frozen = True
+        if self.lsh is not None:
+            self.lsh.frozen = True
+        self.frozen = True
+        return self
+
+    def unfreeze(self):
+        """Allow the model to learn again"""
+        self.matcher.frozen = False
+        if self.lsh is not None:
+            self.lsh.frozen = False
+        self.frozen = False
+        return self
+
+    def rebuild_order_index(self):
+        """Rebuild the mapping from entity order to clusters from scratch"""
+        self.order_index = {}
+        for cluster in self.clusters:
+            self.order_index.setdefault(tuple(cluster.order), []).append(cluster)
+        return
+
+    def clusters_with_order(self, order):
+        """Return the clusters whose phrases share the given entity order
+
+        Arguments:
+            order {list} -- The ordering of entity tags
+
+        Returns:
+            list -- The matching clusters, empty if there are none
+        """
+        return self.order_index.get(tuple(order), [])
+
+    def new_cluster(self, label):
+        """Create an empty cluster with this Snowball's learning rate and phrase limit"""
+        return self.cluster_class(label, learning_rate=self.learning_rate, max_phrases=self.max_phrases_per_cluster)
+
+    def pattern_index(self):
+        """A PrefilterIndex of the token filters of all cluster patterns, updated for the patterns that changed"""
+        if self._pattern_index is None:
+            self._pattern_index = (PrefilterIndex(), {})
+        index, patterns = self._pattern_index
+        for cluster in self.clusters:
+            if patterns.get(cluster) is not cluster.pattern:
+                index.add(cluster, cluster.pattern.token_filter)
+                patterns[cluster] = cluster.pattern
+        if len(patterns) != len(self.clusters):
+            clusters = set(self.clusters)
+            for cluster in [c for c in patterns if c not in clusters]:
+                index.discard(cluster)
+                del patterns[cluster]
+        return index
+
+    def clusters_matching(self, tokens):
+        """The clusters whose extraction patterns could match a sentence, by their literal tokens alone
+
+        Arguments:
+            tokens {list} -- The sentence tokens, plain or (token, tag)
+
+        Returns:
+            list -- The clusters, in order; the others cannot find any relations in the sentence
+        """
+        return self.pattern_index().candidates(tokens)
+
+    def add_cluster(self, cluster):
+        """Add a (non-empty) cluster to the knowledge base and the order index
+
+        If this takes the number of clusters over max_clusters, another cluster is merged or evicted.
+
+        Arguments:
+            cluster {Cluster} -- The cluster to add
+        """
+        self.clusters.append(cluster)
+        self.order_index.setdefault(tuple(cluster.order), []).append(cluster)
+        if self.max_clusters is not None and len(self.clusters) > self.max_clusters:
+            self.evict_cluster(keep=cluster)
+        return
+
+    def evict_cluster(self, keep=None):
+        """Remove the least used cluster, merging it into its most similar cluster if they match
+
+        The cluster that the fewest phrases matched, and then the lowest pattern confidence, is chosen. It is merged
+        into the cluster with the same entity order whose pattern it matches best, if the match is at least tsim, and is
+        dropped otherwise.
+
+        Keyword Arguments:
+            keep {Cluster} -- A cluster that must not be removed, such as one that was just added (default: {None})
+
+        Returns:
+            Cluster -- The cluster it was merged into, or None if it was dropped
+        """
+        candidates = [(cluster.matched_phrases, cluster.pattern.confidence, i)
+                      for i, cluster in enumerate(self.clusters) if cluster is not keep]
+        if not candidates:
+            return None
+        idx = min(candidates)[2]
+        victim = self.clusters[idx]
+        self.delete_cluster(idx)
+        target = self.most_similar_cluster(victim)
+        if target is None:
+            self.clusters_evicted += 1
+        else:
+            target.merge(victim)
+            self.clusters_merged += 1
+        return target
+
+    def store_stats(self):
+        """Counters describing the size of the knowledge base and what was left out to bound it
+
+        Returns:
+            dict -- Numbers of clusters, kept phrases, phrases added to clusters, phrases dropped by reservoir sampling,
+                    and clusters evicted or merged because of max_clusters
+        """
+        return {'clusters': len(self.clusters),
+                'phrases': sum(len(c.phrases) for c in self.clusters),
+                'phrases_seen': sum(c.phrases_seen for c in self.clusters),
+                'phrases_dropped': sum(c.phrases_dropped for c in self.clusters),
+                'clusters_evicted': self.clusters_evicted,
+                'clusters_merged': self.clusters_merged}
+
+    def stats_report(self):
+        """The stats recorded in this process (see relex.stats), with the size and parameters of this model
+
+        Returns:
+            dict -- JSON serializable timers, counters and histograms, including the number of clusters sharing each
+                    entity order and the number of phrases in each cluster, and the model store_stats and parameters
+        """
+        report = stats.as_dict()
+        clusters_per_order = {}
+        for clusters in self.order_index.values():
+            if clusters:
+                clusters_per_order[len(clusters)] = clusters_per_order.get(len(clusters), 0) + 1
+        phrases_per_cluster = {}
+        for cluster in self.clusters:
+            phrases_per_cluster[len(cluster.phrases)] = phrases_per_cluster.get(len(cluster.phrases), 0) + 1
+        report['histograms']['clusters_per_order'] = histogram_dict(clusters_per_order)
+        report['histograms']['phrases_per_cluster'] = histogram_dict(phrases_per_cluster)
+        model = OrderedDict(sorted(self.store_stats().items()))
+        model['orders'] = len(clusters_per_order)
+        model['tc'] = self.minimum_relation_confidence
+        model['tsim'] = self.minimum_cluster_similarity_score
+        model['max_candidate_combinations'] = self.max_candidate_combinations
+        model['lsh_bands'] = self.lsh_bands
+        report['model'] = model
+        return report
 
-        f = open(path, 'rb')
-        return pickle.load(f)
-    
     def set_learning_rate(self, alpha):
         self.learning_rate =  alpha
         for cluster in self.clusters:
             cluster.learning_rate = alpha
         return
 
-    def update(self, sentence_tokens, relations=[]):
+    def set_lsh(self, bands=16, rows=4):
+        """Shortlist the clusters to score with a MinHash index, or score all of them exactly
+
+        Keyword Arguments:
+            bands {int} -- Number of LSH bands, None for exact scoring (default: {16})
+            rows {int} -- Number of hashes per band (default: {4})
+        """
+        self.lsh_bands = bands
+        self.lsh_rows = rows
+        self.lsh = ClusterLSH(bands, rows) if bands is not None else None
+        if self.frozen:
+            # Build the tables now, extraction must not modify the model
+            self.freeze()
+        return
+
+    def match_scores(self, phrases, clusters):
+        """The similarity of phrases to clusters with the same entity order
+
+        With LSH, pairs that are not shortlisted score 0.
+
+        Arguments:
+            phrases {list} -- Phrase objects
+            clusters {list} -- Cluster objects
+
+        Returns:
+            np.ndarray -- Array of shape (len(phrases), len(clusters))
+        """
+        with stats.timer('matching'):
+            mask = self.lsh.shortlist(phrases, clusters) if self.lsh is not None else None
+            scores = self.matcher.scores(phrases, clusters, self.prefix_weight, self.middle_weight,
+                                         self.suffix_weight, mask=mask)
+        stats.count('pairs_scored', len(phrases) * len(clusters) if mask is None else int(mask.sum()))
+        return scores
+
+    def update(self, sentence_tokens, relations=[], tagged_tokens=None):
         """Update the learned extraction pattern clusters based on the incoming sentence and relation
 
         Arguments:
             sentence_tokens {list} -- the sentence tokenised
             relation {list} -- The Relation objects that are in the sentence
+
+        Keyword Arguments:
+            tagged_tokens {list} -- The tagged sentence tokens, if available, so the sentence is not tagged again
+                                    (default: {None})
         """
-        new_phrase = Phrase(sentence_tokens, relations, self.prefix_length, self.suffix_length)
-        self.cluster(new_phrase)
-        self.save()
+        with stats.timer('update'):
+            with stats.timer('vectorisation'):
+                new_phrase = Phrase(sentence_tokens, relations, self.prefix_length, self.suffix_length,
+                                    tagged_tokens=tagged_tokens)
+            self.cluster(new_phrase)
+        self.record_change(self.encode_phrase_change('update', new_phrase))
+        return
+
+    @property
+    def journal_path(self):
+        return self.save_dir + self.save_file_name + '.journal'
+
+    def encode_relations(self, relations):
+        """Convert Relations to JSON serializable lists of entity spans
+
+        Arguments:
+            relations {list} -- Relation objects
+
+        Returns:
+            list -- One dict per relation with its confidence and (text, tag, start, end) entities
+        """
+        return [{'confidence': relation.confidence,
+                 'entities': [[e.text, e.tag, e.start, e.end] for e in relation.entities]}
+                for relation in relations]
+
+    def encode_phrase_change(self, op, phrase, **fields):
+        """Describe a change that adds a phrase, for the journal
+
+        The tags of the phrase are included when they are known, so that replaying the journal does not need to tag
+        the sentence again.
+
+        Arguments:
+            op {str} -- The name of the change
+            phrase {Phrase} -- The phrase that was added
+
+        Returns:
+            dict -- JSON serializable description of the change
+        """
+        change = {'op': op}
+        change.update(fields)
+        change.update(self.encode_phrase(phrase))
+        return change
+
+    def encode_phrase(self, phrase):
+        """JSON serializable tokens, relations and, if known, tags of a phrase"""
+        data = {'tokens': list(phrase.sentence_tokens), 'relations': self.encode_relations(phrase.relations)}
+        if phrase.tags is not None:
+            data['tags'] = list(phrase.tags)
+        return data
+
+    def decode_phrase(self, data):
+        """Rebuild a Phrase from the output of encode_phrase"""
+        tagged_tokens = list(zip(data['tokens'], data['tags'])) if 'tags' in data else None
+        return Phrase(data['tokens'], self.decode_relations(data['relations']), self.prefix_length,
+                      self.suffix_length, tagged_tokens=tagged_tokens)
+
+    def decode_relations(self, data):
+        """Rebuild Relations from the output of encode_relations
+
+        Entity parse expressions are taken from the entities of this Snowball's relationship.
+        """
+        parse_expressions = {e.name: e for e in self.relationship.entities}
+        relations = []
+        for relation in data:
+            entities = [Entity(text, tag, parse_expressions[tag], start, end)
+                        for text, tag, start, end in relation['entities']]
+            relations.append(Relation(entities, confidence=relation['confidence']))
+        return relations
+
+    def record_change(self, change):
+        """Append a change to the journal and checkpoint if the policy requires it
+
+        Arguments:
+            change {dict} -- JSON serializable description of the change
+        """
+        if self._replaying or not self.journaling:
+            return
+        save_dir = self.save_dir
+        if not os.path.exists(save_dir):
+            os.makedirs(save_dir)
+        self.journal_seq += 1
+        change = dict(change, seq=self.journal_seq)
+        with io.open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(six.text_type(json.dumps(change, ensure_ascii=False)) + '\n')
+        self.updates_since_checkpoint += 1
+        if self._checkpoint_depth == 0 and self.checkpoint_due():
+            self.save()
+        return
+
+    def checkpoint_due(self):
+        """Whether the checkpoint policy requires a full save"""
+        if self.updates_since_checkpoint == 0:
+            return False
+        if self.checkpoint_every is not None and self.updates_since_checkpoint >= self.checkpoint_every:
+            return True
+        if self.checkpoint_interval is not None and time.time() - self.last_checkpoint_time >= self.checkpoint_interval:
+            return True
+        return False
+
+    def apply_change(self, change):
+        """Apply a change described by update or extract to the knowledge base, and journal it
+
+        Arguments:
+            change {dict} -- JSON serializable description of the change
+        """
+        if change['op'] == 'update':
+            tagged_tokens = list(zip(change['tokens'], change['tags'])) if 'tags' in change else None
+            self.update(change['tokens'], self.decode_relations(change['relations']), tagged_tokens=tagged_tokens)
+        elif change['op'] == 'add_phrase':
+            cluster = self.cluster_with_label(change['cluster'])
+            if cluster is None:
+                # The cluster was evicted or merged since the change was collected, so the phrase is clustered again
+                stats.count('reclustered_changes')
+                self.apply_change(dict(change, op='update'))
+                return
+            cluster.add_match(self.decode_phrase(change))
+            self.record_change(change)
+        elif change['op'] == 'merge_cluster':
+            cluster = self.new_cluster(change['label'])
+            relations = self.decode_relations(change['relations']) if 'relations' in change else None
+            cluster.restore([self.decode_phrase(p) for p in change['phrases']], change['confidence'],
+                            change['old_confidence'], relations)
+            cluster.matched_phrases = change.get('matched_phrases', 0)
+            # The phrases that the merged cluster saw but did not keep
+            cluster.phrases_seen = change.get('phrases_seen', cluster.phrases_seen)
+            cluster.phrases_dropped = change.get('phrases_dropped', cluster.phrases_dropped)
+            self.merge_cluster(cluster)
+        return
+
+    def cluster_with_label(self, label):
+        """The cluster with a label, or None if there is none"""
+        for cluster in self.clusters:
+            if cluster.label == label:
+                return cluster
+        return None
+
+    def replay_journal(self, path):
+        """Apply the changes recorded in a journal file
+
+        Changes that the checkpoint already contains are skipped.
+
+        Arguments:
+            path {str} -- path to the journal
+        """
+        self._replaying = True
+        try:
+            with io.open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    change = json.loads(line)
+                    seq = change.get('seq')
+                    if seq is not None:
+                        if seq <= self.journal_seq:
+                            continue
+                        self.journal_seq = seq
+                    self.apply_change(change)
+                    self.updates_since_checkpoint += 1
+        finally:
+            self._replaying = False
+        return
+
+    def merge(self, delta):
+        """Learn the updates collected in a Delta during frozen extraction
+
+        Changes are applied in the order they were collected, and checkpointed as a single batch.
+
+        Arguments:
+            delta {Delta} -- The collected changes
+        """
+        if self.frozen:
+            raise ValueError("Cannot merge into a frozen Snowball, call unfreeze() first")
+        with self:
+            for change in delta:
+                self.apply_change(change)
+        return
+
+    def spawn(self):
+        """Return a new, empty Snowball with the same relationship and parameters"""
+        snowball = type(self)(self.relationship,
+                              tc=self.minimum_relation_confidence,
+                              tsim=self.minimum_cluster_similarity_score,
+                              prefix_weight=self.prefix_weight,
+                              middle_weight=self.middle_weight,
+                              suffix_weight=self.suffix_weight,
+                              prefix_length=self.prefix_length,
+                              suffix_length=self.suffix_length,
+                              learning_rate=self.learning_rate,
+                              max_candidate_combinations=self.max_candidate_combinations,
+                              save_dir=self.save_dir,
+                              checkpoint_every=self.checkpoint_every,
+                              checkpoint_interval=self.checkpoint_interval,
+                              max_phrases_per_cluster=self.max_phrases_per_cluster,
+                              max_clusters=self.max_clusters,
+                              lsh_bands=self.lsh_bands,
+                              lsh_rows=self.lsh_rows,
+                              cluster_class=self.cluster_class)
+        snowball.save_file_name = self.save_file_name
+        return snowball
+
+    def most_similar_cluster(self, cluster):
+        """Find the cluster whose pattern best matches the pattern of another cluster with the same entity order
+
+        Arguments:
+            cluster {Cluster} -- The cluster to compare
+
+        Returns:
+            Cluster -- The best matching cluster, or None if no pattern matches with at least tsim
+        """
+        clusters = [c for c in self.clusters_with_order(cluster.order) if c is not cluster]
+        if not clusters:
+            return None
+        similarities = self.matcher.scores([cluster.pattern], clusters, self.prefix_weight, self.middle_weight,
+                                           self.suffix_weight)[0]
+        best_match = int(np.argmax(similarities))
+        if similarities[best_match] >= self.minimum_cluster_similarity_score:
+            return clusters[best_match]
+        return None
+
+    def merge_cluster(self, cluster):
+        """Merge a cluster learned by another Snowball into the knowledge base
+
+        The cluster is merged into the cluster with the same entity order whose pattern matches its pattern best, if
+        the match is at least tsim, and is added as a new cluster otherwise.
+
+        Arguments:
+            cluster {Cluster} -- The cluster to merge
+
+        Returns:
+            Cluster -- The cluster of this Snowball that now holds the phrases
+        """
+        target = self.most_similar_cluster(cluster)
+        change = {'op': 'merge_cluster',
+                  'label': cluster.label,
+                  'confidence': cluster.pattern.confidence,
+                  'old_confidence': cluster.old_pattern_confidence,
+                  'matched_phrases': cluster.matched_phrases,
+                  'phrases_seen': cluster.phrases_seen,
+                  'phrases_dropped': cluster.phrases_dropped,
+                  'relations': self.encode_relations(cluster.pattern.relations),
+                  'phrases': [self.encode_phrase(phrase) for phrase in cluster.phrases]}
+        if target is None:
+            if self.clusters:
+                self.cluster_counter += 1
+            target = self.new_cluster(str(self.cluster_counter))
+            target.merge(cluster)
+            self.add_cluster(target)
+        else:
+            target.merge(cluster)
+        self.record_change(change)
+        return target
+
+    def merge_model(self, other):
+        """Merge all clusters of another Snowball for the same relationship into this one
+
+        Clusters are merged in the order of other.clusters and checkpointed as a single batch.
+
+        Arguments:
+            other {Snowball} -- The model to merge, for example one trained on another part of the corpus
+        """
+        if self.frozen:
+            raise ValueError("Cannot merge into a frozen Snowball, call unfreeze() first")
+        with self:
+            for cluster in other.clusters:
+                self.merge_cluster(cluster)
+
+    def train_sharded(self, shards, workers=1):
+        """Train on shards of annotated sentences in parallel, and merge the results into this model
+
+        See relex.training.train_sharded.
+
+        Arguments:
+            shards {list} -- Each shard is a list of 'update' changes (as written to the journal) or the path to a
+                             JSON lines file of them
+
+        Keyword Arguments:
+            workers {int} -- Number of worker processes (default: {1})
+
+        Returns:
+            self -- This Snowball
+        """
+        return train_sharded(self, shards, workers=workers)
+
+    def flush(self):
+        """Write a checkpoint if there are changes that have only been journaled"""
+        if self.updates_since_checkpoint > 0:
+            self.save()
         return
 
     def save(self):
-        """ Write all snowball settings to file for loading later"""
+        """ Write all snowball settings to file for loading later
+
+        This writes a full checkpoint and clears the change journal. The checkpoint is written to a temporary file
+        that then replaces the previous one, so an interrupted save leaves the previous checkpoint and the journal as
+        they were. If the journal is not cleared, Snowball.load skips the changes that the checkpoint contains.
+        """
         save_dir = self.save_dir
         if not os.path.exists(save_dir):
             os.makedirs(save_dir)
 
-        with open(save_dir + self.save_file_name + '.pkl', 'wb') as f:
-            pickle.dump(self, f)
+        self.updates_since_checkpoint = 0
+        self.last_checkpoint_time = time.time()
+        path = save_dir + self.save_file_name + '.pkl'
+        with stats.timer('save'):
+            with open(path + '.tmp', 'wb') as f:
+                pickle.dump(self, f)
+            replace_file(path + '.tmp', path)
+
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        return
+
+    def save_model(self, path=None):
+        """Write the model in the compact, versioned binary format, for fast loading with Snowball.load
+
+        Unlike save(), this does not write a checkpoint or clear the change journal.
+
+        Keyword Arguments:
+            path {str} -- The file to write (default: {save_dir/<name>.snowball})
+
+        Returns:
+            str -- The path of the model file
+        """
+        if path is None:
+            if not os.path.exists(self.save_dir):
+                os.makedirs(self.save_dir)
+            path = self.save_dir + self.save_file_name + '.snowball'
+        with stats.timer('save_model'):
+            save_model(self, path)
+        return path
+
+    def export_reports(self, save_dir=None):
+        """Write human readable reports of the clusters, patterns and relations
+
+        Arguments:
+            save_dir {str} -- directory to write to (default: the Snowball save_dir)
+        """
+        save_dir = save_dir if save_dir is not None else self.save_dir
+        if not os.path.exists(save_dir):
+            os.makedirs(save_dir)
 
         with io.open(save_dir + self.save_file_name + '_clusters.txt', 'w+', encoding='utf-8') as f:
             s = "Cluster set contains " + \
@@ -176,9 +861,10 @@ class Snowball(object):
         # If no clusters, create a new one
         if len(self.clusters) == 0:
             # print("Creating new cluster", self.cluster_counter)
-            cluster0 = Cluster(str(self.cluster_counter), learning_rate=self.learning_rate)
+            stats.count('clusters_created')
+            cluster0 = self.new_cluster(str(self.cluster_counter))
             cluster0.add_phrase(phrase)
-            self.clusters.append(cluster0)
+            self.add_cluster(cluster0)
         else:
             # Use a single pass classification algorithm to classify
             self.classify(phrase)
@@ -190,9 +876,13 @@ class Snowball(object):
         Arguments:
             idx {int} -- Cluster to delete
         """
-        to_del = self.clusters[idx]
-        del to_del
-        self.cluster_counter -= 1
+        to_del = self.clusters.pop(idx)
+        key = tuple(to_del.order)
+        bucket = self.order_index.get(key, [])
+        if to_del in bucket:
+            bucket.remove(to_del)
+        if not bucket:
+            self.order_index.pop(key, None)
         return
 
     def classify(self, phrase):
@@ -202,107 +892,243 @@ class Snowball(object):
         :return:
         """
         phrase_added = False
-        for cluster in self.clusters:
-            # Only compare clusters that have the same ordering of entities
-            if phrase.order == cluster.order:
-
-                # Check the level of similarity to the cluster pattern
-                similarity = match(phrase, cluster, self.prefix_weight, self.middle_weight, self.suffix_weight)
-
-                if similarity >= self.minimum_cluster_similarity_score:
-                    cluster.add_phrase(phrase)
-                    phrase_added = True
+        # Only compare clusters that have the same ordering of entities
+        clusters = list(self.clusters_with_order(phrase.order))
+        # Check the level of similarity to the cluster patterns
+        similarities = self.match_scores([phrase], clusters)
+        if clusters:
+            stats.observe('best_cluster_similarity', float(similarities[0].max()), bin_width=0.05)
+        matching = None
+        for cluster, similarity in zip(clusters, similarities[0]):
+            if similarity >= self.minimum_cluster_similarity_score:
+                if matching is None:
+                    matching = set(self.clusters_matching(phrase.sentence_tokens))
+                cluster.add_match(phrase, pattern_rejects=cluster not in matching)
+                phrase_added = True
 
         if phrase_added is False:
+            stats.count('clusters_created')
             self.cluster_counter += 1
             # create a new cluster
-            new_cluster = Cluster(str(self.cluster_counter), learning_rate=self.learning_rate)
+            new_cluster = self.new_cluster(str(self.cluster_counter))
             new_cluster.add_phrase(phrase)
-            self.clusters.append(new_cluster)
-            
+            self.add_cluster(new_cluster)
+
         return
 
-    def extract(self, s):
+    def score_phrases(self, phrases):
+        """Compute the confidence of each candidate phrase and the cluster that best matches it
+
+        Phrases are grouped by entity order and each group is scored against all clusters sharing that
+        order in one batch.
+
+        Arguments:
+            phrases {list} -- Candidate Phrase objects
+
+        Returns:
+            list -- (confidence, best matching cluster or None) for each phrase, in order
+        """
+        results = [(0.0, None)] * len(phrases)
+        phrases_by_order = OrderedDict()
+        for i, phrase in enumerate(phrases):
+            phrases_by_order.setdefault(tuple(phrase.order), []).append(i)
+
+        for order, phrase_idxs in phrases_by_order.items():
+            clusters = self.clusters_with_order(order)
+            if not clusters:
+                continue
+            # Compare the candidate phrases to the cluster extraction patterns
+            match_scores = self.match_scores([phrases[i] for i in phrase_idxs], clusters)
+            pattern_confidences = np.array([cluster.pattern.confidence for cluster in clusters])
+            confidence_terms = np.where(match_scores >= self.minimum_cluster_similarity_score,
+                                        1.0 - (match_scores * pattern_confidences), 1.0)
+            # Confidence in the relationships we found
+            phrase_confidences = 1.0 - np.prod(confidence_terms, axis=1)
+            best_matches = np.argmax(match_scores, axis=1)
+            for row, i in enumerate(phrase_idxs):
+                best_match = best_matches[row]
+                best_match_cluster = clusters[best_match] if match_scores[row, best_match] > 0 else None
+                results[i] = (float(phrase_confidences[row]), best_match_cluster)
+        return results
+
+    def extract(self, s, learn=None, delta=None):
         """Retrieve probabilistic relationships from a sentence
 
         Arguments:
             s {Sentence} -- The Sentence object to extract from
+
+        Keyword Arguments:
+            learn {bool} -- Whether to add the best phrase to its cluster. Defaults to learning unless the model is
+                            frozen (default: {None})
+            delta {Delta} -- Collects the update that was not learned, to be merged later (default: {None})
         Returns:
             relations -- The Relations found in the sentence
         """
-        # Use the default tagger to find candidate relationships
-        candidate_relations = self.relationship.get_candidates(s.tagged_tokens)
-        num_candidates = len(candidate_relations)
-        all_combs = []
+        if learn is None:
+            learn = not self.frozen
+        elif learn and self.frozen:
+            raise ValueError("Cannot learn with a frozen Snowball, call unfreeze() first")
+        stats.count('sentences')
+        with stats.timer('extract'):
+            # Use the default tagger to find candidate relationships
+            with stats.timer('tagging'):
+                tagged_tokens = s.tagged_tokens
+            candidate_relations = self.relationship.get_candidates(tagged_tokens)
+            return self.extract_candidates(s.raw_tokens, tagged_tokens, candidate_relations, learn=learn, delta=delta)
+
+    def extract_candidates(self, sentence_tokens, tagged_tokens, candidate_relations, learn=False, delta=None):
+        """Retrieve probabilistic relationships from the candidate relations of a sentence
+
+        Arguments:
+            sentence_tokens {list} -- The sentence tokens
+            tagged_tokens {list} -- The tagged sentence tokens
+            candidate_relations {list} -- The candidate Relations found by the relationship in the sentence
+
+        Keyword Arguments:
+            learn {bool} -- Whether to add the best phrase to its cluster (default: {False})
+            delta {Delta} -- Collects the update that was not learned, to be merged later (default: {None})
+
+        Returns:
+            relations -- The Relations found in the sentence, None if there are none
+        """
         unique_names = set()
         for i in candidate_relations:
             for j in i.entities:
                 if j.tag == 'name':
                     unique_names.add(j.text)
 
-        number_of_unique_name = len(unique_names)
-        product = num_candidates * number_of_unique_name
-        if product <= self.max_candidate_combinations:
-            all_combs = [i for r in range(1, number_of_unique_name + 1) for i in combinations(candidate_relations, r)]
-        # Create a candidate phrase for each possible combination
-        all_candidate_phrases = []
-        for combination in all_combs:
-            rels = [r for r in combination]
-            new_rels = copy.copy(rels)
-
-            candidate_phrase = Phrase(s.raw_tokens, new_rels, self.prefix_length, self.suffix_length)
-            all_candidate_phrases.append(candidate_phrase)
-
-        # Only pick the phrase with the best confidence score
-        best_candidate_phrase = None
-        best_candidate_cluster = None
-        best_candidate_phrase_score = 0
-
-        for candidate_phrase in all_candidate_phrases:
-            # print("Evaluating candidate", candidate_phrase)
-            # For each cluster
-            # Compare the candidate phrase to the cluster extraction patter
-            best_match_score = 0
-            best_match_cluster = None
-            confidence_term = 1
-            for cluster in self.clusters:
-                if candidate_phrase.order != cluster.order:
-                    continue   
-                match_score = match(candidate_phrase, cluster, self.prefix_weight, self.middle_weight, self.suffix_weight)
-                if match_score >= self.minimum_cluster_similarity_score:
-                    confidence_term *= (1.0 - (match_score * cluster.pattern.confidence))
-
-                if match_score > best_match_score:
-                    best_match_cluster = cluster
-                    best_match_score = match_score
-
-            # Confidence in the relationships we found
-            phrase_confidence_score = 1.0 - confidence_term
-
-            if phrase_confidence_score > best_candidate_phrase_score:
-                best_candidate_phrase = candidate_phrase
-                best_candidate_phrase_score = phrase_confidence_score
-                best_candidate_cluster = best_match_cluster
+        # Only pick the phrase with the best confidence score, from combinations of up to one relation per name
+        search = CombinationSearch(self, sentence_tokens, candidate_relations, tagged_tokens=tagged_tokens,
+                                   max_size=len(unique_names), max_nodes=self.max_candidate_combinations)
+        best_candidate_phrase, best_candidate_phrase_score, best_candidate_cluster = search.run()
+        if best_candidate_phrase:
+            stats.observe('best_phrase_confidence', best_candidate_phrase_score, bin_width=0.05)
 
         if best_candidate_phrase and best_candidate_phrase_score >= self.minimum_relation_confidence:
-            for candidate_relation in best_candidate_phrase.relations:
-                candidate_relation.confidence = best_candidate_phrase_score
-            # update the knowlegde base
-            # print("Best Candidate", best_candidate_phrase)
-            best_candidate_cluster.add_phrase(best_candidate_phrase)
-            self.save()
+            best_candidate_phrase.relations = [candidate_relation.with_confidence(best_candidate_phrase_score)
+                                                for candidate_relation in best_candidate_phrase.relations]
+            change = self.encode_phrase_change('add_phrase', best_candidate_phrase,
+                                               cluster=best_candidate_cluster.label)
+            if learn:
+                # update the knowlegde base, without scanning the sentence with a pattern it cannot match
+                pattern_rejects = best_candidate_cluster not in self.clusters_matching(tagged_tokens)
+                best_candidate_cluster.add_match(best_candidate_phrase, pattern_rejects=pattern_rejects)
+                self.record_change(change)
+            elif delta is not None:
+                delta.add(change)
+            stats.count('relations_extracted', len(best_candidate_phrase.relations))
             return best_candidate_phrase.relations
 
-    def parse(self, filename):
+    def extract_sentences(self, sentences):
+        """Retrieve relationships from many sentences at once, without learning
+
+        Candidate relations are found in all the sentences first, and only the sentences that have any are searched,
+        with the model frozen (see freeze). A model that was not frozen is unfrozen again afterwards.
+
+        Arguments:
+            sentences {list} -- Sentence objects
+
+        Returns:
+            list -- The Relations found in each sentence, an empty list if there are none
+        """
+        was_frozen = self.frozen
+        if not was_frozen:
+            self.freeze()
+        try:
+            batch = []
+            for sentence in sentences:
+                stats.count('sentences')
+                with stats.timer('tagging'):
+                    tagged_tokens = sentence.tagged_tokens
+                batch.append((sentence.raw_tokens, tagged_tokens, self.relationship.get_candidates(tagged_tokens)))
+            results = []
+            with stats.timer('extract'):
+                for sentence_tokens, tagged_tokens, candidate_relations in batch:
+                    relations = None
+                    if candidate_relations:
+                        relations = self.extract_candidates(sentence_tokens, tagged_tokens, candidate_relations)
+                    results.append(relations or [])
+        finally:
+            if not was_frozen:
+                self.unfreeze()
+        return results
+
+    def compound(self, relation):
+        """The Compound record of a relation
+
+        The relation becomes a model in the Compound field named like the relationship. Entities tagged name or label
+        give the names and labels of the Compound, and the other entities set the fields of the model with the
+        same name as their tag. The relation confidence is kept if the model has a confidence field.
+
+        Arguments:
+            relation {Relation} -- A relation found by this model
+
+        Returns:
+            Compound -- The record
+        """
+        field = Compound.fields.get(self.relationship.name)
+        if not isinstance(field, ListType) or not isinstance(field.field, ModelType):
+            raise ValueError("Compound has no list of models named %s for the relations" % self.relationship.name)
+        model_class = field.field.model_class
+        compound = Compound()
+        values = {}
+        for entity in relation.entities:
+            if entity.tag in ('name', 'label'):
+                compound[entity.tag + 's'].append(entity.text)
+            elif entity.tag in model_class.fields and entity.tag not in values:
+                values[entity.tag] = entity.text
+        if 'confidence' in model_class.fields and 'confidence' not in values:
+            values['confidence'] = six.text_type(relation.confidence)
+        compound[self.relationship.name].append(model_class(**values))
+        return compound
+
+    def records(self, sentences):
+        """The Compound records of the relations found in some sentences (see extract_sentences and compound)
+
+        Arguments:
+            sentences {list} -- Sentence objects
+
+        Returns:
+            list -- A ModelList of Compound records for each sentence
+        """
+        return [ModelList(*[self.compound(relation) for relation in relations])
+                for relations in self.extract_sentences(sentences)]
+
+    def extract_corpus(self, sources, workers=1, ordered=True, include_empty=False):
+        """Extract relations from every sentence of a corpus, without learning
+
+        See relex.corpus.extract_corpus. With more than one worker, documents are read, tagged and extracted in a
+        process pool that shares this (frozen) model.
+
+        Arguments:
+            sources {list} -- Paths to documents and/or Document objects
+
+        Keyword Arguments:
+            workers {int} -- Number of worker processes (default: {1})
+            ordered {bool} -- Yield records in corpus order (default: {True})
+            include_empty {bool} -- Whether to also yield sentences without relations (default: {False})
+
+        Yields:
+            dict -- Sentence records with document and sentence provenance and the relations found
+        """
+        return extract_corpus(self, sources, workers=workers, ordered=ordered, include_empty=include_empty)
+
+    def parse(self, filename, annotations=None):
         """Parse the sentences of a file
 
         Arguments:
             f {str} -- the file path to parse
+
+        Keyword Arguments:
+            annotations {file} -- Text file to write each answer to, as a JSON line annotation that
+                                  train_annotations can learn from without prompting (default: {None})
         """
         f = open(filename, 'rb')
         d = Document().from_file(f)
-        for p in d.paragraphs:
-            for s in p.sentences:
+        for element_index, element in enumerate(d.elements):
+            if not isinstance(element, Paragraph):
+                continue
+            for sentence_index, s in enumerate(element.sentences):
                 candidate_dict = {}
                 candidate_relationships = self.relationship.get_candidates(s.tagged_tokens)
                 if len(candidate_relationships) > 0:
@@ -319,24 +1145,56 @@ class Snowball(object):
                         chosen_candidates = []
                         for cci in chosen_candidate_idx:
                             if cci in candidate_dict.keys():
-                                cc = candidate_dict[cci]
-                                cc.confidence = 1.0
-                                chosen_candidates.append(cc)
+                                chosen_candidates.append(candidate_dict[cci].with_confidence(1.0))
                         if chosen_candidates:
-                            self.update(s.raw_tokens, chosen_candidates)
+                            self.update(s.raw_tokens, chosen_candidates, tagged_tokens=s.tagged_tokens)
+                            if annotations is not None:
+                                chosen = [int(i) for i in chosen_candidate_idx if i in candidate_dict]
+                                record = annotation_record(filename, element_index, sentence_index, s,
+                                                           s.tagged_tokens, candidate_relationships, chosen)
+                                annotations.write(six.text_type(json.dumps(record, ensure_ascii=False)) + '\n')
 
         f.close()
         return
 
-    def train(self, corpus, skip=0):
+    def train(self, corpus, skip=0, annotations=None):
         """train the snowball algorithm on a specified corpus
 
         Arguments:
             corpus {str} -- path to a corpus of documents
+
+        Keyword Arguments:
+            annotations {str} -- Path of a JSON lines file to append the answers to, so that training can be
+                                 repeated with train_annotations (default: {None})
         """
         corpus_list = os.listdir(corpus)
-        for i, file_name in enumerate(corpus_list[skip:]):
-            print('{}/{}:'.format(i + 1, len(corpus_list)), ' ', file_name)
-            f = os.path.join(corpus, file_name)
-            self.parse(f)
+        annotations_file = io.open(annotations, 'a', encoding='utf-8') if annotations is not None else None
+        try:
+            for i, file_name in enumerate(corpus_list[skip:]):
+                print('{}/{}:'.format(i + 1, len(corpus_list)), ' ', file_name)
+                f = os.path.join(corpus, file_name)
+                self.parse(f, annotations=annotations_file)
+                if annotations_file is not None:
+                    annotations_file.flush()
+        finally:
+            if annotations_file is not None:
+                annotations_file.close()
+        self.flush()
+        self.export_reports()
         return
+
+    def train_annotations(self, sources, documents_dir=None):
+        """Train on annotation files without prompting, checkpointing once at the end
+
+        See relex.annotations for the file formats.
+
+        Arguments:
+            sources {list} -- Paths of JSON lines or tab separated annotation files
+
+        Keyword Arguments:
+            documents_dir {str} -- Directory that document paths in the annotations are relative to (default: {None})
+
+        Returns:
+            int -- The number of sentences learned from
+        """
+        return train_annotations(self, sources, documents_dir=documents_dir)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+chemdataextractor.relex.stats
+Timers, counters and histograms that show where Snowball spends its time and how the model evolves
+
+Snowball, Cluster, ChemicalRelationship and the search and matching code record into the module level stats object,
+which is shared by all models in the process (work done in worker processes is not included), and by all threads,
+so updates are made while holding a lock. Timers are inclusive, so for example the matching time is also part of the
+combination enumeration time.
+
+    from chemdataextractor.relex.stats import stats
+    stats.reset()
+    snowball.extract(sentence)
+    print(stats.to_json(indent=2))
+
+"""
+import json
+import math
+import threading
+from collections import OrderedDict
+from timeit import default_timer
+
+
+class Timer(object):
+    """Context manager that adds the time spent in its block to a timer of a Stats object"""
+
+    __slots__ = ('stats', 'name', 'start')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stats.add_time(self.name, default_timer() - self.start)
+        return False
+
+
+class NullTimer(object):
+    """Timer used while stats are disabled"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_TIMER = NullTimer()
+
+
+class Stats(object):
+    """Named timers, counters and histograms
+
+    Timers keep the number of calls, the total and the longest time in seconds. Histograms count how often each
+    value was observed, optionally in bins of a fixed width.
+    """
+
+    def __init__(self):
+        #: Set to False to stop recording
+        self.enabled = True
+        self.timers = {}
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Forget everything recorded so far"""
+        with self._lock:
+            self.timers = {}
+            self.counters = {}
+            self.histograms = {}
+        return
+
+    def timer(self, name):
+        """A context manager that times its block
+
+        Arguments:
+            name {str} -- Name of the timer
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return Timer(self, name)
+
+    def add_time(self, name, seconds):
+        """Add one timed call to a timer"""
+        with self._lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                if seconds > timer[2]:
+                    timer[2] = seconds
+        return
+
+    def count(self, name, n=1):
+        """Add n to a counter"""
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+        return
+
+    def observe(self, name, value, bin_width=None):
+        """Add a value to a histogram
+
+        Arguments:
+            name {str} -- Name of the histogram
+            value {int or float} -- The observed value
+
+        Keyword Arguments:
+            bin_width {float} -- Count the value in the bin [k * bin_width, (k + 1) * bin_width) that contains it,
+                                 labelled by its lower edge (default: {None})
+        """
+        if not self.enabled:
+            return
+        if bin_width is not None:
+            # Round the quotient first, so values on a bin edge, like 0.95 / 0.05, are not put in the bin below it
+            value = round(math.floor(round(value / bin_width, 9)) * bin_width, 10)
+        with self._lock:
+            histogram = self.histograms.setdefault(name, {})
+            histogram[value] = histogram.get(value, 0) + 1
+        return
+
+    def as_dict(self):
+        """Everything recorded, as a JSON serializable dict with timers, counters and histograms"""
+        timers = OrderedDict()
+        histograms = OrderedDict()
+        with self._lock:
+            for name in sorted(self.timers):
+                calls, seconds, longest = self.timers[name]
+                timers[name] = OrderedDict([('calls', calls), ('seconds', seconds), ('mean', seconds / calls),
+                                            ('max', longest)])
+            for name in sorted(self.histograms):
+                histograms[name] = histogram_dict(self.histograms[name])
+            counters = OrderedDict(sorted(self.counters.items()))
+        return OrderedDict([('timers', timers),
+                            ('counters', counters),
+                            ('histograms', histograms)])
+
+    def to_json(self, **kwargs):
+        """Everything recorded, as JSON. Keyword arguments are passed to json.dumps."""
+        return json.dumps(self.as_dict(), **kwargs)
+
+
+def histogram_dict(histogram):
+    """A histogram as a JSON serializable dict, with its values as keys in increasing order"""
+    return OrderedDict((str(value), histogram[value]) for value in sorted(histogram))
+
+
+#: The stats shared by all Snowball models in this process
+stats = Stats()
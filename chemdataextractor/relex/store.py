@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+"""
+chemdataextractor.relex.store
+Compact, versioned binary file format for trained Snowball models
+
+A model file starts with MAGIC, the format version and the length of a JSON header, followed by the header and a
+data section of 8 byte aligned one dimensional arrays. The header holds the Snowball parameters and the dtype,
+length and offset of every array. All strings (tokens, tags, labels, entity texts) are stored once, in a single
+UTF-8 blob indexed by an offsets array, and are referred to by their index elsewhere. Variable length lists, such as
+the tokens of each phrase, are stored as a flat array of values with an offsets array marking where each list starts.
+
+Nothing in the file depends on the parse elements of the relationship, which has to be passed in when loading, so
+parse expressions are rebuilt from the relationship definition when they are first needed. Files can be memory
+mapped: loading only reads the cluster patterns, and the phrases and token dictionaries of a cluster are read when
+it is first used for learning.
+
+Version 2 added the number of matched phrases, the phrase limit and the pattern relations of each cluster. Version 1
+files are still read: their clusters take the phrase limit of the model and the relations of their last phrase.
+"""
+import io
+import json
+import mmap
+import struct
+from collections import OrderedDict
+
+import numpy as np
+import six
+
+from .cluster import Cluster
+from .entity import Entity
+from .pattern import Pattern
+from .phrase import Phrase
+from .relationship import Relation
+
+MAGIC = b'CDESNOWB'
+FORMAT_VERSION = 2
+
+_PREAMBLE = struct.Struct('<8sIQ')  # magic, format version, header length
+_ALIGNMENT = 8
+
+#: Snowball attributes stored in the header
+PARAMETERS = ('minimum_relation_confidence', 'minimum_cluster_similarity_score', 'prefix_weight', 'middle_weight',
+              'suffix_weight', 'prefix_length', 'suffix_length', 'learning_rate', 'max_candidate_combinations',
+              'save_dir', 'save_file_name', 'checkpoint_every', 'checkpoint_interval', 'cluster_counter',
+              'max_phrases_per_cluster', 'max_clusters', 'clusters_evicted', 'clusters_merged', 'lsh_bands', 'lsh_rows')
+
+
+def is_model_file(path):
+    """Whether a file is a Snowball model in the compact format"""
+    with io.open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class ArrayWriter(object):
+    """Collects the strings and arrays of a model file"""
+
+    def __init__(self):
+        self.string_ids = {}
+        self.strings = []
+        self.arrays = {}
+
+    def string(self, value):
+        """The index of a string in the string table, -1 for None"""
+        if value is None:
+            return -1
+        value = six.text_type(value)
+        if value not in self.string_ids:
+            self.string_ids[value] = len(self.strings)
+            self.strings.append(value)
+        return self.string_ids[value]
+
+    def append(self, name, *values):
+        self.arrays.setdefault(name, []).extend(values)
+
+    def start_list(self, name):
+        """Record where the next list of values starts, in the offsets array of name"""
+        self.arrays.setdefault(name + '_offsets', [0])
+
+    def end_list(self, name, values_name):
+        self.arrays[name + '_offsets'].append(len(self.arrays.get(values_name, [])))
+
+    def write(self, f, header, dtypes):
+        encoded = [s.encode('utf-8') for s in self.strings]
+        self.arrays['string_offsets'] = np.cumsum([0] + [len(b) for b in encoded])
+        self.arrays['string_data'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        directory = {}
+        chunks = []
+        offset = 0
+        for name in sorted(self.arrays):
+            array = np.ascontiguousarray(self.arrays[name], dtype=dtypes.get(name, np.int64))
+            array = array.astype(array.dtype.newbyteorder('<'), copy=False)
+            directory[name] = [array.dtype.str, len(array), offset]
+            data = array.tobytes()
+            padding = -len(data) % _ALIGNMENT
+            chunks.append(data + b'\0' * padding)
+            offset += len(data) + padding
+        header = dict(header, arrays=directory)
+        header_bytes = json.dumps(header, sort_keys=True).encode('utf-8')
+        header_bytes += b' ' * (-(len(header_bytes) + _PREAMBLE.size) % _ALIGNMENT)
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for chunk in chunks:
+            f.write(chunk)
+
+
+#: Arrays that are not int64
+_DTYPES = {'string_data': np.uint8, 'phrase_tagged': np.uint8,
+           'cluster_learning_rate': np.float64, 'cluster_old_confidence': np.float64,
+           'cluster_confidence': np.float64, 'dictionary_frequency': np.float64, 'dictionary_weight': np.float64,
+           'relation_confidence': np.float64, 'pattern_relation_confidence': np.float64}
+
+
+def _write_relations(writer, relations, list_name='phrase_relation', prefix=''):
+    """Write a list of relations, to the arrays whose names start with prefix"""
+    writer.start_list(list_name)
+    for relation in relations:
+        writer.start_list(prefix + 'relation_entity')
+        writer.append(prefix + 'relation_confidence', relation.confidence)
+        for entity in relation.entities:
+            writer.append(prefix + 'relation_entity_text', writer.string(entity.text))
+            writer.append(prefix + 'relation_entity_tag', writer.string(entity.tag))
+            writer.append(prefix + 'relation_entity_start', entity.start)
+            writer.append(prefix + 'relation_entity_end', entity.end)
+        writer.end_list(prefix + 'relation_entity', prefix + 'relation_entity_text')
+    writer.end_list(list_name, prefix + 'relation_confidence')
+
+
+def save_model(snowball, path):
+    """Write a Snowball model to a file in the compact format
+
+    Arguments:
+        snowball {Snowball} -- The model to save
+        path {str} -- Path of the file to write
+    """
+    writer = ArrayWriter()
+    for name in ('cluster', 'cluster_order', 'cluster_entity', 'cluster_element', 'element_token', 'cluster_dictionary',
+                 'dictionary_token', 'cluster_phrase', 'phrase_token', 'phrase_relation', 'relation_entity'):
+        writer.start_list(name)
+    for cluster in snowball.clusters:
+        pattern = cluster.pattern
+        writer.append('cluster_label', writer.string(cluster.label))
+        writer.append('cluster_learning_rate', cluster.learning_rate)
+        writer.append('cluster_old_confidence', cluster.old_pattern_confidence)
+        writer.append('cluster_confidence', pattern.confidence)
+        writer.append('cluster_phrases_seen', cluster.phrases_seen)
+        writer.append('cluster_phrases_dropped', cluster.phrases_dropped)
+        writer.append('cluster_matched_phrases', cluster.matched_phrases)
+        writer.append('cluster_max_phrases', cluster.max_phrases if cluster.max_phrases is not None else -1)
+        for tag in cluster.order:
+            writer.append('cluster_order_values', writer.string(tag))
+        writer.end_list('cluster_order', 'cluster_order_values')
+        for entity in cluster.entities:
+            writer.append('entity_text', writer.string(entity.text))
+            writer.append('entity_tag', writer.string(entity.tag))
+            writer.append('entity_start', entity.start)
+            writer.append('entity_end', entity.end)
+        writer.end_list('cluster_entity', 'entity_text')
+
+        # Centroid pattern elements
+        for element, data in sorted(pattern.elements.items()):
+            writer.append('element_name', writer.string(element))
+            for token in data['tokens']:
+                writer.append('element_tokens', writer.string(token))
+            writer.end_list('element_token', 'element_tokens')
+        writer.end_list('cluster_element', 'element_name')
+        # The pattern relations are those of the newest phrase, which may not have been kept
+        _write_relations(writer, pattern.relations, 'cluster_relation', 'pattern_')
+
+        # Token dictionaries
+        for element, dictionary in sorted(cluster.dictionaries.items()):
+            writer.append('dictionary_name', writer.string(element))
+            writer.append('dictionary_total_words', dictionary['total words'])
+            for token, (frequency, weight) in dictionary['token dict'].items():
+                writer.append('dictionary_tokens', writer.string(token))
+                writer.append('dictionary_frequency', frequency)
+                writer.append('dictionary_weight', weight)
+            writer.end_list('dictionary_token', 'dictionary_tokens')
+        writer.end_list('cluster_dictionary', 'dictionary_name')
+
+        # Phrases, with the number of relations the current pattern finds in each, if known
+        matches = cluster.phrase_matches if cluster.confidence_signature is not None else []
+        writer.append('cluster_match_count', len(matches))
+        for i, phrase in enumerate(cluster.phrases):
+            writer.append('phrase_matches', matches[i] if i < len(matches) else 0)
+            writer.append('phrase_prefix_length', phrase.prefix_length)
+            writer.append('phrase_suffix_length', phrase.suffix_length)
+            writer.append('phrase_tagged', phrase.tags is not None)
+            for j, token in enumerate(phrase.sentence_tokens):
+                writer.append('phrase_tokens', writer.string(token))
+                writer.append('phrase_tags', writer.string(phrase.tags[j]) if phrase.tags is not None else -1)
+            writer.end_list('phrase_token', 'phrase_tokens')
+            _write_relations(writer, phrase.relations)
+        writer.end_list('cluster_phrase', 'phrase_matches')
+        writer.end_list('cluster', 'cluster_label')
+
+    header = {'format': 'snowball',
+              'relationship': snowball.relationship.name,
+              'parameters': dict((name, getattr(snowball, name)) for name in PARAMETERS)}
+    with io.open(path, 'wb') as f:
+        writer.write(f, header, _DTYPES)
+    return
+
+
+class ModelStore(object):
+    """Read access to the arrays of a model file"""
+
+    def __init__(self, path, relationship, use_mmap=True):
+        """Open a model file
+
+        Arguments:
+            path {str} -- Path to the model file
+            relationship {ChemicalRelationship} -- The relationship the model was trained for
+
+        Keyword Arguments:
+            use_mmap {bool} -- Memory map the file instead of reading it into memory (default: {True})
+        """
+        with io.open(path, 'rb') as f:
+            magic, version, header_length = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError('%s is not a Snowball model file' % path)
+            if version > FORMAT_VERSION:
+                raise ValueError('%s uses model format version %d, only versions up to %d are supported'
+                                 % (path, version, FORMAT_VERSION))
+            self.version = version
+            self.header = json.loads(f.read(header_length).decode('utf-8'))
+            data_start = _PREAMBLE.size + header_length
+            if use_mmap:
+                self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.buffer = f.read()
+                data_start = 0
+        if self.header['relationship'] != relationship.name:
+            raise ValueError('Model was trained for the %s relationship, not %s'
+                             % (self.header['relationship'], relationship.name))
+        self.relationship = relationship
+        self.parse_expressions = {e.name: e for e in relationship.entities}
+        self.arrays = {}
+        for name, (dtype, length, offset) in self.header['arrays'].items():
+            self.arrays[name] = np.frombuffer(self.buffer, dtype=np.dtype(dtype), count=length,
+                                              offset=data_start + offset)
+        self._strings = {}
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def string(self, i):
+        """The string with index i in the string table"""
+        i = int(i)
+        if i < 0:
+            return None
+        if i not in self._strings:
+            offsets = self.arrays['string_offsets']
+            self._strings[i] = self.arrays['string_data'][offsets[i]:offsets[i + 1]].tobytes().decode('utf-8')
+        return self._strings[i]
+
+    def span(self, name, i):
+        """The start and end of list i of an offsets array"""
+        offsets = self.arrays[name + '_offsets']
+        return int(offsets[i]), int(offsets[i + 1])
+
+    def strings(self, name, start, end):
+        return [self.string(i) for i in self.arrays[name][start:end]]
+
+    def entity(self, text, tag, start, end):
+        return Entity(self.string(text), self.string(tag), self.parse_expressions[self.string(tag)], int(start),
+                      int(end))
+
+    def relations(self, i, list_name='phrase_relation', prefix=''):
+        """The relations of phrase number i, or of the list i of another relations array"""
+        relations = []
+        for r in range(*self.span(list_name, i)):
+            start, end = self.span(prefix + 'relation_entity', r)
+            entities = [self.entity(*values) for values in zip(self[prefix + 'relation_entity_text'][start:end],
+                                                                self[prefix + 'relation_entity_tag'][start:end],
+                                                                self[prefix + 'relation_entity_start'][start:end],
+                                                                self[prefix + 'relation_entity_end'][start:end])]
+            relations.append(Relation(entities, confidence=float(self[prefix + 'relation_confidence'][r])))
+        return relations
+
+    def cluster(self, i, cluster_class=Cluster):
+        """Build cluster i with its centroid pattern; its phrases and dictionaries are loaded on first use
+
+        Arguments:
+            i {int} -- Index of the cluster in the file
+
+        Keyword Arguments:
+            cluster_class {type} -- The Cluster subclass to create (default: {Cluster})
+
+        Returns:
+            Cluster -- The cluster
+        """
+        if 'cluster_max_phrases' in self.arrays:
+            max_phrases = int(self['cluster_max_phrases'][i])
+            max_phrases = max_phrases if max_phrases >= 0 else None
+        else:
+            max_phrases = self.header['parameters'].get('max_phrases_per_cluster')
+        cluster = cluster_class(self.string(self['cluster_label'][i]),
+                                learning_rate=float(self['cluster_learning_rate'][i]), max_phrases=max_phrases)
+        for name in Cluster.lazy_attributes:
+            delattr(cluster, name)
+        cluster._store = self
+        cluster._store_index = i
+        cluster.order = self.strings('cluster_order_values', *self.span('cluster_order', i))
+        start, end = self.span('cluster_entity', i)
+        cluster.entities = [self.entity(*values) for values in zip(self['entity_text'][start:end],
+                                                                    self['entity_tag'][start:end],
+                                                                    self['entity_start'][start:end],
+                                                                    self['entity_end'][start:end])]
+        cluster.old_pattern_confidence = float(self['cluster_old_confidence'][i])
+        cluster.phrases_seen = int(self['cluster_phrases_seen'][i])
+        cluster.phrases_dropped = int(self['cluster_phrases_dropped'][i])
+        # Version 1 files written before matches were counted
+        if 'cluster_matched_phrases' in self.arrays:
+            cluster.matched_phrases = int(self['cluster_matched_phrases'][i])
+        elements = {}
+        for e in range(*self.span('cluster_element', i)):
+            tokens = self.strings('element_tokens', *self.span('element_token', e))
+            elements[self.string(self['element_name'][e])] = {'tokens': tokens}
+        if 'cluster_relation_offsets' in self.arrays:
+            relations = self.relations(i, 'cluster_relation', 'pattern_')
+        else:
+            relations = self.relations(self.span('cluster_phrase', i)[1] - 1)
+        cluster.pattern = Pattern(elements=elements,
+                                  entities=cluster.entities,
+                                  label=cluster.label,
+                                  order=cluster.order,
+                                  relations=relations,
+                                  confidence=float(self['cluster_confidence'][i]))
+        return cluster
+
+    def load_cluster_data(self, cluster):
+        """Read the phrases and token dictionaries of a cluster, and rebuild its modal rows"""
+        i = cluster.__dict__.pop('_store_index')
+        del cluster.__dict__['_store']
+        cluster.phrases = []
+        cluster.dictionaries = {}
+        cluster.element_rows = {}
+        cluster.modal_rows = {}
+        cluster.token_positions = {}
+        for p in range(*self.span('cluster_phrase', i)):
+            start, end = self.span('phrase_token', p)
+            tokens = self.strings('phrase_tokens', start, end)
+            tagged_tokens = None
+            if self['phrase_tagged'][p]:
+                tagged_tokens = list(zip(tokens, self.strings('phrase_tags', start, end)))
+            phrase = Phrase(tokens, self.relations(p), int(self['phrase_prefix_length'][p]),
+                            int(self['phrase_suffix_length'][p]), tagged_tokens=tagged_tokens)
+            cluster.phrases.append(phrase)
+            cluster.update_rows(phrase)
+        for d in range(*self.span('cluster_dictionary', i)):
+            start, end = self.span('dictionary_token', d)
+            token_dict = cluster.dictionaries.setdefault(self.string(self['dictionary_name'][d]), {
+                'token dict': None, 'unique words': [], 'total words': int(self['dictionary_total_words'][d]),
+                'total recurring words': 0})
+            token_dict['token dict'] = OrderedDict(
+                (token, [float(frequency), float(weight)]) for token, frequency, weight in
+                zip(self.strings('dictionary_tokens', start, end), self['dictionary_frequency'][start:end],
+                    self['dictionary_weight'][start:end]))
+        # The match counts belong to the stored pattern, so they stay valid until the pattern changes
+        phrases_start = self.span('cluster_phrase', i)[0]
+        match_count = int(self['cluster_match_count'][i])
+        cluster.phrase_matches = [int(m) for m in self['phrase_matches'][phrases_start:phrases_start + match_count]]
+        cluster.confidence_signature = cluster.pattern_signature() if match_count else None
+        return
+
+
+def load_model(snowball_class, path, relationship, use_mmap=True, cluster_class=None):
+    """Read a Snowball model from a file in the compact format
+
+    Arguments:
+        snowball_class {type} -- The Snowball class to create
+        path {str} -- Path to the model file
+        relationship {ChemicalRelationship} -- The relationship the model was trained for
+
+    Keyword Arguments:
+        use_mmap {bool} -- Memory map the file instead of reading it into memory (default: {True})
+        cluster_class {type} -- The Cluster subclass of the model (default: {None, the default of snowball_class})
+
+    Returns:
+        Snowball -- The model
+    """
+    store = ModelStore(path, relationship, use_mmap=use_mmap)
+    parameters = store.header['parameters']
+    snowball = snowball_class(relationship,
+                              tc=parameters['minimum_relation_confidence'],
+                              tsim=parameters['minimum_cluster_similarity_score'],
+                              prefix_weight=parameters['prefix_weight'],
+                              middle_weight=parameters['middle_weight'],
+                              suffix_weight=parameters['suffix_weight'],
+                              prefix_length=parameters['prefix_length'],
+                              suffix_length=parameters['suffix_length'],
+                              learning_rate=parameters['learning_rate'],
+                              max_candidate_combinations=parameters['max_candidate_combinations'],
+                              save_dir=parameters['save_dir'],
+                              checkpoint_every=parameters['checkpoint_every'],
+                              checkpoint_interval=parameters['checkpoint_interval'],
+                              max_phrases_per_cluster=parameters.get('max_phrases_per_cluster'),
+                              max_clusters=parameters.get('max_clusters'),
+                              lsh_bands=parameters.get('lsh_bands'),
+                              lsh_rows=parameters.get('lsh_rows', 4))
+    snowball.save_file_name = parameters['save_file_name']
+    snowball.cluster_counter = parameters['cluster_counter']
+    snowball.clusters_evicted = parameters.get('clusters_evicted', 0)
+    snowball.clusters_merged = parameters.get('clusters_merged', 0)
+    if cluster_class is not None:
+        snowball.cluster_class = cluster_class
+    for i in range(len(store['cluster_label'])):
+        snowball.add_cluster(store.cluster(i, cluster_class=snowball.cluster_class))
+    return snowball
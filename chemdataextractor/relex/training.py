@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+chemdataextractor.relex.training
+Train Snowball models on shards of annotated sentences and merge them
+
+"""
+import io
+import json
+import logging
+import multiprocessing
+
+import six
+
+log = logging.getLogger(__name__)
+
+# Set in each worker process by _init_worker
+_worker_state = {}
+
+
+def read_changes(source):
+    """Yield the changes of a shard
+
+    Arguments:
+        source {str or list} -- Path to a JSON lines file of changes, such as a Snowball journal, or the changes
+
+    Yields:
+        dict -- Each change
+    """
+    if not isinstance(source, six.string_types):
+        for change in source:
+            yield change
+        return
+    with io.open(source, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def split_shards(changes, n):
+    """Deal changes out to n shards in turn
+
+    Arguments:
+        changes {list} -- The changes to split
+        n {int} -- The number of shards
+
+    Returns:
+        list -- n lists of changes
+    """
+    shards = [[] for _ in range(n)]
+    for i, change in enumerate(changes):
+        shards[i % n].append(change)
+    return shards
+
+
+def train_shard(snowball, shard):
+    """Train a new, empty copy of a Snowball on one shard of annotated sentences
+
+    Only 'update' changes, which describe a sentence and the relations chosen for it, can be trained on
+    independently; the copy does not write a journal.
+
+    Arguments:
+        snowball {Snowball} -- The model whose relationship and parameters are used
+        shard {str or list} -- The 'update' changes, or the path to a JSON lines file of them
+
+    Returns:
+        Snowball -- The trained copy
+    """
+    model = snowball.spawn()
+    model.journaling = False
+    for change in read_changes(shard):
+        if change['op'] != 'update':
+            raise ValueError("Shards can only contain 'update' changes, not '%s'" % change['op'])
+        model.apply_change(change)
+    return model
+
+
+def _init_worker(snowball, shards):
+    # With the fork start method these are inherited rather than pickled
+    _worker_state['snowball'] = snowball
+    _worker_state['shards'] = shards
+
+
+def _train_shard(index):
+    return train_shard(_worker_state['snowball'], _worker_state['shards'][index]).clusters
+
+
+def train_sharded(snowball, shards, workers=1):
+    """Map-reduce training: train a copy of a Snowball on each shard, then merge the copies into it
+
+    Shards are trained independently, in parallel when there is more than one worker, and their clusters are merged
+    into the model with Snowball.merge_cluster in shard order as they become available. Both are done the same way
+    whatever the number of workers, so the result does not depend on it.
+
+    Arguments:
+        snowball {Snowball} -- The model to train, which may already have clusters
+        shards {list} -- Each shard is a list of 'update' changes or the path to a JSON lines file of them
+
+    Keyword Arguments:
+        workers {int} -- Number of worker processes, 1 to train in this process (default: {1})
+
+    Returns:
+        Snowball -- The trained model
+    """
+    if snowball.frozen:
+        raise ValueError("Cannot train a frozen Snowball, call unfreeze() first")
+    shards = list(shards)
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(snowball, shards))
+        trained = pool.imap(_train_shard, range(len(shards)))
+    else:
+        trained = (train_shard(snowball, shard).clusters for shard in shards)
+    try:
+        with snowball:
+            for index, clusters in enumerate(trained):
+                log.debug('Merging shard %s/%s' % (index + 1, len(shards)))
+                for cluster in clusters:
+                    snowball.merge_cluster(cluster)
+        if pool is not None:
+            pool.close()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return snowball
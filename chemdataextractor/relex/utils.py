@@ -172,8 +172,68 @@ def KnuthMorrisPratt(text, pattern):
         if matchLen == len(pattern):
             yield startPos
 
+def locate_sequences(tokens, sequences):
+    """Find all occurrences of several token sequences in one pass over the tokens
+
+    An Aho-Corasick automaton is built from the sequences, so the cost is linear in the number of tokens plus the
+    total length of the sequences and the number of occurrences, rather than one search per sequence.
+
+    Arguments:
+        tokens {list} -- The tokens to search
+        sequences {list} -- Token sequences (tuples) to locate
+
+    Returns:
+        dict -- Each sequence mapped to the start indexes of all its (possibly overlapping) occurrences, in order
+    """
+    # Trie of the sequences, one dict of token transitions per state
+    transitions = [{}]
+    outputs = [[]]
+    occurrences = {}
+    for sequence in sequences:
+        sequence = tuple(sequence)
+        if not sequence or sequence in occurrences:
+            continue
+        occurrences[sequence] = []
+        state = 0
+        for token in sequence:
+            next_state = transitions[state].get(token)
+            if next_state is None:
+                next_state = len(transitions)
+                transitions[state][token] = next_state
+                transitions.append({})
+                outputs.append([])
+            state = next_state
+        outputs[state].append(sequence)
+
+    # Failure links, breadth first so that shorter suffixes are linked first
+    failures = [0] * len(transitions)
+    queue = list(transitions[0].values())
+    for state in queue:
+        for token, next_state in transitions[state].items():
+            queue.append(next_state)
+            failure = failures[state]
+            while failure and token not in transitions[failure]:
+                failure = failures[failure]
+            failures[next_state] = transitions[failure].get(token, 0)
+            outputs[next_state] = outputs[next_state] + outputs[failures[next_state]]
+
+    state = 0
+    for i, token in enumerate(tokens):
+        while state and token not in transitions[state]:
+            state = failures[state]
+        state = transitions[state].get(token, 0)
+        for sequence in outputs[state]:
+            occurrences[sequence].append(i - len(sequence) + 1)
+    return occurrences
+
+
 def subfinder(mylist, pattern):
     for i in range(len(mylist)):
         if mylist[i] == pattern[0] and mylist[i:i+len(pattern)] == pattern:
             return (i, i+len(pattern))
-    return None, None
\ No newline at end of file
+    return None, None
+
+def is_subsequence(sequence, other):
+    """Whether the items of sequence appear in other in the same relative order"""
+    remaining = iter(other)
+    return all(item in remaining for item in sequence)
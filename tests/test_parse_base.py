@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+test_parse_base
+~~~~~~~~~~~~~~~
+
+Test the base parser.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import logging
+import unittest
+
+from lxml import etree
+
+from chemdataextractor.parse.actions import merge
+from chemdataextractor.parse.base import BaseParser
+from chemdataextractor.parse.elements import I, R, W, Optional, ResultNode
+from chemdataextractor.parse.mp import MpParser
+from chemdataextractor.parse.table import MeltingPointCellParser
+from chemdataextractor.utils import first
+
+
+logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+
+value = R('^\\d+(\\.\\d+)?$')('value')
+units = (W('°') + R('^[CFK]$') | W('K'))('units').add_action(merge)
+temperature_phrase = (I('at') + value + Optional(units))('temperature')
+
+
+class TemperatureParser(BaseParser):
+    """Parser like one outside the package, which uses the lxml element API"""
+    root = temperature_phrase
+
+    def __init__(self):
+        self.results = []
+
+    def interpret(self, result, start, end):
+        self.results.append(result)
+        yield (result.find('value').text, first(result.xpath('./units/text()')), result.xpath('string(./value)'),
+               start, end)
+
+
+class TemperatureNodeParser(TemperatureParser):
+    """The same parser, which has been checked to work with ResultNode results"""
+    materialize_results = False
+
+
+class TestBaseParser(unittest.TestCase):
+
+    def setUp(self):
+        self.tokens = [(t, 'NN') for t in 'measured at 300 K and at 77 ° C .'.split(' ')]
+
+    def test_result_types(self):
+        expected = [('300', 'K', '300', 1, 4), ('77', '°C', '77', 5, 9)]
+        parser = TemperatureParser()
+        self.assertEqual(list(parser.parse(self.tokens)), expected)
+        self.assertTrue(all(isinstance(result, etree._Element) for result in parser.results))
+        self.assertEqual(etree.tostring(parser.results[0], encoding='unicode'),
+                         '<temperature><NN>at</NN><value>300</value><units>K</units></temperature>')
+        parser = TemperatureNodeParser()
+        self.assertEqual(list(parser.parse(self.tokens)), expected)
+        self.assertTrue(all(isinstance(result, ResultNode) for result in parser.results))
+
+    def test_built_in_parsers(self):
+        self.assertTrue(BaseParser.materialize_results)
+        self.assertFalse(MpParser.materialize_results)
+        self.assertFalse(MeltingPointCellParser.materialize_results)
+
+
+if __name__ == '__main__':
+    unittest.main()
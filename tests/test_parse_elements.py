@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+"""
+test_parse_elements
+~~~~~~~~~~~~~~~~~~~
+
+Test parser elements.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import logging
+import pickle
+import threading
+import unittest
+
+from lxml import etree
+import six
+
+from chemdataextractor.parse.actions import join, flatten
+from chemdataextractor.parse.elements import I, R, T, W, Any, Not, Optional, OneOrMore, ZeroOrMore, SkipTo, Start
+from chemdataextractor.parse.elements import First, Or
+from chemdataextractor.parse.elements import BaseParserElement, ParseException, PackratCache, ResultNode, packrat_counts
+
+
+logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+
+class TestScanSpans(unittest.TestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+        specifier = (I('Curie') + I('temperature') + Optional(W('(').hide()))('specifier').add_action(join)
+        value = R('^\d+$')('value')
+        self.phrase = (specifier + OneOrMore(value + W('K')('units')))('phrase')
+        self.tokens = [(t, 'NN') for t in 'The Curie temperature ( 858 K 860 K ) .'.split(' ')]
+
+    def test_spans(self):
+        spans = {}
+        results = list(self.phrase.scan(self.tokens, spans=spans))
+        self.assertEqual(len(results), 1)
+        result, start, end = results[0]
+        self.assertEqual((start, end), (1, 8))
+        self.assertEqual(spans[result], (1, 8))
+        self.assertEqual([(e.tag, e.text, spans[e]) for e in result], [
+            ('specifier', 'Curie temperature', (1, 4)),
+            ('value', '858', (4, 5)),
+            ('units', 'K', (5, 6)),
+            ('value', '860', (6, 7)),
+            ('units', 'K', (7, 8))])
+
+    def test_results_unchanged(self):
+        result = next(self.phrase.scan(self.tokens, spans={}))[0]
+        expected = next(self.phrase.scan(self.tokens))[0]
+        self.assertEqual(etree.tostring(result, encoding='unicode'), etree.tostring(expected, encoding='unicode'))
+        self.assertEqual(result.attrib, {})
+
+
+class TestParse(unittest.TestCase):
+
+    def setUp(self):
+        self.tokens = [(t, 'NN') for t in 'The Curie temperature is 858 K'.split(' ')]
+
+    def test_parse(self):
+        value = (R('^\\d+$') + W('K'))('value')
+        result, end = value.parse(self.tokens, 4)
+        self.assertEqual((etree.tostring(result[0], encoding='unicode'), end), ('<value><NN>858</NN><NN>K</NN></value>', 6))
+        self.assertEqual(value.try_parse(self.tokens, 4), 6)
+        self.assertRaises(ParseException, value.parse, self.tokens, 3)
+        self.assertRaises(ParseException, value.parse, self.tokens, 5)
+        self.assertRaises(ParseException, value.try_parse, self.tokens, 6)
+        self.assertEqual(Not(value).parse(self.tokens, 3), ([], 3))
+        self.assertRaises(ParseException, Not(value).parse, self.tokens, 4)
+
+    def test_parse_tokens_subclass(self):
+
+        class Capitalized(BaseParserElement):
+            def _parse_tokens(self, tokens, i, actions=True):
+                if not tokens[i][0][:1].isupper():
+                    raise ParseException(tokens, i, 'Expected a capital letter', self)
+                return [etree.Element('capitalized')], i + 1
+
+        phrase = OneOrMore(Capitalized()) + I('temperature')
+        self.assertEqual([(start, end) for result, start, end in phrase.scan(self.tokens)], [(0, 3)])
+        self.assertRaises(ParseException, phrase.parse, self.tokens, 3)
+
+
+class TestAlternatives(unittest.TestCase):
+
+    def setUp(self):
+        self.tokens = [(t, 'NN') for t in 'The Curie temperature is 858 K'.split(' ')]
+
+    def test_or_longest(self):
+        calls = []
+
+        def record(name):
+            def action(tokens, start, result):
+                calls.append(name)
+            return action
+
+        short = (I('curie'))('short').add_action(record('short'))
+        long = (I('curie') + I('temperature'))('long').add_action(record('long'))
+        same = (W('Curie') + Any())('same').add_action(record('same'))
+        result, end = Or([short, long, same]).parse(self.tokens, 1)
+        self.assertEqual((result[0].tag, end), ('long', 3))
+        # Each alternative is matched once, and only the longest runs its actions
+        self.assertEqual(calls, ['long'])
+
+    def test_named_or(self):
+        phrase = Or([I('curie'), I('curie') + I('temperature')])('specifier')
+        result, end = phrase.parse(self.tokens, 1)
+        self.assertEqual([(e.tag, e.text) for e in result], [('specifier', None)])
+        self.assertEqual([e.text for e in result[0]], ['Curie', 'temperature'])
+        self.assertIs(phrase.streamline().named_exprs(), phrase.named_exprs())
+        self.assertEqual([e.name for e in phrase.named_exprs()], ['specifier', 'specifier'])
+        renamed = phrase('specifier2')
+        self.assertEqual(renamed.parse(self.tokens, 1)[0][0].tag, 'specifier2')
+
+    def test_first_index(self):
+        words = [W(w)(w) for w in ('The', 'is', 'K', 'temperature')]
+        first = First([T('VB')('tag')] + words + [R('^\\d+$')('number'), Any()('any')]).streamline()
+        self.assertIsNotNone(first._alternative_index)
+        self.assertEqual([r.tag for r, start, end in first.scan(self.tokens)],
+                         ['The', 'any', 'temperature', 'is', 'number', 'K'])
+        # Alternatives keep their order
+        first = First([Any()('any')] + words).streamline()
+        self.assertEqual(set(r.tag for r, start, end in first.scan(self.tokens)), set(['any']))
+
+    def test_extend_after_scan(self):
+        words = [W(w)(w) for w in ('The', 'is', 'K', 'temperature')]
+        first = First(words)
+        self.assertEqual([r.tag for r, start, end in first.scan(self.tokens)], ['The', 'temperature', 'is', 'K'])
+        first |= W('858')('number')
+        self.assertEqual(first.parse(self.tokens, 4)[0][0].tag, 'number')
+        self.assertEqual([r.tag for r, start, end in first.scan(self.tokens)],
+                         ['The', 'temperature', 'is', 'number', 'K'])
+        phrase = Or(words)('word')
+        self.assertEqual([start for r, start, end in phrase.scan(self.tokens)], [0, 2, 3, 5])
+        phrase ^= W('858')
+        self.assertEqual(phrase.parse(self.tokens, 4)[0][0].tag, 'word')
+        self.assertEqual([(r.tag, start) for r, start, end in phrase.scan(self.tokens)],
+                         [('word', 0), ('word', 2), ('word', 3), ('word', 4), ('word', 5)])
+
+    def test_copies_independent(self):
+        words = [W(w)(w) for w in ('The', 'is', 'K', 'temperature')]
+        for phrase in (First(words), Or(words)):
+            renamed = phrase('word')
+            copied = phrase.copy()
+            copied.append(W('858'))
+            self.assertEqual(len(phrase.exprs), 4)
+            self.assertIsNone(phrase.name)
+            self.assertRaises(ParseException, phrase.parse, self.tokens, 4)
+            self.assertEqual(renamed.parse(self.tokens, 0)[0][0].tag, 'word')
+            self.assertEqual(phrase.parse(self.tokens, 0)[0][0].tag, 'The')
+            self.assertEqual(copied.parse(self.tokens, 4)[1], 5)
+            # Sub-expressions are shared, so that scans can memoize them
+            self.assertEqual([e for e in copied.exprs[:4]], words)
+
+
+class TestPackrat(unittest.TestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+        self.value = (R('^\\d+$') + W('K')('units'))('value').add_action(join)
+        label = (W('(') + R('^\\d+$') + W(')'))('label')
+        self.phrase = ((I('at') + self.value)('at') |
+                       (ZeroOrMore(Not(self.value) + Any()).hide() + self.value + Optional(label))('phrase'))
+        self.tokens = [(t, 'NN') for t in 'The Curie temperature of 858 K ( 1 ) and at 860 K'.split(' ')]
+
+    def scan(self, **kwargs):
+        return [(etree.tostring(r, encoding='unicode'), start, end) for r, start, end in
+                self.phrase.scan(self.tokens, **kwargs)]
+
+    def test_shared_elements(self):
+        self.phrase.streamline()
+        self.assertEqual(self.phrase.shared_elements(), frozenset([self.value]))
+
+    def test_results_unchanged(self):
+        cache = PackratCache()
+        hits = packrat_counts['hits']
+        self.assertEqual(self.scan(packrat=cache), self.scan())
+        self.assertEqual(self.scan(packrat=True), self.scan())
+        # The lookahead at 858 K and the value after it share a parse
+        self.assertTrue(cache.hits > 0)
+        self.assertTrue(cache.misses > 0)
+        self.assertTrue(packrat_counts['hits'] >= hits + cache.hits)
+
+    def test_counts_from_threads(self):
+        caches = [PackratCache() for _ in range(4)]
+        expected = self.scan()
+        scans = []
+
+        def scan(cache):
+            for _ in range(20):
+                scans.append(self.scan(packrat=cache) == expected)
+        before = packrat_counts['hits'] + packrat_counts['misses']
+        threads = [threading.Thread(target=scan, args=(cache,)) for cache in caches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(all(scans) and len(scans) == 80)
+        self.assertEqual(packrat_counts['hits'] + packrat_counts['misses'] - before,
+                         sum(cache.hits + cache.misses for cache in caches))
+
+    def test_spans(self):
+        expected = {}
+        results = [r for r, start, end in self.phrase.scan(self.tokens, spans=expected)]
+        spans = {}
+        packrat_results = [r for r, start, end in self.phrase.scan(self.tokens, spans=spans, packrat=True)]
+        for result, packrat_result in zip(results, packrat_results):
+            self.assertEqual([(e.tag, expected[e]) for e in result.iter()],
+                             [(e.tag, spans[e]) for e in packrat_result.iter()])
+
+    def test_named_first(self):
+        tokens = [(t, 'NN') for t in '858 K ( 1 )'.split(' ')]
+        phrase = (First([self.value])('temperature') + W('(') + W('at')) | self.value
+        cache = PackratCache()
+        results = [(r.tag, start, end) for r, start, end in phrase.scan(tokens, packrat=cache)]
+        self.assertEqual(results, [('value', 0, 2)])
+        # The First renamed a copy of the memoized result
+        self.assertEqual(cache.results[(self.value, 0, True)][0][0].tag, 'value')
+        self.assertEqual(First([self.value])('temperature').parse(tokens, 0)[0][0].tag, 'temperature')
+
+    def test_copies(self):
+        cache = PackratCache()
+        first = cache.match(self.value, self.tokens, 4)
+        first[0][0].text = 'changed'
+        second = cache.match(self.value, self.tokens, 4)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(etree.tostring(second[0][0].to_element(), encoding='unicode'), '<value>858 K</value>')
+        self.assertEqual(second[1], 6)
+        self.assertIsNot(first[0][0], second[0][0])
+
+
+class TestFirstSet(unittest.TestCase):
+
+    def setUp(self):
+        self.tokens = [('The', 'DT'), ('Curie', 'NNP'), ('temperature', 'NN'), ('is', 'VBZ'), ('858', 'CD'),
+                       ('K', 'NNP'), ('.', '.')]
+
+    def test_first_set(self):
+        phrase = (Start() + Optional(W('The') | T('DT')) + ZeroOrMore(I('curie')) + R('^\\d+$') + W('K')).streamline()
+        first_set = phrase.first_set
+        self.assertEqual(first_set.words, frozenset(['The']))
+        self.assertEqual(first_set.lower_words, frozenset(['curie']))
+        self.assertEqual(first_set.tags, frozenset(['DT']))
+        self.assertEqual([r.pattern for r in first_set.regexes], ['^\\d+$'])
+        self.assertFalse(first_set.empty)
+        self.assertFalse(first_set.any)
+        self.assertEqual(first_set.positions(self.tokens), [0, 1, 4])
+        self.assertTrue(Optional(W('K')).streamline().first_set.empty)
+        self.assertTrue((Not(W('is')) + Any()).streamline().first_set.any)
+        self.assertTrue(SkipTo(W('K')).streamline().first_set.any)
+
+    def test_scan(self):
+        attempts = []
+
+        class RecordedOptional(Optional):
+            def _match_tokens(self, tokens, i, actions=True):
+                attempts.append(i)
+                return super(RecordedOptional, self)._match_tokens(tokens, i, actions)
+
+        value = RecordedOptional(I('is')) + R('^\\d+$')('value') + W('K')('units')
+        results = [(start, end) for result, start, end in value.scan(self.tokens)]
+        self.assertEqual(results, [(3, 6)])
+        # Parses are only tried where 'is' or a number can begin a match
+        self.assertEqual(attempts, [3])
+        self.assertEqual(value.first_set.positions(self.tokens), [3, 4])
+
+    def test_extend_after_scan(self):
+        number = W('is') | W('858')
+        phrase = Optional(W('The')) + number
+        self.assertEqual([(start, end) for result, start, end in phrase.scan(self.tokens)], [(3, 4), (4, 5)])
+        number |= W('Curie')
+        # The first set of the grammar that contains the changed First is worked out again
+        self.assertEqual([(start, end) for result, start, end in phrase.scan(self.tokens)], [(0, 2), (3, 4), (4, 5)])
+        self.assertEqual(phrase.first_set.words, frozenset(['The', 'is', '858', 'Curie']))
+
+    def test_extend_child_after_scan(self):
+        words = [W(w) for w in ('is', 'K', '.')]
+        for alternatives in (First, Or):
+            number = W('858') | W('859')
+            phrase = alternatives(words + [Optional(W('The')) + number])
+            self.assertEqual([(start, end) for result, start, end in phrase.scan(self.tokens)],
+                             [(3, 4), (4, 5), (5, 6), (6, 7)])
+            self.assertIsNotNone(phrase._alternative_index)
+            number |= W('Curie')
+            self.assertTrue(phrase.needs_streamline())
+            self.assertEqual([(start, end) for result, start, end in phrase.scan(self.tokens)],
+                             [(0, 2), (3, 4), (4, 5), (5, 6), (6, 7)])
+            # Sub-expressions that are changed directly are noticed too
+            number.exprs.append(W('temperature'))
+            self.assertEqual(phrase.parse(self.tokens, 2)[1], 3)
+            self.assertEqual([(start, end) for result, start, end in phrase.scan(self.tokens)],
+                             [(0, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 7)])
+            number.exprs = [W('is')]
+            self.assertEqual([(start, end) for result, start, end in phrase.scan(self.tokens)],
+                             [(3, 4), (5, 6), (6, 7)])
+
+    def test_extend_child_of_parsed_grammar(self):
+        number = W('858') | W('859')
+        value = First([W('is'), W('.'), W('temperature'), number + W('K')])
+        self.assertEqual([(start, end) for result, start, end in value.scan(self.tokens)],
+                         [(2, 3), (3, 4), (4, 6), (6, 7)])
+        # The grammar was never streamlined, but the value it contains was
+        phrase = Optional(W('The')) + value
+        tokens = [(t, 'NN') for t in 'The Curie K'.split(' ')]
+        self.assertRaises(ParseException, phrase.parse, tokens, 0)
+        number |= W('Curie')
+        self.assertEqual(phrase.parse(tokens, 0)[1], 3)
+
+    def test_copies_track_changes(self):
+        number = W('858') | W('859')
+        phrase = (number + W('K')).streamline()
+        copied = phrase.copy()
+        restored = pickle.loads(pickle.dumps(phrase)).streamline()
+        number.exprs.append(W('Curie'))
+        self.assertTrue(phrase.needs_streamline())
+        self.assertTrue(copied.needs_streamline())
+        self.assertFalse(restored.needs_streamline())
+        restored.exprs[0] |= W('is')
+        self.assertTrue(restored.needs_streamline())
+        self.assertEqual(restored.streamline().first_set.words, frozenset(['858', '859', 'is']))
+
+
+class TestResultNode(unittest.TestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+        specifier = (I('Curie') + I('temperature'))('specifier').add_action(join)
+        value = (R('^\\d+$')('value') + W('K')('units'))('temperature')
+        self.phrase = (specifier + Optional(W('(').hide()) + OneOrMore(value))('phrase')
+        self.tokens = [(t, 'NN') for t in 'The Curie temperature ( 858 K 860 K ) .'.split(' ')]
+
+    def test_materialize(self):
+        element, start, end = next(self.phrase.scan(self.tokens))
+        node, node_start, node_end = next(self.phrase.scan(self.tokens, materialize=False))
+        self.assertIsInstance(element, etree._Element)
+        self.assertIsInstance(node, ResultNode)
+        self.assertEqual((node_start, node_end), (start, end))
+        self.assertEqual(etree.tostring(node.to_element(), encoding='unicode'),
+                         etree.tostring(element, encoding='unicode'))
+        self.assertIsInstance(self.phrase.parse(self.tokens, 1)[0][0], etree._Element)
+
+    def test_spans(self):
+        spans = {}
+        element = next(self.phrase.scan(self.tokens, spans=spans))[0]
+        node_spans = {}
+        node = next(self.phrase.scan(self.tokens, spans=node_spans, materialize=False))[0]
+        self.assertEqual([(e.tag, spans[e]) for e in element.iter()],
+                         [(n.tag, node_spans[n]) for n in node.iter()])
+        self.assertEqual([(n.tag, (n.start, n.end)) for n in node.iter()],
+                         [(n.tag, node_spans[n]) for n in node.iter()])
+
+    def test_xpath(self):
+        node = next(self.phrase.scan(self.tokens, materialize=False))[0]
+        element = node.to_element()
+        for path in ['./specifier/text()', './temperature/value/text()', 'temperature/units', './*[2]/value',
+                     './temperature[2]/*/text()', './missing/text()', 'text()', '//value/text()',
+                     'count(./temperature)']:
+            expected = element.xpath(path)
+            result = node.xpath(path)
+            if isinstance(expected, list):
+                result = [r if isinstance(r, six.text_type) else etree.tostring(r.to_element(), encoding='unicode')
+                          for r in result]
+                expected = [e if isinstance(e, six.text_type) else etree.tostring(e, encoding='unicode')
+                            for e in expected]
+            self.assertEqual(result, expected, path)
+        self.assertEqual(node.find('temperature').find('units').text, 'K')
+        self.assertEqual(len(node.findall('temperature')), 2)
+        self.assertEqual([n.tag for n in node.iter('value')], ['value', 'value'])
+        self.assertEqual(list(node.itertext()), ['Curie temperature', '858', 'K', '860', 'K'])
+
+    def test_flatten(self):
+        node = next(self.phrase.scan(self.tokens, materialize=False))[0]
+        element = node.to_element()
+        flatten(self.tokens, 1, [node])
+        flatten(self.tokens, 1, [element])
+        self.assertEqual(etree.tostring(node.to_element(), encoding='unicode'),
+                         etree.tostring(element, encoding='unicode'))
+
+    def test_clone(self):
+        node = next(self.phrase.scan(self.tokens, materialize=False))[0]
+        self.assertEqual([(n.tag, n.start, n.end) for n in node.iter()],
+                         [(n.tag, n.start, n.end) for n in node.clone().iter()])
+        node.append(etree.Element('extra'))
+        expected = etree.tostring(node.to_element(), encoding='unicode')
+        clone = node.clone()
+        clone[1][0].text = '900'
+        clone[1].append(ResultNode('error'))
+        clone[3].text = 'changed'
+        self.assertEqual(etree.tostring(node.to_element(), encoding='unicode'), expected)
+
+if __name__ == '__main__':
+    unittest.main()
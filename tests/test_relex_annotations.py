@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+
+Test relex training from annotation files
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from chemdataextractor.doc import Document, Paragraph
+from chemdataextractor.nlp.lexicon import Lexicon
+from chemdataextractor.nlp.tag import BaseTagger, RegexTagger
+from chemdataextractor.nlp.tokenize import SentenceTokenizer
+from chemdataextractor.relex import Snowball, ChemicalRelationship, Cluster
+from chemdataextractor.relex.annotations import AnnotationReader, annotation_record, read_annotations
+from chemdataextractor.parse.elements import I, R, Any, OneOrMore
+from chemdataextractor.parse.actions import join, merge
+from chemdataextractor.parse.cem import chemical_name
+
+logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+
+specifier = (I('curie') + I('temperature') | R('^T(C|c)(urie)?'))('specifier').add_action(join)
+units = (R('^[CFK]\.?$'))('units').add_action(merge)
+value = (R('^\d+(\.\,\d+)?$'))('value')
+entities = (chemical_name | specifier | value + units)
+curie_temperature_phrase = (entities + OneOrMore(entities | Any()))('curie_temperature')
+curie_temp_relationship = ChemicalRelationship([chemical_name, specifier, value, units], curie_temperature_phrase,
+                                               name='curie_temperatures')
+
+
+class StopSentenceTokenizer(SentenceTokenizer):
+    """Split sentences at full stops, without a trained model"""
+
+    def span_tokenize(self, s):
+        return [(m.start(), m.end()) for m in re.finditer(r'[^.\s][^.]*\.', s)]
+
+
+class StaticCluster(Cluster):
+    """Cluster whose pattern confidence does not change, so no tagger is needed"""
+
+    def update_pattern_confidence(self):
+        self.pattern.confidence = 1.0
+
+
+class FormulaTagger(BaseTagger):
+    """Tag a few simple chemical formulae as chemical names"""
+
+    def tag(self, tokens):
+        return [(token, 'B-CM' if re.match(r'^(BiFeO3|CoS2|Fe3O4)$', token[0]) else None) for token in tokens]
+
+
+class CountingSnowball(Snowball):
+    """Snowball that counts its checkpoints"""
+
+    saves = 0
+
+    def save(self):
+        self.saves += 1
+        super(CountingSnowball, self).save()
+
+
+def make_document(text):
+    pos_tagger = RegexTagger([(r'^\d+$', 'CD'), (r'.*', 'NN')])
+    return Document(Paragraph(text, sentence_tokenizer=StopSentenceTokenizer(), lexicon=Lexicon(),
+                              pos_tagger=pos_tagger, ner_tagger=FormulaTagger(), abbreviation_detector=False))
+
+
+class TestAnnotations(unittest.TestCase):
+
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp()
+        self.sb = CountingSnowball(curie_temp_relationship, tsim=0.5, save_dir=self.save_dir + os.sep,
+                                   checkpoint_every=1, cluster_class=StaticCluster)
+        self.documents = {'a.txt': make_document('It was grown. CoS2 has a Tc of 116 K.'),
+                          'b.txt': make_document('Fe3O4 has a Tc of 858 K.')}
+
+    def tearDown(self):
+        shutil.rmtree(self.save_dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.save_dir, name)
+        with io.open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def test_read_tsv(self):
+        path = self.write('annotations.tsv', 'document\telement\tsentence\tstart\tend\tcandidates\n'
+                                             'a.txt\t0\t1\t\t\t0\n'
+                                             'Néel.txt\t0\t\t0\t24\t0,1\n')
+        self.assertEqual(list(read_annotations(path)), [
+            {'document': 'a.txt', 'element': 0, 'sentence': 1, 'candidates': [0]},
+            {'document': 'Néel.txt', 'element': 0, 'start': 0, 'end': 24, 'candidates': [0, 1]}])
+
+    def test_document_sentences(self):
+        reader = AnnotationReader(self.sb, documents=self.documents)
+        change = reader.change({'document': 'a.txt', 'element': 0, 'sentence': 1, 'candidates': [0]})
+        self.assertEqual(change['tokens'], ['CoS2', 'has', 'a', 'Tc', 'of', '116', 'K', '.'])
+        self.assertEqual(change['tags'][0], 'B-CM')
+        self.assertEqual([e[:2] for e in change['relations'][0]['entities']],
+                         [['CoS2', 'name'], ['Tc', 'specifier'], ['116', 'value'], ['K', 'units']])
+        by_offsets = reader.change({'document': 'a.txt', 'element': 0, 'start': 14, 'end': 37, 'candidates': [0]})
+        self.assertEqual(by_offsets, change)
+        self.assertIsNone(reader.change({'document': 'a.txt', 'element': 0, 'sentence': 1, 'candidates': []}))
+        with self.assertRaises(ValueError):
+            reader.change({'document': 'a.txt', 'element': 0, 'start': 0, 'end': 5, 'candidates': [0]})
+
+    def test_annotation_record(self):
+        sentence = self.documents['b.txt'].elements[0].sentences[0]
+        candidates = curie_temp_relationship.get_candidates(sentence.tagged_tokens)
+        record = annotation_record('b.txt', 0, 0, sentence, sentence.tagged_tokens, candidates, [0])
+        self.assertEqual(record['text'], 'Fe3O4 has a Tc of 858 K.')
+        # Exported annotations are learned from without the document or a tagger
+        reader = AnnotationReader(self.sb)
+        self.assertEqual(reader.change(json.loads(json.dumps(record))),
+                         AnnotationReader(self.sb, documents=self.documents).change(
+                             {'document': 'b.txt', 'element': 0, 'sentence': 0, 'candidates': [0]}))
+
+    def test_train_annotations(self):
+        path = self.write('annotations.jsonl', '\n'.join(json.dumps(a) for a in [
+            {'tokens': ['BiFeO3', 'has', 'a', 'Tc', 'of', '1103', 'K', '.'], 'tags': ['B-CM'] + ['NN'] * 7,
+             'relations': [[['BiFeO3', 'name', 0, 1], ['Tc', 'specifier', 3, 4], ['1103', 'value', 5, 6],
+                            ['K', 'units', 6, 7]]]},
+            {'tokens': ['Nothing', 'here', '.'], 'relations': []}]) + '\n')
+        self.assertEqual(self.sb.train_annotations([path]), 1)
+        self.assertEqual(len(self.sb.clusters), 1)
+        self.assertEqual(self.sb.clusters[0].phrases[0].tags[0], 'B-CM')
+        self.assertEqual(self.sb.saves, 1)
+        # The journal of a session can be learned from again
+        with self.sb:
+            self.sb.train_annotations([path])
+            retrained = Snowball(curie_temp_relationship, tsim=0.5, save_dir=self.save_dir + os.sep,
+                                 cluster_class=StaticCluster)
+            retrained.journaling = False
+            self.assertEqual(retrained.train_annotations([self.sb.journal_path]), 1)
+        self.assertEqual(retrained.clusters[0].phrases[0].full_sentence, self.sb.clusters[0].phrases[0].full_sentence)
+
+
+if __name__ == '__main__':
+    unittest.main()
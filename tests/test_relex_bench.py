@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+
+Test relex benchmarks
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import logging
+import unittest
+
+from chemdataextractor.relex import Snowball, ChemicalRelationship, Relation, Entity, Phrase
+from chemdataextractor.relex.bench import TaggedSentence, bench_relex, latency_summary, scale_model
+from chemdataextractor.parse import R, Any, OneOrMore, merge
+
+logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+
+name = (R('^[A-Z][A-Za-z0-9]+$'))('name')
+units = (R('^[CFK]\.?$'))('units').add_action(merge)
+value = (R('^\d+$'))('value')
+entities = (name | value + units)
+relationship = ChemicalRelationship([name, value, units], (entities + OneOrMore(entities | Any()))('tc'), name='tc')
+
+
+def tag(text):
+    return [(t, 'CD' if t.isdigit() else 'NN') for t in text.split(' ')]
+
+
+def make_phrase(text, n=1, v=6):
+    tokens = text.split(' ')
+    entities = [Entity(tokens[n], 'name', name, n, n + 1), Entity(tokens[v], 'value', value, v, v + 1),
+                Entity(tokens[v + 1], 'units', units, v + 1, v + 2)]
+    return Phrase(tokens, [Relation(entities, 1.0)], 1, 1, tagged_tokens=tag(text))
+
+
+class TestBench(unittest.TestCase):
+
+    def setUp(self):
+        self.sb = Snowball(relationship, tsim=0.8, checkpoint_every=None)
+        self.sb.journaling = False
+        for text in ['the BiFeO3 has a Tc of 1103 K here', 'so CoS2 shows transition near 116 K and']:
+            self.sb.cluster(make_phrase(text))
+
+    def test_latency_summary(self):
+        summary = latency_summary([0.001] * 99 + [0.1], memory=2 ** 20)
+        self.assertEqual(summary['calls'], 100)
+        self.assertAlmostEqual(summary['p50_ms'], 1.0)
+        self.assertAlmostEqual(summary['max_ms'], 100.0)
+        self.assertTrue(summary['p90_ms'] < summary['p99_ms'] < summary['max_ms'])
+        self.assertAlmostEqual(summary['throughput'], 100 / 0.199)
+        self.assertEqual(summary['peak_memory_mb'], 1.0)
+        self.assertIsNone(latency_summary([])['peak_memory_mb'])
+
+    def test_scale_model(self):
+        scaled = scale_model(self.sb, 10)
+        self.assertEqual(len(scaled.clusters), 20)
+        self.assertEqual(len(self.sb.clusters), 2)
+        self.assertEqual(len(scaled.clusters_with_order(self.sb.clusters[0].order)), 20)
+        patterns = set(tuple(c.pattern.literal_tokens()) for c in scaled.clusters)
+        self.assertEqual(len(patterns), 20)
+        # Only tokens outside the entities are varied
+        for cluster in scaled.clusters:
+            original = self.sb.clusters[int(cluster.label.split('~')[0])]
+            self.assertEqual([e.text for e in cluster.phrases[0].entities], [e.text for e in original.phrases[0].entities])
+        self.assertEqual([c.label for c in scale_model(self.sb, 10).clusters], [c.label for c in scaled.clusters])
+        self.assertFalse(scaled.journaling)
+
+    def test_bench_relex(self):
+        sentences = [TaggedSentence(tag('the MnO has a Tc of 118 K here')),
+                     TaggedSentence(tag('nothing to see'))]
+        report = bench_relex(self.sb, sentences, scales=[1, 3], updates=5, memory=True)
+        self.assertEqual(report['sentences'], 2)
+        self.assertEqual(report['get_candidates']['calls'], 2)
+        self.assertEqual([r['clusters'] for r in report['scales']], [2, 6])
+        for result in report['scales']:
+            self.assertEqual(result['load']['calls'], 1)
+            self.assertEqual(result['extract']['calls'], 2)
+            self.assertEqual(result['update']['calls'], 5)
+            self.assertIsNotNone(result['extract']['peak_memory_mb'])
+        # The benchmarked model is not changed
+        self.assertEqual(len(self.sb.clusters), 2)
+        self.assertEqual(sum(len(c.phrases) for c in self.sb.clusters), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
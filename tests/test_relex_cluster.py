@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+
+Test relex cluster
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import logging
+import unittest
+
+import numpy as np
+from scipy import spatial
+
+from chemdataextractor.relex import Relation, Entity, Phrase, Cluster
+from chemdataextractor.relex.phrase import PhraseTokenizer
+from chemdataextractor.relex.utils import mode_rows
+from chemdataextractor.parse import R, merge
+
+logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+
+name = (R('^[A-Z][A-Za-z0-9]+$'))('name')
+units = (R('^[CFK]\.?$'))('units').add_action(merge)
+value = (R('^\d+(\.\,\d+)?$'))('value')
+
+
+def make_phrase(text):
+    """Phrase for a sentence with a name at index 1 followed by a value and units"""
+    tokens = text.split(' ')
+    value_idx = [i for i, t in enumerate(tokens) if t.isdigit()][0]
+    entities = [Entity(tokens[1], 'name', name, 1, 2),
+                Entity(tokens[value_idx], 'value', value, value_idx, value_idx + 1),
+                Entity(tokens[value_idx + 1], 'units', units, value_idx + 1, value_idx + 2)]
+    tagged_tokens = [(t, 'CD' if t.isdigit() else 'NN') for t in tokens]
+    return Phrase(tokens, [Relation(entities, 1.0)], prefix_length=1, suffix_length=1, tagged_tokens=tagged_tokens)
+
+
+class RecordingCluster(Cluster):
+    """Cluster that finds the relation of a sentence if it has the pattern middle, and records what it was given"""
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingCluster, self).__init__(*args, **kwargs)
+        self.calls = []
+
+    def get_relations(self, tokens):
+        self.calls.append(tokens)
+        phrase = [p for p in self.phrases if p.sentence_tokens == [t[0] for t in tokens]][0]
+        middle = self.pattern.elements['middle_1']['tokens']
+        if phrase.elements['middle_1']['tokens'] == middle:
+            return phrase.relations
+        return []
+
+
+def build_pattern(cluster, phrases):
+    for phrase in phrases:
+        cluster.phrases.append(phrase)
+        cluster.order = phrase.order
+        cluster.entities = phrase.entities
+        cluster.update_dictionaries(phrase)
+        cluster.update_rows(phrase)
+    cluster.update_pattern()
+    return cluster.pattern
+
+
+def baseline_elements(cluster):
+    """The centroid pattern elements found from the token weight vectors, like before the rows were counted"""
+    elements = {}
+    for element, dictionary in cluster.dictionaries.items():
+        token_dict = dictionary['token dict']
+        vectors = np.array([[token_dict[token][1] if token in phrase.elements[element]['tokens'] else 0
+                             for token in token_dict] for phrase in cluster.phrases])
+        medoid = spatial.KDTree(vectors).query(mode_rows(vectors))[1]
+        elements[element] = cluster.phrases[medoid].elements[element]
+    return elements
+
+
+class TestClusterPattern(unittest.TestCase):
+
+    def test_modal_middle(self):
+        phrases = [make_phrase('the BiFeO3 has a Tc of 1103 K here'),
+                   make_phrase('bulk CoS2 shows Tc near 116 K .'),
+                   make_phrase('so Fe3O4 has a Tc of 858 K and')]
+        pattern = build_pattern(Cluster('0'), phrases)
+        self.assertEqual(pattern.elements['middle_1']['tokens'], ['has', 'a', 'Tc', 'of'])
+        # All prefixes tie, so the row without the earliest dictionary tokens wins
+        self.assertEqual(pattern.elements['prefix']['tokens'], ['so'])
+        self.assertEqual(pattern.relations, phrases[-1].relations)
+
+    def test_tie_prefers_row_without_first_differing_token(self):
+        # Both middles appear once; 'has' is the first dictionary token where they differ
+        phrases = [make_phrase('the BiFeO3 has Tc 1103 K here'),
+                   make_phrase('the CoS2 shows Tc 116 K here')]
+        pattern = build_pattern(Cluster('0'), phrases)
+        self.assertEqual(pattern.elements['middle_1']['tokens'], ['shows', 'Tc'])
+
+    def test_same_as_weight_vectors(self):
+        cluster = FixedConfidenceCluster('0')
+        for text in TestClusterReservoir.texts:
+            cluster.add_phrase(make_phrase(text))
+            self.assertEqual(cluster.pattern.elements, baseline_elements(cluster))
+
+    def test_weights_follow_frequencies(self):
+        cluster = FixedConfidenceCluster('0', max_phrases=2)
+        for text in TestClusterReservoir.texts:
+            cluster.add_phrase(make_phrase(text))
+        for dictionary in cluster.dictionaries.values():
+            for frequency, weight in dictionary['token dict'].values():
+                self.assertEqual(weight, frequency / dictionary['total words'])
+
+    def test_rows_rebuilt_on_unpickle(self):
+        phrases = [make_phrase('the BiFeO3 has a Tc of 1103 K here'),
+                   make_phrase('so Fe3O4 has a Tc of 858 K and')]
+        cluster = Cluster('0')
+        build_pattern(cluster, phrases)
+        state = cluster.__dict__.copy()
+        for attr in ('element_rows', 'modal_rows', 'token_positions'):
+            del state[attr]
+        restored = Cluster.__new__(Cluster)
+        restored.__setstate__(state)
+        self.assertEqual(restored.modal_rows, cluster.modal_rows)
+        self.assertEqual(restored.token_positions, cluster.token_positions)
+
+
+class TestClusterConfidence(unittest.TestCase):
+
+    def test_uses_phrase_tags(self):
+        phrase = make_phrase('the BiFeO3 has a Tc of 1103 K here')
+        cluster = RecordingCluster('0')
+        cluster.add_phrase(phrase)
+        self.assertEqual(cluster.calls, [list(zip(phrase.sentence_tokens, phrase.tags))])
+        self.assertEqual(cluster.pattern.confidence, 1.0)
+
+    def test_unchanged_pattern_only_compares_new_phrase(self):
+        cluster = RecordingCluster('0')
+        cluster.add_phrase(make_phrase('the BiFeO3 has a Tc of 1103 K here'))
+        cluster.add_phrase(make_phrase('the CoS2 has a Tc of 116 K here'))
+        self.assertEqual(len(cluster.calls), 2)
+        self.assertEqual(cluster.phrase_matches, [1, 1])
+
+    def test_changed_pattern_compares_all_phrases(self):
+        cluster = RecordingCluster('0')
+        cluster.add_phrase(make_phrase('the BiFeO3 has a Tc of 1103 K here'))
+        cluster.add_phrase(make_phrase('so CoS2 shows Tc 116 K and'))
+        # The second middle wins the tie, so the first phrase is compared again
+        self.assertEqual(len(cluster.calls), 3)
+        self.assertEqual(cluster.phrase_matches, [0, 1])
+        self.assertEqual(cluster.pattern.confidence, 0.5 * 0.5 + 0.5 * 1.0)
+
+
+class FixedConfidenceCluster(Cluster):
+    """Cluster whose pattern confidence does not change, so no tagger is needed"""
+
+    def update_pattern_confidence(self):
+        self.pattern.confidence = 1.0
+
+
+class TestClusterReservoir(unittest.TestCase):
+
+    texts = ['the BiFeO3 has a Tc of 1103 K here', 'bulk CoS2 shows Tc near 116 K .', 'so Fe3O4 has a Tc of 858 K and',
+             'the MnO has Tc 118 K here', 'a NiO has a Tc of 525 K now', 'the CrO2 has a Tc of 390 K here']
+
+    def test_sample_keeps_centroid(self):
+        capped = FixedConfidenceCluster('0', max_phrases=2)
+        uncapped = FixedConfidenceCluster('0')
+        for text in self.texts:
+            capped.add_phrase(make_phrase(text))
+            uncapped.add_phrase(make_phrase(text))
+        self.assertEqual(len(capped.phrases), 2)
+        self.assertEqual(capped.phrases_seen, 6)
+        self.assertEqual(capped.phrases_dropped, 4)
+        self.assertEqual(capped.dictionaries, uncapped.dictionaries)
+        self.assertEqual(capped.pattern.elements, uncapped.pattern.elements)
+
+    def test_relations_of_newest_phrase(self):
+        cluster = FixedConfidenceCluster('0', max_phrases=2)
+        phrases = [make_phrase(text) for text in self.texts]
+        for phrase in phrases:
+            cluster.add_phrase(phrase)
+        self.assertNotIn(phrases[-1], cluster.phrases)
+        self.assertEqual(cluster.pattern.relations, phrases[-1].relations)
+        merged = FixedConfidenceCluster('1')
+        merged.merge(cluster)
+        self.assertEqual(merged.pattern.relations, phrases[-1].relations)
+
+    def test_sample_is_repeatable(self):
+        samples = []
+        for _ in range(2):
+            cluster = FixedConfidenceCluster('0', max_phrases=3)
+            for text in self.texts:
+                cluster.add_phrase(make_phrase(text))
+            samples.append([p.full_sentence for p in cluster.phrases])
+        self.assertEqual(samples[0], samples[1])
+
+    def test_match_counts_follow_sample(self):
+        cluster = RecordingCluster('0', max_phrases=2)
+        for text in self.texts:
+            cluster.add_phrase(make_phrase(text))
+        self.assertEqual(len(cluster.phrase_matches), len(cluster.phrases))
+
+    def test_rows_follow_sample(self):
+        cluster = FixedConfidenceCluster('0', max_phrases=3)
+        for i in range(20):
+            cluster.add_phrase(make_phrase('w%d C%dO has a Tc of %d K z%d' % (i, i, 100 + i, i)))
+        self.assertEqual(cluster.phrases_seen, 20)
+        for element, rows in cluster.element_rows.items():
+            kept = [frozenset(p.elements[element]['tokens']) for p in cluster.phrases]
+            self.assertEqual(set(rows), set(kept))
+            self.assertEqual(sum(row[2] for row in rows.values()), 3)
+            self.assertIn(cluster.modal_rows[element][0], rows)
+        # The middle is shared by all phrases, so its row counts every phrase that was added
+        self.assertEqual(cluster.modal_rows['middle_1'][1], 20)
+
+
+class TestClusterRelations(unittest.TestCase):
+
+    def test_entities_located_at_match(self):
+        cluster = Cluster('0')
+        build_pattern(cluster, [make_phrase('the BiFeO3 has a Tc of 1103 K here')])
+        tokens = 'at 5 K , the CoS2 has a Tc of 116 K here'.split(' ')
+        relations = cluster.get_relations([(t, 'CD' if t.isdigit() else 'NN') for t in tokens])
+        self.assertEqual(len(relations), 1)
+        self.assertEqual([(e.text, e.start, e.end) for e in relations[0].entities],
+                         [('CoS2', 5, 6), ('116', 10, 11), ('K', 11, 12)])
+
+
+class TestPhraseTags(unittest.TestCase):
+
+    def test_tags_are_shared(self):
+        p1 = make_phrase('the BiFeO3 has a Tc of 1103 K here')
+        p2 = make_phrase('the CoS2 has a Tc of 116 K here')
+        self.assertEqual(p1.tagged_tokens[6], ('1103', 'CD'))
+        self.assertIs(p1.tags[0], p2.tags[0])
+
+    def test_tokens_line_up(self):
+        # The sentence tokenizer would split '1103K' and 'Tc(' differently
+        tokens = ['BiFeO3', 'has', 'Tc(', 'of', '1103K', 'here']
+        phrase = Phrase(tokens, [], 1, 1)
+        self.assertEqual(PhraseTokenizer(tokens).tokenize(phrase.full_sentence), tokens)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+
+Test relex corpus extraction
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import logging
+import re
+import unittest
+
+from chemdataextractor.doc import Document, Paragraph
+from chemdataextractor.nlp.lexicon import Lexicon
+from chemdataextractor.nlp.tag import BaseTagger, RegexTagger
+from chemdataextractor.nlp.tokenize import SentenceTokenizer
+from chemdataextractor.relex import Snowball, ChemicalRelationship, Relation, Entity, Cluster, Phrase
+from chemdataextractor.parse.elements import I, R, Any, OneOrMore
+from chemdataextractor.parse.actions import join, merge
+from chemdataextractor.parse.cem import chemical_name
+
+logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+
+specifier = (I('curie') + I('temperature') | R('^T(C|c)(urie)?'))('specifier').add_action(join)
+units = (R('^[CFK]\.?$'))('units').add_action(merge)
+value = (R('^\d+(\.\,\d+)?$'))('value')
+entities = (chemical_name | specifier | value + units)
+curie_temperature_phrase = (entities + OneOrMore(entities | Any()))('curie_temperature')
+curie_temp_relationship = ChemicalRelationship([chemical_name, specifier, value, units], curie_temperature_phrase,
+                                               name='curie_temperatures')
+
+
+class StopSentenceTokenizer(SentenceTokenizer):
+    """Split sentences at full stops, without a trained model"""
+
+    def span_tokenize(self, s):
+        return [(m.start(), m.end()) for m in re.finditer(r'[^.\s][^.]*\.', s)]
+
+
+class StaticCluster(Cluster):
+    """Cluster whose pattern confidence does not change, so no tagger is needed"""
+
+    def update_pattern_confidence(self):
+        self.pattern.confidence = 1.0
+
+
+class FormulaTagger(BaseTagger):
+    """Tag a few simple chemical formulae as chemical names"""
+
+    def tag(self, tokens):
+        return [(token, 'B-CM' if re.match(r'^(BiFeO3|CoS2|Fe3O4)$', token[0]) else None) for token in tokens]
+
+
+def make_document(text):
+    pos_tagger = RegexTagger([(r'^\d+$', 'CD'), (r'.*', 'NN')])
+    return Document(Paragraph(text, sentence_tokenizer=StopSentenceTokenizer(), lexicon=Lexicon(),
+                              pos_tagger=pos_tagger, ner_tagger=FormulaTagger(), abbreviation_detector=False))
+
+
+class TestExtractCorpus(unittest.TestCase):
+
+    def setUp(self):
+        self.sb = Snowball(curie_temp_relationship)
+        tagged_tokens = [('BiFeO3', 'B-CM'), ('has', 'NN'), ('a', 'NN'), ('Tc', 'NN'), ('of', 'NN'),
+                         ('1103', 'CD'), ('K', 'NN'), ('.', 'NN')]
+        tokens = [t[0] for t in tagged_tokens]
+        entities = [Entity('BiFeO3', 'name', chemical_name, 0, 1), Entity('Tc', 'specifier', specifier, 3, 4),
+                    Entity('1103', 'value', value, 5, 6), Entity('K', 'units', units, 6, 7)]
+        cluster = StaticCluster('0')
+        cluster.add_phrase(Phrase(tokens, [Relation(entities, 1.0)], 1, 1, tagged_tokens=tagged_tokens))
+        self.sb.add_cluster(cluster)
+        self.documents = [make_document('CoS2 has a Tc of 116 K. It is a metal.'),
+                          make_document('Nothing to see here.'),
+                          make_document('It was grown. Fe3O4 has a Tc of 858 K.')]
+
+    def test_extract_corpus(self):
+        records = list(self.sb.extract_corpus(self.documents))
+        self.assertEqual([(r['document'], r['element'], r['sentence']) for r in records], [(0, 0, 0), (2, 0, 1)])
+        self.assertEqual(records[0]['text'], 'CoS2 has a Tc of 116 K.')
+        self.assertEqual(records[1]['relations'][0]['entities'][0], {'text': 'Fe3O4', 'tag': 'name', 'start': 0, 'end': 1})
+        self.assertEqual(len(self.sb.clusters[0].phrases), 1)
+        self.assertFalse(self.sb.frozen)
+
+    def test_include_empty(self):
+        records = list(self.sb.extract_corpus(self.documents, include_empty=True))
+        self.assertEqual([(r['document'], r['sentence']) for r in records], [(0, 0), (0, 1), (1, 0), (2, 0), (2, 1)])
+        self.assertEqual(records[1]['relations'], [])
+
+    def test_workers(self):
+        serial = list(self.sb.extract_corpus(self.documents))
+        self.assertEqual(list(self.sb.extract_corpus(self.documents, workers=2)), serial)
+        unordered = list(self.sb.extract_corpus(self.documents, workers=2, ordered=False))
+        self.assertEqual(sorted(unordered, key=lambda r: r['document']), serial)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+
+Test relex locality sensitive hashing of clusters
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import logging
+import pickle
+import unittest
+
+import numpy as np
+
+from chemdataextractor.relex import Snowball, ChemicalRelationship, Relation, Entity, Cluster, Phrase
+from chemdataextractor.relex.lsh import ClusterLSH
+from chemdataextractor.relex.matcher import ClusterMatcher
+from chemdataextractor.parse import R, Any, OneOrMore, merge
+
+logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+
+name = (R('^[A-Z][A-Za-z0-9]+$'))('name')
+units = (R('^[CFK]\.?$'))('units').add_action(merge)
+value = (R('^\d+$'))('value')
+entities = (name | value + units)
+relationship = ChemicalRelationship([name, value, units], (entities + OneOrMore(entities | Any()))('tc'), name='tc')
+
+
+class StaticCluster(Cluster):
+    """Cluster with a fixed pattern confidence"""
+
+    def update_pattern_confidence(self):
+        self.pattern.confidence = 1.0
+
+
+def make_phrase(text, n=1, v=6):
+    tokens = text.split(' ')
+    entities = [Entity(tokens[n], 'name', name, n, n + 1), Entity(tokens[v], 'value', value, v, v + 1),
+                Entity(tokens[v + 1], 'units', units, v + 1, v + 2)]
+    return Phrase(tokens, [Relation(entities, 1.0)], 1, 1)
+
+def make_cluster(label, text):
+    cluster = StaticCluster(label)
+    cluster.add_phrase(make_phrase(text))
+    return cluster
+
+
+TEXTS = ['the BiFeO3 has a Tc of 1103 K here',
+         'so CoS2 shows transition near 116 K and',
+         'thin NiO films order at 525 K when',
+         'bulk MnO is magnetic below 118 K ,']
+
+
+class TestClusterLSH(unittest.TestCase):
+
+    def setUp(self):
+        self.clusters = [make_cluster(str(i), text) for i, text in enumerate(TEXTS)]
+
+    def test_shortlist(self):
+        lsh = ClusterLSH(bands=8, rows=4)
+        phrases = [make_phrase('the Fe3O4 has a Tc of 858 K here'), make_phrase('pure CuO turns weird at 99 K now')]
+        mask = lsh.shortlist(phrases, self.clusters)
+        self.assertEqual(mask.shape, (2, 4))
+        self.assertEqual(list(mask[0]), [True, False, False, False])
+        self.assertFalse(mask[1].any())
+        # The same seed gives the same hashes
+        self.assertEqual(lsh.band_keys(phrases[0].elements), ClusterLSH(bands=8, rows=4).band_keys(phrases[0].elements))
+        self.assertEqual(pickle.loads(pickle.dumps(lsh)).band_keys(phrases[0].elements),
+                         lsh.band_keys(phrases[0].elements))
+
+    def test_masked_scores(self):
+        matcher = ClusterMatcher()
+        phrases = [make_phrase(text) for text in TEXTS]
+        exact = matcher.scores(phrases, self.clusters, 0.1, 0.8, 0.1)
+        mask = np.eye(4, dtype=bool)
+        mask[0, 2] = True
+        masked = matcher.scores(phrases, self.clusters, 0.1, 0.8, 0.1, mask=mask)
+        self.assertTrue(np.array_equal(masked, np.where(mask, exact, 0.0)))
+        self.assertEqual(masked[1, 2], 0.0)
+
+    def test_pattern_update_invalidates(self):
+        lsh = ClusterLSH(bands=8, rows=4)
+        phrase = make_phrase('so Fe3O4 shows transition near 858 K and')
+        self.assertTrue(lsh.shortlist([phrase], self.clusters)[0, 1])
+        self.clusters[1].add_phrase(make_phrase('so MnO shows transition near 118 K and'))
+        self.assertTrue(lsh.shortlist([phrase], self.clusters)[0, 1])
+
+
+class TestSnowballLSH(unittest.TestCase):
+
+    def train(self, **kwargs):
+        sb = Snowball(relationship, tsim=0.8, checkpoint_every=None, cluster_class=StaticCluster, **kwargs)
+        sb.journaling = False
+        for text in TEXTS + ['the Fe3O4 has a Tc of 858 K here', 'so Cr2O3 shows transition near 307 K and']:
+            sb.cluster(make_phrase(text))
+        return sb
+
+    def test_exact_by_default(self):
+        sb = Snowball(relationship)
+        self.assertIsNone(sb.lsh)
+        self.assertIsNone(pickle.loads(pickle.dumps(sb)).lsh)
+
+    def test_same_clusters(self):
+        exact = self.train()
+        approximate = self.train(lsh_bands=16, lsh_rows=2)
+        self.assertEqual([[p.full_sentence for p in c.phrases] for c in approximate.clusters],
+                         [[p.full_sentence for p in c.phrases] for c in exact.clusters])
+        self.assertEqual(len(exact.clusters), 4)
+        phrases = [make_phrase('the CuO has a Tc of 99 K here'), make_phrase('pure CuO turns weird at 99 K now')]
+        self.assertEqual([(score, cluster.label) for score, cluster in approximate.score_phrases(phrases)],
+                         [(score, cluster.label) for score, cluster in exact.score_phrases(phrases)])
+        self.assertEqual(approximate.spawn().lsh_bands, 16)
+
+    def test_set_lsh_frozen(self):
+        sb = self.train().freeze()
+        sb.set_lsh(bands=16, rows=2)
+        self.assertTrue(sb.lsh.frozen)
+        self.assertEqual(len(sb.lsh._tables), 1)
+        sb.set_lsh(None)
+        self.assertIsNone(sb.lsh)
+
+
+if __name__ == '__main__':
+    unittest.main()
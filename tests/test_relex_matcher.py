@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+
+Test relex matcher
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import logging
+import unittest
+
+from chemdataextractor.relex import Relation, Entity, Phrase, Cluster
+from chemdataextractor.relex.matcher import ClusterMatcher
+from chemdataextractor.relex.utils import match
+from chemdataextractor.parse import R, merge
+
+logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+
+name = (R('^[A-Z][A-Za-z0-9]+$'))('name')
+units = (R('^[CFK]\.?$'))('units').add_action(merge)
+value = (R('^\d+$'))('value')
+
+
+def make_phrase(text, n, v):
+    tokens = text.split(' ')
+    entities = [Entity(tokens[n], 'name', name, n, n + 1), Entity(tokens[v], 'value', value, v, v + 1),
+                Entity(tokens[v + 1], 'units', units, v + 1, v + 2)]
+    return Phrase(tokens, [Relation(entities, 1.0)], 1, 1)
+
+
+def make_cluster(label, phrases):
+    """Build a cluster pattern without computing its confidence"""
+    cluster = Cluster(label)
+    for phrase in phrases:
+        cluster.phrases.append(phrase)
+        cluster.order = phrase.order
+        cluster.entities = phrase.entities
+        cluster.update_dictionaries(phrase)
+        cluster.update_rows(phrase)
+    cluster.update_pattern()
+    cluster.pattern.confidence = 1.0
+    return cluster
+
+
+class TestClusterMatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.phrases = [
+            make_phrase('the BiFeO3 has a Tc of 1103 K here', 1, 6),
+            make_phrase('bulk CoS2 has a Tc of 116 K .', 1, 6),
+            make_phrase('so Fe3O4 shows transition near 858 K and', 1, 5),
+            make_phrase('thin NiO films order at 525 K when', 1, 5),
+        ]
+        self.clusters = [make_cluster('0', self.phrases[:2]), make_cluster('1', self.phrases[2:3])]
+
+    def test_scores_match_pairwise(self):
+        matcher = ClusterMatcher()
+        scores = matcher.scores(self.phrases, self.clusters, 0.1, 0.8, 0.1)
+        self.assertEqual(scores.shape, (4, 2))
+        for i, phrase in enumerate(self.phrases):
+            for j, cluster in enumerate(self.clusters):
+                expected = match(phrase, cluster, 0.1, 0.8, 0.1)
+                self.assertAlmostEqual(scores[i, j], expected)
+
+    def test_pattern_update_invalidates(self):
+        matcher = ClusterMatcher()
+        before = matcher.scores(self.phrases[3:], self.clusters, 0.1, 0.8, 0.1)
+        cluster = self.clusters[1]
+        cluster.phrases.append(self.phrases[3])
+        cluster.update_dictionaries(self.phrases[3])
+        cluster.update_rows(self.phrases[3])
+        cluster.update_pattern()
+        after = matcher.scores(self.phrases[3:], self.clusters, 0.1, 0.8, 0.1)
+        self.assertAlmostEqual(after[0, 1], match(self.phrases[3], cluster, 0.1, 0.8, 0.1))
+        self.assertAlmostEqual(before[0, 0], after[0, 0])
+
+    def test_no_clusters(self):
+        matcher = ClusterMatcher()
+        scores = matcher.scores(self.phrases, [], 0.1, 0.8, 0.1)
+        self.assertEqual(scores.shape, (4, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+
+Test relex pattern prefilters
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import logging
+import unittest
+
+from chemdataextractor.relex import Snowball, ChemicalRelationship, Relation, Entity, Cluster, Phrase
+from chemdataextractor.relex.prefilter import PrefilterIndex, TokenFilter
+from chemdataextractor.parse import R, Any, OneOrMore, merge
+
+logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+
+name = (R('^[A-Z][A-Za-z0-9]+$'))('name')
+units = (R('^[CFK]\.?$'))('units').add_action(merge)
+value = (R('^\d+$'))('value')
+# Names need a digit, so that Tc is not one
+compound = (R('^[A-Z][A-Za-z]*\d[A-Za-z0-9]*$'))('name')
+entities = compound | value + units
+relationship = ChemicalRelationship([compound, value, units], (entities + OneOrMore(entities | Any()))('tc'), name='tc')
+
+
+class StaticCluster(Cluster):
+    """Cluster with a fixed pattern confidence"""
+
+    def update_pattern_confidence(self):
+        self.pattern.confidence = 1.0
+
+
+class RecordingCluster(Cluster):
+    """Cluster that records the sentences it finds relations in"""
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingCluster, self).__init__(*args, **kwargs)
+        self.sentences = []
+
+    def get_relations(self, tokens):
+        self.sentences.append(' '.join(t[0] for t in tokens))
+        return super(RecordingCluster, self).get_relations(tokens)
+
+
+def make_phrase(text, n, v, tagged=False):
+    tokens = text.split(' ')
+    entities = [Entity(tokens[n], 'name', name, n, n + 1), Entity(tokens[v], 'value', value, v, v + 1),
+                Entity(tokens[v + 1], 'units', units, v + 1, v + 2)]
+    return Phrase(tokens, [Relation(entities, 1.0)], 1, 1, tagged_tokens=tag(text) if tagged else None)
+
+
+def tag(text):
+    return [(t, 'CD' if t.isdigit() else 'NN') for t in text.split(' ')]
+
+def make_cluster(label, text, n, v):
+    cluster = StaticCluster(label)
+    cluster.add_phrase(make_phrase(text, n, v))
+    return cluster
+
+
+class TestTokenFilter(unittest.TestCase):
+
+    def test_accepts(self):
+        token_filter = TokenFilter(['Has', 'Tc', 'of'])
+        self.assertEqual(token_filter.required, frozenset(['has', 'tc', 'of']))
+        self.assertTrue(token_filter.accepts('the bifeo3 has a tc of 1103 k'.split(' ')))
+        self.assertFalse(token_filter.accepts('the bifeo3 has a tc near 1103 k'.split(' ')))
+        self.assertFalse(token_filter.accepts('a tc of 1103 k , bifeo3 has'.split(' ')))
+        self.assertTrue(TokenFilter([]).accepts([]))
+
+    def test_pattern_literal_tokens(self):
+        cluster = make_cluster('0', 'the BiFeO3 has a Tc of 1103 K here', 1, 6)
+        self.assertEqual(cluster.pattern.literal_tokens(), ['the', 'has', 'a', 'Tc', 'of', 'here'])
+        self.assertEqual(cluster.pattern.token_filter.tokens, ('the', 'has', 'a', 'tc', 'of', 'here'))
+
+    def test_get_relations_rejects_without_scanning(self):
+        cluster = make_cluster('0', 'the BiFeO3 has a Tc of 1103 K here', 1, 6)
+        self.assertEqual(cluster.get_relations(tag('the CoS2 shows a Tc of 116 K here')), [])
+        self.assertIsNone(cluster.pattern._parse_expression)
+
+
+class TestPrefilterIndex(unittest.TestCase):
+
+    def test_candidates(self):
+        index = PrefilterIndex()
+        index.add('a', TokenFilter(['has', 'Tc']))
+        index.add('b', TokenFilter([]))
+        index.add('c', TokenFilter(['Tc', 'near']))
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.candidates(tag('CoS2 has Tc near 116 K')), ['a', 'b', 'c'])
+        self.assertEqual(index.candidates(tag('CoS2 has Tc of 116 K')), ['a', 'b'])
+        self.assertEqual(index.candidates(['Tc', 'near', 'has']), ['b', 'c'])
+
+    def test_replace_and_discard(self):
+        index = PrefilterIndex()
+        index.add('a', TokenFilter(['has', 'Tc']))
+        index.add('b', TokenFilter(['shows']))
+        index.add('a', TokenFilter(['shows', 'Tc']))
+        self.assertEqual(len(index), 2)
+        # A replaced filter keeps its place
+        self.assertEqual(index.candidates(tag('CoS2 shows Tc of 116 K')), ['a', 'b'])
+        self.assertEqual(index.candidates(tag('CoS2 has Tc of 116 K')), [])
+        index.discard('b')
+        index.discard('c')
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.candidates(tag('CoS2 shows Tc of 116 K')), ['a'])
+
+    def test_snowball_clusters_matching(self):
+        sb = Snowball(relationship)
+        c0 = make_cluster('0', 'the BiFeO3 has a Tc of 1103 K here', 1, 6)
+        c1 = make_cluster('1', 'so 858 K is the Tc of Fe3O4 , right', 7, 1)
+        sb.add_cluster(c0)
+        sb.add_cluster(c1)
+        self.assertEqual(sb.clusters_matching(tag('the MnO has a Tc of 118 K here')), [c0])
+        self.assertEqual(sb.clusters_matching(tag('so 118 K is the Tc of MnO , right')), [c1])
+        index = sb.pattern_index()
+        self.assertIs(sb.pattern_index(), index)
+        c0.add_phrase(make_phrase('the NiO has Tc 525 K now', 1, 4))
+        c0.add_phrase(make_phrase('the CrO2 has Tc 390 K now', 1, 4))
+        self.assertEqual(sb.clusters_matching(tag('the MnO has Tc 118 K now')), [c0])
+        sb.delete_cluster(0)
+        self.assertEqual(sb.clusters_matching(tag('the MnO has Tc 118 K now')), [])
+        self.assertEqual(len(sb.pattern_index()), 1)
+
+    def test_extract_skips_rejected_scan(self):
+        sb = Snowball(relationship, tc=0, tsim=0.5, save_dir=None, checkpoint_every=None)
+        sb.journaling = False
+        cluster = RecordingCluster('0')
+        for text in ('the BiFeO3 has a Tc of 1103 K here', 'the Fe3O4 has a Tc of 858 K here'):
+            cluster.add_phrase(make_phrase(text, 1, 6, tagged=True))
+        sb.add_cluster(cluster)
+        self.assertEqual(sb.clusters_matching(tag('the CoS2 has a Tc near 116 K here')), [])
+        relations = sb.extract_candidates(*self.candidates('the CoS2 has a Tc near 116 K here'), learn=True)
+        self.assertEqual([e.text for e in relations[0].entities], ['CoS2', '116', 'K'])
+        self.assertEqual(len(cluster.phrases), 3)
+        # The pattern kept its literal tokens, so the new sentence was not scanned with it
+        self.assertEqual(cluster.pattern.literal_tokens(), ['the', 'has', 'a', 'Tc', 'of', 'here'])
+        self.assertNotIn('the CoS2 has a Tc near 116 K here', cluster.sentences)
+        self.assertEqual(cluster.phrase_matches, [1, 1, 0])
+        sb.extract_candidates(*self.candidates('the MnO2 has a Tc of 118 K here'), learn=True)
+        self.assertEqual(cluster.sentences[-1], 'the MnO2 has a Tc of 118 K here')
+        # Phrases clustered while training are not scanned either
+        phrase = make_phrase('the NiO2 has a Tc near 525 K here', 1, 6)
+        sb.update(phrase.sentence_tokens, phrase.relations, tagged_tokens=tag('the NiO2 has a Tc near 525 K here'))
+        self.assertEqual(len(cluster.phrases), 5)
+        self.assertNotIn('the NiO2 has a Tc near 525 K here', cluster.sentences)
+
+    def candidates(self, text):
+        tagged_tokens = tag(text)
+        return [t[0] for t in tagged_tokens], tagged_tokens, relationship.get_candidates(tagged_tokens)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+
+Test relex relationship
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import logging
+import pickle
+import unittest
+
+from chemdataextractor.relex import ChemicalRelationship, Entity, Phrase, Relation
+from chemdataextractor.parse import R, I, Any, OneOrMore, join, merge
+
+logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+name = (R('^[A-Z][a-z]?[A-Z0-9][A-Za-z0-9]*$'))('name')
+specifier = (I('Curie') + I('temperature'))('specifier').add_action(join)
+units = (R('^[CFK]\.?$'))('units').add_action(merge)
+value = (R('^\d+$'))('value')
+entities = (name | specifier | value + units)
+phrase = (entities + OneOrMore(entities | Any()))('tc')
+
+
+class TestGetCandidates(unittest.TestCase):
+
+    def test_candidates(self):
+        relationship = ChemicalRelationship([name, specifier, value, units], phrase, name='tc')
+        tokens = [(t, 'NN') for t in 'The Curie temperature of BiFeO3 is 1103 K and CoS2 has a Curie temperature of 116 K'.split(' ')]
+        candidates = relationship.get_candidates(tokens)
+        self.assertEqual(len(candidates), 2 * 2 * 2 * 2)
+        spans = set(tuple((e.tag, e.start, e.end) for e in c.entities) for c in candidates)
+        self.assertEqual(len(spans), len(candidates))
+        self.assertIn((('specifier', 1, 3), ('name', 4, 5), ('value', 6, 7), ('units', 7, 8)), spans)
+        self.assertIn((('name', 9, 10), ('specifier', 12, 14), ('value', 15, 16), ('units', 16, 17)), spans)
+        for candidate in candidates:
+            self.assertEqual([e.start for e in candidate.entities], sorted(e.start for e in candidate.entities))
+
+    def test_followed_by(self):
+        relationship = ChemicalRelationship([name, specifier, value, units], phrase, name='tc',
+                                            rule={'followed_by': ['value', 'units']})
+        tokens = [(t, 'NN') for t in 'BiFeO3 Curie temperature K 1103 K'.split(' ')]
+        candidates = relationship.get_candidates(tokens)
+        self.assertEqual([[e.start for e in c.entities] for c in candidates], [[0, 1, 4, 5]])
+
+    def test_no_candidates(self):
+        relationship = ChemicalRelationship([name, specifier, value, units], phrase, name='tc')
+        self.assertEqual(relationship.get_candidates([(t, 'NN') for t in 'BiFeO3 is 1103 K'.split(' ')]), [])
+
+
+class TestValueTypes(unittest.TestCase):
+
+    def test_entity(self):
+        entity = Entity('1103', 'value', value, 5, 6)
+        same = Entity('1103', 'value', value, 5, 6)
+        self.assertEqual(entity, same)
+        self.assertNotEqual(entity, Entity('1103', 'value', value, 7, 8))
+        self.assertEqual(len(set([entity, same])), 1)
+        self.assertIs(entity.parse_expression, value)
+        self.assertRaises(AttributeError, setattr, entity, 'start', 0)
+        self.assertEqual(pickle.loads(pickle.dumps(entity)), entity)
+
+    def test_shared_tagged_expression(self):
+        unnamed = R('^\\d+$')
+        entity = Entity('1103', 'value', unnamed, 5, 6)
+        self.assertEqual(entity.parse_expression.name, 'value')
+        self.assertIs(Entity('116', 'value', unnamed, 2, 3).parse_expression, entity.parse_expression)
+        self.assertIsNot(Entity('116', 'other', unnamed, 2, 3).parse_expression, entity.parse_expression)
+        # Copies of the expression get their own tagged expression
+        copied = unnamed.copy()
+        tagged = Entity('116', 'value', copied, 2, 3).parse_expression
+        self.assertIsNot(tagged, entity.parse_expression)
+        self.assertIs(tagged.expr, copied)
+        self.assertIs(Entity('1103', 'value', unnamed, 5, 6).parse_expression, entity.parse_expression)
+
+    def test_relation(self):
+        entities = [Entity('BiFeO3', 'name', name, 0, 1), Entity('1103', 'value', value, 5, 6)]
+        relation = Relation(entities, 0.5)
+        other = Relation(list(reversed(entities)), 1.0)
+        self.assertEqual(relation, other)
+        self.assertEqual(len(set([relation, other])), 1)
+        self.assertNotEqual(relation, Relation([entities[0], Entity('116', 'value', value, 5, 6)], 0.5))
+        # A relation equals the relations that have all of its entity texts
+        partial = Relation(entities[:1], 1.0)
+        self.assertEqual(partial, relation)
+        self.assertNotEqual(relation, partial)
+        self.assertEqual(hash(partial), hash(relation))
+        self.assertEqual(list(relation), entities)
+        self.assertRaises(AttributeError, setattr, relation, 'confidence', 1.0)
+        confident = relation.with_confidence(1.0)
+        self.assertEqual((relation.confidence, confident.confidence), (0.5, 1.0))
+        self.assertEqual(confident.entities, relation.entities)
+        copy = pickle.loads(pickle.dumps(relation))
+        self.assertEqual((copy.entities, copy.confidence), (relation.entities, 0.5))
+
+    def test_phrase_pickle(self):
+        tokens = 'BiFeO3 has a Tc of 1103 K'.split(' ')
+        relation = Relation([Entity('BiFeO3', 'name', name, 0, 1), Entity('1103', 'value', value, 5, 6)], 1.0)
+        phrase = Phrase(tokens, [relation], 1, 1, tagged_tokens=[(t, 'NN') for t in tokens])
+        copy = pickle.loads(pickle.dumps(phrase))
+        self.assertEqual(copy.elements, phrase.elements)
+        self.assertEqual(copy.tags, phrase.tags)
+        self.assertEqual(copy.order, ['name', 'value'])
+        self.assertFalse(hasattr(phrase, '__dict__'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+
+Test relex combination search
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import itertools
+import logging
+import unittest
+
+from chemdataextractor.relex import Snowball, ChemicalRelationship, Relation, Entity, Cluster, Phrase
+from chemdataextractor.relex.search import CombinationSearch, is_subsequence
+from chemdataextractor.parse import R, Any, OneOrMore, merge
+
+logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+
+name = (R('^[A-Z][A-Za-z0-9]+$'))('name')
+units = (R('^[CFK]\.?$'))('units').add_action(merge)
+value = (R('^\d+$'))('value')
+entities = (name | value + units)
+relationship = ChemicalRelationship([name, value, units], (entities + OneOrMore(entities | Any()))('tc'), name='tc')
+
+
+class StaticCluster(Cluster):
+    """Cluster with a fixed pattern confidence"""
+
+    confidence = 1.0
+
+    def update_pattern_confidence(self):
+        self.pattern.confidence = self.confidence
+
+def entity(tokens, tag, i):
+    return Entity(tokens[i], tag, {'name': name, 'value': value, 'units': units}[tag], i, i + 1)
+
+
+def candidates(tokens, names, values):
+    """All name, value, units relations, with the units following each value"""
+    relations = []
+    for n, v in itertools.product(names, values):
+        entities = sorted([entity(tokens, 'name', n), entity(tokens, 'value', v), entity(tokens, 'units', v + 1)],
+                          key=lambda e: e.start)
+        relations.append(Relation(entities, confidence=0))
+    return relations
+
+
+def exhaustive(sb, tokens, relations, max_size):
+    """Score every combination like Snowball.extract used to"""
+    combinations = [c for r in range(1, max_size + 1) for c in itertools.combinations(range(len(relations)), r)]
+    phrases = [Phrase(tokens, [relations[i] for i in c], 1, 1) for c in combinations]
+    best, best_score = None, 0
+    for combination, (score, cluster) in zip(combinations, sb.score_phrases(phrases)):
+        if score > best_score:
+            best, best_score = combination, score
+    return best, best_score
+
+
+class TestCombinationSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.sb = Snowball(relationship, tsim=0.3)
+        training = [('the BiFeO3 has Tc 1103 K here', [1], [4]),
+                    ('the BiFeO3 and CoS2 have Tc 1103 K and 116 K here', [1, 3], [6, 9])]
+        for i, (text, names, values) in enumerate(training):
+            tokens = text.split(' ')
+            relations = [Relation([entity(tokens, 'name', n), entity(tokens, 'value', v), entity(tokens, 'units', v + 1)], 1.0)
+                         for n, v in zip(names, values)]
+            cluster = StaticCluster(str(i))
+            cluster.confidence = 0.9 - 0.2 * i
+            cluster.add_phrase(Phrase(tokens, relations, 1, 1))
+            self.sb.add_cluster(cluster)
+
+    def test_is_subsequence(self):
+        self.assertTrue(is_subsequence(('name', 'value'), ('name', 'name', 'value', 'units')))
+        self.assertTrue(is_subsequence((), ('name',)))
+        self.assertFalse(is_subsequence(('value', 'name'), ('name', 'value', 'units')))
+
+    sentences = [('a NiO has Tc 525 K now', [1], [4]),
+                 ('so MnO and FeO have Tc 118 K and 198 K and', [1, 3], [6, 9]),
+                 ('so MnO and FeO and CoO have Tc 118 K , 198 K and 291 K .', [1, 3, 5], [8, 11, 14]),
+                 ('the MnO has Tc 118 K here with FeO and CoO at 198 K and 291 K .', [1, 8, 10], [4, 12, 15])]
+
+    def test_same_as_exhaustive(self):
+        for text, names, values in self.sentences:
+            tokens = text.split(' ')
+            relations = candidates(tokens, names, values)
+            search = CombinationSearch(self.sb, tokens, relations, max_size=len(names))
+            phrase, score, cluster = search.run()
+            best, best_score = exhaustive(self.sb, tokens, relations, len(names))
+            self.assertEqual(search.best_combination, best)
+            self.assertEqual(score, best_score)
+
+    def test_large_weights_same_as_exhaustive(self):
+        # Match scores can be above 1, so the confidences of the clusters do not bound the phrase confidences
+        self.sb.prefix_weight, self.sb.middle_weight, self.sb.suffix_weight = 0.1, 1.5, 0.1
+        for text, names, values in self.sentences:
+            tokens = text.split(' ')
+            relations = candidates(tokens, names, values)
+            search = CombinationSearch(self.sb, tokens, relations, max_size=len(names))
+            phrase, score, cluster = search.run()
+            best, best_score = exhaustive(self.sb, tokens, relations, len(names))
+            self.assertEqual(search.best_combination, best)
+            self.assertEqual(score, best_score)
+
+    def test_prunes(self):
+        # The first relation matches the best cluster exactly, so no larger combination can beat it
+        tokens = 'the MnO has Tc 118 K here with FeO and CoO at 198 K and 291 K .'.split(' ')
+        relations = candidates(tokens, [1, 8, 10], [4, 12, 15])
+        search = CombinationSearch(self.sb, tokens, relations, max_size=3)
+        phrase, score, cluster = search.run()
+        self.assertEqual(search.best_combination, (0,))
+        self.assertAlmostEqual(score, 0.9)
+        self.assertEqual(search.nodes, 9)
+
+    def test_max_nodes(self):
+        tokens = 'so MnO and FeO and CoO have Tc 118 K , 198 K and 291 K .'.split(' ')
+        relations = candidates(tokens, [1, 3, 5], [8, 11, 14])
+        search = CombinationSearch(self.sb, tokens, relations, max_size=3, max_nodes=5)
+        search.run()
+        self.assertEqual(search.nodes, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,15 +13,20 @@ import io
 import sys
 import logging
 import os
+import shutil
+import tempfile
 import unittest
 
-from chemdataextractor.relex import Snowball, ChemicalRelationship, Relation, Entity
+from chemdataextractor.relex import Snowball, ChemicalRelationship, Relation, Entity, Cluster, Phrase, Delta
 from chemdataextractor.model import BaseModel, StringType, ListType, ModelType, Compound
 from chemdataextractor.parse.elements import I, R, Any, OneOrMore, Optional
 from chemdataextractor.parse.common import lrb, rrb, delim
 from chemdataextractor.parse.actions import join, merge
 from chemdataextractor.parse.cem import chemical_name
-from chemdataextractor.doc import Sentence
+from chemdataextractor.doc import Document, Paragraph, Sentence
+from chemdataextractor.nlp.lexicon import Lexicon
+from chemdataextractor.nlp.tag import NoneTagger, RegexTagger
+from chemdataextractor.nlp.tokenize import BaseTokenizer, WordTokenizer
 
 
 logging.basicConfig(level=logging.DEBUG)
@@ -83,5 +88,363 @@ curie_temp_relationship = ChemicalRelationship(curie_temp_entities, curie_temper
 #         self.assertEqual(result[0].confidence, expected_relation.confidence)
 
 
+class TestSnowballOrderIndex(unittest.TestCase):
+
+    def make_cluster(self, label, order):
+        cluster = Cluster(label)
+        cluster.order = order
+        return cluster
+
+    def test_clusters_with_order(self):
+        sb = Snowball(curie_temp_relationship)
+        c0 = self.make_cluster('0', ['name', 'specifier', 'value', 'units'])
+        c1 = self.make_cluster('1', ['specifier', 'value', 'units', 'name'])
+        c2 = self.make_cluster('2', ['name', 'specifier', 'value', 'units'])
+        for c in (c0, c1, c2):
+            sb.add_cluster(c)
+        self.assertEqual(sb.clusters_with_order(['name', 'specifier', 'value', 'units']), [c0, c2])
+        self.assertEqual(sb.clusters_with_order(['specifier', 'value', 'units', 'name']), [c1])
+        self.assertEqual(sb.clusters_with_order(['name', 'value']), [])
+
+    def test_delete_cluster(self):
+        sb = Snowball(curie_temp_relationship)
+        c0 = self.make_cluster('0', ['name', 'specifier', 'value', 'units'])
+        c1 = self.make_cluster('1', ['specifier', 'value', 'units', 'name'])
+        sb.add_cluster(c0)
+        sb.add_cluster(c1)
+        sb.delete_cluster(1)
+        self.assertEqual(sb.clusters, [c0])
+        self.assertEqual(sb.clusters_with_order(['specifier', 'value', 'units', 'name']), [])
+        self.assertEqual(list(sb.order_index.keys()), [('name', 'specifier', 'value', 'units')])
+
+    def test_rebuild_on_unpickle(self):
+        sb = Snowball(curie_temp_relationship)
+        c0 = self.make_cluster('0', ['name', 'specifier', 'value', 'units'])
+        sb.clusters.append(c0)
+        state = sb.__dict__.copy()
+        del state['order_index']
+        restored = Snowball.__new__(Snowball)
+        restored.__setstate__(state)
+        self.assertEqual(restored.clusters_with_order(c0.order), [c0])
+
+    def test_cluster_class(self):
+        sb = Snowball(curie_temp_relationship, cluster_class=StaticCluster)
+        self.assertIsInstance(sb.new_cluster('0'), StaticCluster)
+        self.assertIs(sb.spawn().cluster_class, StaticCluster)
+        state = sb.__dict__.copy()
+        del state['cluster_class']
+        restored = Snowball.__new__(Snowball)
+        restored.__setstate__(state)
+        self.assertIs(type(restored.new_cluster('1')), Cluster)
+
+
+class TestSnowballCheckpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp() + os.sep
+
+    def tearDown(self):
+        shutil.rmtree(self.save_dir)
+
+    @unittest.skipIf(sys.version_info[0] < 3, 'The bundled model was pickled with Python 3')
+    def test_load_old_pickle(self):
+        # Entities of this model kept their parse expression as their tag
+        sb = Snowball.load(os.path.join(os.path.dirname(__file__), 'data', 'relex', 'curie_temperatures.pkl'))
+        self.assertEqual(len(sb.clusters), 8)
+        cluster = sb.clusters[0]
+        self.assertEqual([e.tag for e in cluster.entities], ['name_1', 'specifier_1', 'value_1', 'units_1'])
+        self.assertIs(cluster.entities[0], cluster.phrases[0].entities[0])
+        self.assertEqual(cluster.entities[0].parse_expression.name, 'name_1')
+        self.assertIsNotNone(cluster.pattern.parse_expression)
+
+    def test_checkpoint_every(self):
+        sb = Snowball(curie_temp_relationship, save_dir=self.save_dir, checkpoint_every=3)
+        pkl_path = self.save_dir + 'curie_temperatures.pkl'
+        sb.record_change({'op': 'noop', 'relations': []})
+        sb.record_change({'op': 'noop', 'relations': []})
+        self.assertFalse(os.path.exists(pkl_path))
+        with io.open(sb.journal_path, encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 2)
+        sb.record_change({'op': 'noop', 'relations': []})
+        self.assertTrue(os.path.exists(pkl_path))
+        self.assertFalse(os.path.exists(sb.journal_path))
+        self.assertEqual(sb.updates_since_checkpoint, 0)
+
+    def test_context_manager_defers_checkpoint(self):
+        sb = Snowball(curie_temp_relationship, save_dir=self.save_dir, checkpoint_every=1)
+        pkl_path = self.save_dir + 'curie_temperatures.pkl'
+        with sb:
+            sb.record_change({'op': 'noop', 'relations': []})
+            sb.record_change({'op': 'noop', 'relations': []})
+            self.assertFalse(os.path.exists(pkl_path))
+        self.assertTrue(os.path.exists(pkl_path))
+        self.assertFalse(os.path.exists(sb.journal_path))
+
+    def test_save_does_not_write_reports(self):
+        sb = Snowball(curie_temp_relationship, save_dir=self.save_dir)
+        sb.save()
+        self.assertEqual(os.listdir(self.save_dir), ['curie_temperatures.pkl'])
+        sb.export_reports()
+        self.assertEqual(sorted(os.listdir(self.save_dir)), ['curie_temperatures.pkl',
+                                                             'curie_temperatures_clusters.txt',
+                                                             'curie_temperatures_patterns.txt',
+                                                             'curie_temperatures_relations.txt'])
+
+    def test_encode_relations(self):
+        sb = Snowball(curie_temp_relationship, save_dir=self.save_dir)
+        entities = [Entity('BiFeO3', 'name', chemical_name, 0, 1), Entity('1103', 'value', value, 5, 6)]
+        encoded = sb.encode_relations([Relation(entities, confidence=1.0)])
+        self.assertEqual(encoded, [{'confidence': 1.0, 'entities': [['BiFeO3', 'name', 0, 1], ['1103', 'value', 5, 6]]}])
+        decoded = sb.decode_relations(encoded)
+        self.assertEqual(decoded[0].entities, tuple(entities))
+        self.assertEqual(decoded[0].entities[1].parse_expression.pattern, value.pattern)
+
+    def test_encode_phrase_change(self):
+        sb = Snowball(curie_temp_relationship, save_dir=self.save_dir)
+        tokens = ['BiFeO3', 'has', 'Tc', '1103', 'K']
+        entities = [Entity('BiFeO3', 'name', chemical_name, 0, 1), Entity('1103', 'value', value, 3, 4)]
+        tagged_tokens = list(zip(tokens, ['CM', 'VBZ', 'NN', 'CD', 'NNP']))
+        phrase = Phrase(tokens, [Relation(entities, confidence=1.0)], 1, 1, tagged_tokens=tagged_tokens)
+        change = sb.encode_phrase_change('add_phrase', phrase, cluster='0')
+        self.assertEqual(change['cluster'], '0')
+        self.assertEqual(change['tags'], ['CM', 'VBZ', 'NN', 'CD', 'NNP'])
+        self.assertEqual(change['relations'], sb.encode_relations(phrase.relations))
+
+
+class TaggedSentence(object):
+    """Stands in for a Sentence whose tokens have already been tagged"""
+
+    def __init__(self, tagged_tokens):
+        self.tagged_tokens = tagged_tokens
+        self.raw_tokens = [t[0] for t in tagged_tokens]
+
+
+class StaticCluster(Cluster):
+    """Cluster whose pattern confidence does not change, so no tagger is needed"""
+
+    def update_pattern_confidence(self):
+        self.pattern.confidence = 1.0
+
+
+class TestSnowballFrozen(unittest.TestCase):
+
+    tagged_tokens = [('BiFeO3', 'B-CM'), ('has', 'VBZ'), ('a', 'DT'), ('Tc', 'NN'), ('of', 'IN'),
+                     ('1103', 'CD'), ('K', 'NNP'), ('.', '.')]
+
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp() + os.sep
+        self.sb = Snowball(curie_temp_relationship, save_dir=self.save_dir)
+        tokens = [t[0] for t in self.tagged_tokens]
+        entities = [Entity('BiFeO3', 'name', chemical_name, 0, 1), Entity('Tc', 'specifier', specifier, 3, 4),
+                    Entity('1103', 'value', value, 5, 6), Entity('K', 'units', units, 6, 7)]
+        phrase = Phrase(tokens, [Relation(entities, 1.0)], 1, 1, tagged_tokens=self.tagged_tokens)
+        cluster = StaticCluster('0')
+        cluster.add_phrase(phrase)
+        self.sb.add_cluster(cluster)
+
+    def tearDown(self):
+        shutil.rmtree(self.save_dir)
+
+    def test_frozen_extract_collects_delta(self):
+        self.sb.freeze()
+        delta = Delta()
+        relations = self.sb.extract(TaggedSentence(self.tagged_tokens), delta=delta)
+        self.assertEqual([e.text for e in relations[0].entities], ['BiFeO3', 'Tc', '1103', 'K'])
+        self.assertEqual(len(self.sb.clusters[0].phrases), 1)
+        self.assertFalse(os.path.exists(self.sb.journal_path))
+        self.assertEqual(len(delta), 1)
+        self.assertEqual(delta.changes[0]['cluster'], '0')
+        self.assertRaises(ValueError, self.sb.extract, TaggedSentence(self.tagged_tokens), learn=True)
+        self.assertRaises(ValueError, self.sb.merge, delta)
+
+    def test_merge_delta(self):
+        delta = Delta()
+        self.sb.extract(TaggedSentence(self.tagged_tokens), learn=False, delta=delta)
+        self.assertEqual(len(self.sb.clusters[0].phrases), 1)
+        other = Delta()
+        self.sb.extract(TaggedSentence(self.tagged_tokens), learn=False, delta=other)
+        delta.extend(other)
+        self.sb.merge(delta)
+        self.assertEqual(len(self.sb.clusters[0].phrases), 3)
+        self.assertEqual(self.sb.clusters[0].phrases[-1].tags, tuple(t[1] for t in self.tagged_tokens))
+        # The merged batch is checkpointed when it is complete
+        self.assertEqual(self.sb.updates_since_checkpoint, 0)
+        self.assertTrue(os.path.exists(self.save_dir + 'curie_temperatures.pkl'))
+
+    def test_journal_left_by_interrupted_save(self):
+        delta = Delta()
+        self.sb.extract(TaggedSentence(self.tagged_tokens), learn=False, delta=delta)
+        self.sb.checkpoint_every = None
+        self.sb.apply_change(delta.changes[0])
+        with io.open(self.sb.journal_path, encoding='utf-8') as f:
+            journal = f.read()
+        self.sb.save()
+        # The process stopped before the journal was removed
+        with io.open(self.sb.journal_path, 'w', encoding='utf-8') as f:
+            f.write(journal)
+        self.assertEqual(sorted(os.listdir(self.save_dir)), ['curie_temperatures.journal', 'curie_temperatures.pkl'])
+        loaded = Snowball.load(self.save_dir + 'curie_temperatures.pkl')
+        self.assertEqual(len(loaded.clusters[0].phrases), 2)
+        self.assertEqual(loaded.updates_since_checkpoint, 0)
+
+    def test_load_from_other_path(self):
+        delta = Delta()
+        self.sb.extract(TaggedSentence(self.tagged_tokens), learn=False, delta=delta)
+        self.sb.checkpoint_every = None
+        self.sb.save()
+        self.sb.apply_change(delta.changes[0])
+        with io.open(self.sb.journal_path, encoding='utf-8') as f:
+            journal = f.read()
+        other_dir = tempfile.mkdtemp()
+        try:
+            shutil.copy(self.save_dir + 'curie_temperatures.pkl', os.path.join(other_dir, 'copy.pkl'))
+            shutil.copy(self.sb.journal_path, os.path.join(other_dir, 'copy.journal'))
+            loaded = Snowball.load(os.path.join(other_dir, 'copy.pkl'))
+            self.assertEqual(len(loaded.clusters[0].phrases), 2)
+            self.assertEqual(loaded.journal_path, os.path.join(other_dir, 'copy.journal'))
+            # Later changes are journaled next to the copy, not in the directory of the original
+            loaded.apply_change(delta.changes[0])
+            with io.open(self.sb.journal_path, encoding='utf-8') as f:
+                self.assertEqual(f.read(), journal)
+            self.assertEqual(len(Snowball.load(os.path.join(other_dir, 'copy.pkl')).clusters[0].phrases), 3)
+            loaded.save()
+            self.assertEqual(sorted(os.listdir(other_dir)), ['copy.pkl'])
+            self.assertEqual(len(Snowball.load(os.path.join(other_dir, 'copy.pkl')).clusters[0].phrases), 3)
+        finally:
+            shutil.rmtree(other_dir)
+
+    def test_merge_delta_for_removed_cluster(self):
+        delta = Delta()
+        self.sb.extract(TaggedSentence(self.tagged_tokens), learn=False, delta=delta)
+        self.sb.delete_cluster(0)
+        self.sb.merge(delta)
+        # The phrase is clustered again
+        self.assertEqual(len(self.sb.clusters), 1)
+        self.assertEqual([len(c.phrases) for c in self.sb.clusters], [1])
+
+
+class TestSnowballBudget(unittest.TestCase):
+
+    def make_cluster(self, label, text, matched_phrases):
+        tokens = text.split(' ')
+        value_idx = tokens.index('K') - 1
+        entities = [Entity(tokens[0], 'name', chemical_name, 0, 1), Entity('Tc', 'specifier', specifier, 3, 4),
+                    Entity(tokens[value_idx], 'value', value, value_idx, value_idx + 1),
+                    Entity('K', 'units', units, value_idx + 1, value_idx + 2)]
+        cluster = StaticCluster(label)
+        cluster.add_phrase(Phrase(tokens, [Relation(entities, 1.0)], 1, 1,
+                                  tagged_tokens=[(t, 'NN') for t in tokens]))
+        cluster.matched_phrases = matched_phrases
+        return cluster
+
+    def setUp(self):
+        self.sb = Snowball(curie_temp_relationship, tsim=0.7, max_clusters=2)
+        self.sb.add_cluster(self.make_cluster('0', 'BiFeO3 has a Tc of 1103 K .', 5))
+        self.sb.add_cluster(self.make_cluster('1', 'CoS2 shows the Tc near 116 K now', 1))
+
+    def test_least_used_cluster_is_evicted(self):
+        # Cluster 0 was added to more often, but cluster 1 matched more phrases
+        self.sb.clusters[0].phrases_seen = 5
+        self.sb.clusters[0].matched_phrases = 0
+        new = self.make_cluster('2', 'Fe3O4 exhibits its Tc at 858 K today', 1)
+        self.sb.add_cluster(new)
+        self.assertEqual([c.label for c in self.sb.clusters], ['1', '2'])
+        self.assertEqual(self.sb.clusters_with_order(new.order), self.sb.clusters)
+        stats = self.sb.store_stats()
+        self.assertEqual(stats['clusters'], 2)
+        self.assertEqual(stats['clusters_evicted'], 1)
+        self.assertEqual(stats['clusters_merged'], 0)
+
+    def test_similar_cluster_is_merged(self):
+        self.sb.clusters[0].matched_phrases = 1
+        self.sb.clusters[1].matched_phrases = 5
+        self.sb.add_cluster(self.make_cluster('2', 'MnO has a Tc of 118 K .', 1))
+        self.assertEqual([c.label for c in self.sb.clusters], ['1', '2'])
+        self.assertEqual([p.sentence_tokens[0] for p in self.sb.clusters[1].phrases], ['MnO', 'BiFeO3'])
+        self.assertEqual(self.sb.clusters_merged, 1)
+        self.assertEqual(self.sb.clusters[1].matched_phrases, 2)
+        self.assertEqual(self.sb.store_stats()['phrases_seen'], 3)
+
+    def test_new_clusters_are_capped(self):
+        self.sb.max_phrases_per_cluster = 10
+        self.assertEqual(self.sb.new_cluster('3').max_phrases, 10)
+        self.assertEqual(self.sb.spawn().max_clusters, 2)
+
+
+class LineTokenizer(BaseTokenizer):
+    """Treats each paragraph as one sentence"""
+
+    def span_tokenize(self, s):
+        return [(0, len(s))]
+
+
+class PlainParagraph(Paragraph):
+    """Paragraph that is tokenized and tagged without any models, and has no parsers"""
+    lexicon = Lexicon()
+    sentence_tokenizer = LineTokenizer()
+    word_tokenizer = WordTokenizer()
+    pos_tagger = RegexTagger([(r'^\d+$', 'CD'), (r'.*', 'NN')])
+    ner_tagger = NoneTagger()
+    abbreviation_detector = False
+    parsers = []
+
+
+class TestSnowballRecords(unittest.TestCase):
+
+    name = R('^[A-Z][a-z]?[A-Z0-9][A-Za-z0-9]*$')('name')
+    relationship = ChemicalRelationship([name, specifier, value, units],
+                                        ((name | specifier | value + units) +
+                                         OneOrMore(name | specifier | value + units | Any()))('curie_temperature'),
+                                        name='curie_temperatures')
+
+    def setUp(self):
+        self.sb = Snowball(self.relationship, tc=0.5, checkpoint_every=None)
+        self.sb.journaling = False
+        tokens = 'BiFeO3 has a Tc of 1103 K .'.split(' ')
+        entities = [Entity('BiFeO3', 'name', self.name, 0, 1), Entity('Tc', 'specifier', specifier, 3, 4),
+                    Entity('1103', 'value', value, 5, 6), Entity('K', 'units', units, 6, 7)]
+        cluster = StaticCluster('0')
+        cluster.add_phrase(Phrase(tokens, [Relation(entities, 1.0)], 1, 1, tagged_tokens=[(t, 'NN') for t in tokens]))
+        self.sb.add_cluster(cluster)
+
+    def test_extract_sentences(self):
+        sentences = [TaggedSentence([(t, 'NN') for t in text.split(' ')])
+                     for text in ['Nothing to see here', 'CoS2 has a Tc of 116 K .']]
+        results = self.sb.extract_sentences(sentences)
+        self.assertFalse(self.sb.frozen)
+        self.assertEqual(results[0], [])
+        self.assertEqual([e.text for e in results[1][0].entities], ['CoS2', 'Tc', '116', 'K'])
+        compound = self.sb.compound(results[1][0])
+        self.assertEqual(compound.serialize(), {'names': ['CoS2'], 'curie_temperatures': [
+            {'specifier': 'Tc', 'value': '116', 'units': 'K'}]})
+
+    def test_extract_sentences_keeps_frozen_state(self):
+        sentences = [TaggedSentence([(t, 'NN') for t in 'CoS2 has a Tc of 116 K .'.split(' ')])]
+        self.sb.freeze()
+        self.assertEqual(len(self.sb.extract_sentences(sentences)[0]), 1)
+        self.assertTrue(self.sb.frozen)
+
+    def test_compound_needs_field(self):
+        sb = Snowball(ChemicalRelationship([self.name, value], (self.name + value)('x'), name='xs'))
+        relation = Relation([Entity('CoS2', 'name', self.name, 0, 1), Entity('116', 'value', value, 1, 2)], 1.0)
+        self.assertRaises(ValueError, sb.compound, relation)
+
+    def test_document_records(self):
+        doc = Document(PlainParagraph('CoS2 has a Tc of 116 K .'), PlainParagraph('Nothing to see here'))
+        self.assertEqual(doc.records.serialize(), [])
+        doc = Document(PlainParagraph('CoS2 has a Tc of 116 K .'), PlainParagraph('Nothing to see here'),
+                       snowballs=[self.sb])
+        self.assertEqual(doc.records.serialize(), [{'names': ['CoS2'], 'curie_temperatures': [
+            {'specifier': 'Tc', 'value': '116', 'units': 'K'}]}])
+        # Other documents do not use the models
+        self.assertEqual(Document.snowballs, ())
+        self.assertRaises(TypeError, Document, PlainParagraph('Nothing to see here'), snowball=self.sb)
+        # Records that share a name are merged
+        doc = Document(PlainParagraph('CoS2 has a Tc of 116 K .'), PlainParagraph('CoS2 has a Tc of 120 K .'),
+                       snowballs=[self.sb])
+        self.assertEqual(doc.records.serialize(), [{'names': ['CoS2'], 'curie_temperatures': [
+            {'specifier': 'Tc', 'value': '116', 'units': 'K'}, {'specifier': 'Tc', 'value': '120', 'units': 'K'}]}])
+
+
 if __name__ == '__main__':
     unittest.main()
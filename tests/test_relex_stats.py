@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+
+Test relex timers, counters and histograms
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import json
+import logging
+import threading
+import unittest
+
+from chemdataextractor.relex import Snowball, ChemicalRelationship, Relation, Entity, Cluster, Phrase
+from chemdataextractor.relex.stats import Stats, stats
+from chemdataextractor.parse import R, Any, OneOrMore, merge
+
+logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+
+name = (R('^[A-Z][A-Za-z0-9]+$'))('name')
+units = (R('^[CFK]\.?$'))('units').add_action(merge)
+value = (R('^\d+$'))('value')
+entities = (name | value + units)
+relationship = ChemicalRelationship([name, value, units], (entities + OneOrMore(entities | Any()))('tc'), name='tc')
+
+
+class StaticCluster(Cluster):
+    """Cluster with a fixed pattern confidence"""
+
+    def update_pattern_confidence(self):
+        self.pattern.confidence = 1.0
+
+
+class TaggedSentence(object):
+    """Stands in for a Sentence whose tokens have already been tagged"""
+
+    def __init__(self, tagged_tokens):
+        self.tagged_tokens = tagged_tokens
+        self.raw_tokens = [t[0] for t in tagged_tokens]
+
+
+def tag(text):
+    return [(t, 'CD' if t.isdigit() else 'NN') for t in text.split(' ')]
+
+
+def make_phrase(text, n=1, v=6):
+    tokens = text.split(' ')
+    entities = [Entity(tokens[n], 'name', name, n, n + 1), Entity(tokens[v], 'value', value, v, v + 1),
+                Entity(tokens[v + 1], 'units', units, v + 1, v + 2)]
+    return Phrase(tokens, [Relation(entities, 1.0)], 1, 1)
+
+
+class TestStats(unittest.TestCase):
+
+    def test_timers_and_counters(self):
+        s = Stats()
+        with s.timer('a'):
+            pass
+        s.add_time('a', 2.0)
+        s.count('n')
+        s.count('n', 4)
+        d = s.as_dict()
+        self.assertEqual(d['timers']['a']['calls'], 2)
+        self.assertEqual(d['timers']['a']['max'], 2.0)
+        self.assertTrue(d['timers']['a']['seconds'] >= 2.0)
+        self.assertEqual(d['counters'], {'n': 5})
+        s.reset()
+        self.assertEqual(s.as_dict(), {'timers': {}, 'counters': {}, 'histograms': {}})
+
+    def test_histograms(self):
+        s = Stats()
+        for x in [0.91, 0.97, 0.96, 1.0]:
+            s.observe('confidence', x, bin_width=0.05)
+        s.observe('size', 3)
+        s.observe('size', 3)
+        s.observe('size', 10)
+        self.assertEqual(list(s.as_dict()['histograms']['confidence'].items()), [('0.9', 1), ('0.95', 2), ('1.0', 1)])
+        self.assertEqual(list(s.as_dict()['histograms']['size'].items()), [('3', 2), ('10', 1)])
+        self.assertEqual(json.loads(s.to_json())['histograms']['size'], {'3': 2, '10': 1})
+
+    def test_bin_edges(self):
+        s = Stats()
+        for x in [0.95, 0.6, 0.3, 0.94999]:
+            s.observe('confidence', x, bin_width=0.05)
+        self.assertEqual(s.as_dict()['histograms']['confidence'], {'0.3': 1, '0.6': 1, '0.9': 1, '0.95': 1})
+
+    def test_threads(self):
+        s = Stats()
+
+        def record():
+            for _ in range(2000):
+                s.add_time('a', 1.0)
+                s.count('n')
+                s.observe('h', 1)
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        d = s.as_dict()
+        self.assertEqual((d['timers']['a']['calls'], d['timers']['a']['seconds']), (8000, 8000.0))
+        self.assertEqual(d['counters'], {'n': 8000})
+        self.assertEqual(d['histograms']['h'], {'1': 8000})
+
+    def test_disabled(self):
+        s = Stats()
+        s.enabled = False
+        with s.timer('a'):
+            s.count('n')
+            s.observe('h', 1)
+        self.assertEqual(s.as_dict(), {'timers': {}, 'counters': {}, 'histograms': {}})
+
+
+class TestSnowballStats(unittest.TestCase):
+
+    def setUp(self):
+        stats.reset()
+
+    def tearDown(self):
+        stats.reset()
+
+    def test_stats_report(self):
+        sb = Snowball(relationship, tsim=0.8, checkpoint_every=None, cluster_class=StaticCluster)
+        sb.journaling = False
+        for text in ['the BiFeO3 has a Tc of 1103 K here', 'the Fe3O4 has a Tc of 858 K here',
+                     'so CoS2 shows transition near 116 K and']:
+            sb.cluster(make_phrase(text))
+        relations = sb.extract(TaggedSentence(tag('the MnO has a Tc of 118 K here')), learn=False)
+        self.assertEqual([e.text for e in relations[0].entities], ['MnO', '118', 'K'])
+
+        report = json.loads(json.dumps(sb.stats_report()))
+        for timer in ['extract', 'tagging', 'candidate_generation', 'combination_enumeration', 'matching',
+                      'vectorisation', 'confidence_update', 'pattern_rebuild']:
+            self.assertIn(timer, report['timers'])
+        self.assertEqual(report['counters']['sentences'], 1)
+        self.assertEqual(report['counters']['relations_extracted'], 1)
+        self.assertEqual(report['counters']['clusters_created'], 2)
+        self.assertEqual(report['histograms']['clusters_per_order'], {'2': 1})
+        self.assertEqual(report['histograms']['phrases_per_cluster'], {'1': 1, '2': 1})
+        self.assertEqual(sum(report['histograms']['best_phrase_confidence'].values()), 1)
+        self.assertEqual(report['model']['clusters'], 2)
+        self.assertEqual(report['model']['orders'], 1)
+        self.assertEqual(report['model']['tsim'], 0.8)
+
+
+if __name__ == '__main__':
+    unittest.main()
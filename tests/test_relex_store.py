@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+
+Test relex compact model files
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import io
+import json
+import logging
+import os
+import pickle
+import shutil
+import struct
+import tempfile
+import unittest
+
+from chemdataextractor.relex import Snowball, ChemicalRelationship, Relation, Entity, Cluster, Phrase
+from chemdataextractor.relex.store import MAGIC, ModelStore, is_model_file
+from chemdataextractor.parse import R, Any, OneOrMore, merge
+
+logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+
+name = (R('^[A-Z][A-Za-z0-9]+$'))('name')
+units = (R('^[CFK]\.?$'))('units').add_action(merge)
+value = (R('^\d+$'))('value')
+entities = (name | value + units)
+relationship = ChemicalRelationship([name, value, units], (entities + OneOrMore(entities | Any()))('tc'), name='tc')
+
+
+class StaticCluster(Cluster):
+    """Cluster with a fixed pattern confidence"""
+
+    def update_pattern_confidence(self):
+        self.pattern.confidence = 1.0
+
+
+def tag(text):
+    return [(t, 'CD' if t.isdigit() else 'NN') for t in text.split(' ')]
+
+
+def make_phrase(text, n, v, tagged=False):
+    tokens = text.split(' ')
+    entities = [Entity(tokens[n], 'name', name, n, n + 1), Entity(tokens[v], 'value', value, v, v + 1),
+                Entity(tokens[v + 1], 'units', units, v + 1, v + 2)]
+    return Phrase(tokens, [Relation(entities, 1.0)], 1, 1, tagged_tokens=tag(text) if tagged else None)
+
+
+def write_version_1(path):
+    """Rewrite a model file in format version 1, without the arrays that version 2 added"""
+    preamble = struct.Struct('<8sIQ')
+    with io.open(path, 'rb') as f:
+        magic, version, header_length = preamble.unpack(f.read(preamble.size))
+        header = json.loads(f.read(header_length).decode('utf-8'))
+        data = f.read()
+    for name in list(header['arrays']):
+        if name in ('cluster_matched_phrases', 'cluster_max_phrases', 'cluster_relation_offsets') or \
+                name.startswith('pattern_'):
+            del header['arrays'][name]
+    header_bytes = json.dumps(header, sort_keys=True).encode('utf-8')
+    header_bytes += b' ' * (-(len(header_bytes) + preamble.size) % 8)
+    with io.open(path, 'wb') as f:
+        f.write(preamble.pack(magic, 1, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(data)
+
+
+class TestModelStore(unittest.TestCase):
+
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp()
+        self.sb = Snowball(relationship, tsim=0.4, prefix_weight=0.2, middle_weight=0.6, suffix_weight=0.2,
+                           save_dir=self.save_dir + os.sep, checkpoint_every=None)
+        cluster = StaticCluster('0')
+        cluster.add_phrase(make_phrase('the BiFeO3 has Tc 1103 K here', 1, 4, tagged=True))
+        cluster.add_match(make_phrase('a CoS2 has Tc 116 K here', 1, 4))
+        self.sb.add_cluster(cluster)
+        cluster = StaticCluster('1')
+        cluster.add_phrase(make_phrase('so 858 K is the Tc of Fe3O4 , right', 7, 1, tagged=True))
+        self.sb.add_cluster(cluster)
+        self.sb.cluster_counter = 2
+        self.path = self.sb.save_model()
+
+    def tearDown(self):
+        shutil.rmtree(self.save_dir)
+
+    def test_round_trip(self):
+        self.assertEqual(self.path, os.path.join(self.save_dir, 'tc.snowball'))
+        self.assertTrue(is_model_file(self.path))
+        loaded = Snowball.load(self.path, relationship=relationship)
+        self.assertEqual(loaded.minimum_cluster_similarity_score, 0.4)
+        self.assertEqual(loaded.prefix_weight, 0.2)
+        self.assertIsNone(loaded.checkpoint_every)
+        self.assertEqual(loaded.cluster_counter, 2)
+        self.assertEqual(sorted(loaded.order_index), sorted(self.sb.order_index))
+        for cluster, other in zip(self.sb.clusters, loaded.clusters):
+            self.assertEqual(other.label, cluster.label)
+            self.assertEqual(other.pattern.confidence, cluster.pattern.confidence)
+            self.assertEqual(other.pattern.elements, cluster.pattern.elements)
+            self.assertEqual(other.pattern.to_string(), cluster.pattern.to_string())
+            self.assertEqual(other.phrases_seen, cluster.phrases_seen)
+            self.assertEqual(other.matched_phrases, cluster.matched_phrases)
+        phrase = make_phrase('the MnO has Tc 118 K here', 1, 4, tagged=True)
+        (score, cluster), = self.sb.score_phrases([phrase])
+        self.assertEqual(loaded.score_phrases([phrase]), [(score, loaded.clusters[0])])
+
+    def test_lazy_clusters(self):
+        loaded = Snowball.load(self.path, relationship=relationship, mmap=False)
+        cluster = loaded.clusters[0]
+        self.assertNotIn('phrases', cluster.__dict__)
+        self.assertEqual([p.sentence_tokens for p in cluster.phrases], [p.sentence_tokens for p in self.sb.clusters[0].phrases])
+        self.assertNotIn('_store', cluster.__dict__)
+        self.assertEqual(cluster.dictionaries, self.sb.clusters[0].dictionaries)
+        self.assertEqual(cluster.modal_rows, self.sb.clusters[0].modal_rows)
+        self.assertEqual(cluster.phrases[0].tags, ('NN', 'NN', 'NN', 'NN', 'CD', 'NN', 'NN'))
+        self.assertIsNone(cluster.phrases[1].tags)
+        self.assertEqual(cluster.phrases[0].relations[0].entities[2].tag, 'units')
+        # Pickling reads the rest of the clusters from the file
+        unpickled = pickle.loads(pickle.dumps(loaded))
+        self.assertEqual(len(unpickled.clusters[1].phrases), 1)
+
+    def test_learning_after_load(self):
+        loaded = Snowball.load(self.path, relationship=relationship, cluster_class=StaticCluster)
+        cluster = loaded.clusters[0]
+        self.assertIs(type(cluster), StaticCluster)
+        self.assertIs(loaded.cluster_class, StaticCluster)
+        cluster.add_phrase(make_phrase('the MnO has Tc 118 K here', 1, 4, tagged=True))
+        self.sb.clusters[0].add_phrase(make_phrase('the MnO has Tc 118 K here', 1, 4, tagged=True))
+        self.assertEqual(len(cluster.phrases), 3)
+        self.assertEqual(cluster.dictionaries, self.sb.clusters[0].dictionaries)
+        self.assertEqual(cluster.pattern.elements, self.sb.clusters[0].pattern.elements)
+
+    def test_phrase_limits(self):
+        self.sb.max_phrases_per_cluster = 3
+        self.sb.clusters[1].max_phrases = 1
+        self.sb.save_model()
+        loaded = Snowball.load(self.path, relationship=relationship)
+        self.assertEqual([c.max_phrases for c in loaded.clusters], [None, 1])
+        self.assertEqual(loaded.max_phrases_per_cluster, 3)
+
+    def test_pattern_relations(self):
+        cluster = StaticCluster('2', max_phrases=1)
+        cluster.add_phrase(make_phrase('the MnO has Tc 118 K here', 1, 4, tagged=True))
+        newest = make_phrase('the NiO has Tc 525 K here', 1, 4, tagged=True)
+        cluster.add_phrase(newest)
+        self.assertNotIn(newest, cluster.phrases)
+        self.sb.add_cluster(cluster)
+        self.sb.save_model()
+        loaded = Snowball.load(self.path, relationship=relationship)
+        self.assertEqual(loaded.clusters[2].pattern.relations, newest.relations)
+        self.assertEqual([c.pattern.relations for c in loaded.clusters[:2]],
+                         [c.phrases[-1].relations for c in self.sb.clusters[:2]])
+
+    def test_version_1(self):
+        self.sb.max_phrases_per_cluster = 3
+        self.sb.save_model()
+        write_version_1(self.path)
+        store = ModelStore(self.path, relationship)
+        self.assertEqual(store.version, 1)
+        loaded = Snowball.load(self.path, relationship=relationship)
+        self.assertEqual([c.max_phrases for c in loaded.clusters], [3, 3])
+        self.assertEqual([c.matched_phrases for c in loaded.clusters], [0, 0])
+        for cluster, other in zip(self.sb.clusters, loaded.clusters):
+            self.assertEqual(other.pattern.elements, cluster.pattern.elements)
+            self.assertEqual([p.sentence_tokens for p in other.phrases], [p.sentence_tokens for p in cluster.phrases])
+            self.assertEqual(other.pattern.relations, cluster.phrases[-1].relations)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            Snowball.load(self.path)
+        other = ChemicalRelationship([name, value, units], (name | value + units)('tc'), name='other')
+        with self.assertRaises(ValueError):
+            Snowball.load(self.path, relationship=other)
+        with open(self.path, 'r+b') as f:
+            f.seek(len(MAGIC))
+            f.write(struct.pack('<I', 99))
+        with self.assertRaises(ValueError):
+            Snowball.load(self.path, relationship=relationship)
+
+
+if __name__ == '__main__':
+    unittest.main()
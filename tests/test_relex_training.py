@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+
+Test relex sharded training and model merging
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from chemdataextractor.relex import Snowball, ChemicalRelationship, Cluster
+from chemdataextractor.relex.training import split_shards, train_shard
+from chemdataextractor.parse import R, Any, OneOrMore, merge
+
+logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+
+name = (R('^[A-Z][A-Za-z0-9]+$'))('name')
+units = (R('^[CFK]\.?$'))('units').add_action(merge)
+value = (R('^\d+$'))('value')
+entities = (name | value + units)
+relationship = ChemicalRelationship([name, value, units], (entities + OneOrMore(entities | Any()))('tc'), name='tc')
+
+
+class BlendedCluster(Cluster):
+    """Cluster whose pattern confidence is the blended previous confidence, so no tagger is needed"""
+
+    def update_pattern_confidence(self):
+        if len(self.phrases) == 1:
+            self.old_pattern_confidence = 1.0
+        self.pattern.confidence = self.old_pattern_confidence
+
+
+def annotation(text, n, v):
+    """An 'update' change for a sentence with one name, value, units relation"""
+    tokens = text.split(' ')
+    return {'op': 'update', 'tokens': tokens, 'tags': ['NN'] * len(tokens),
+            'relations': [{'confidence': 1.0, 'entities': [[tokens[n], 'name', n, n + 1], [tokens[v], 'value', v, v + 1],
+                                                           [tokens[v + 1], 'units', v + 1, v + 2]]}]}
+
+
+ANNOTATIONS = [annotation('the BiFeO3 has Tc 1103 K here', 1, 4),
+               annotation('so 858 K is the Tc of Fe3O4 , right', 7, 1),
+               annotation('the CoS2 has Tc 116 K here', 1, 4),
+               annotation('so 118 K is the Tc of MnO , right', 7, 1),
+               annotation('a NiO has Tc 525 K now', 1, 4)]
+
+
+def summary(sb):
+    return [(c.label, c.order, [p.full_sentence for p in c.phrases], c.pattern.confidence) for c in sb.clusters]
+
+
+class TestShardedTraining(unittest.TestCase):
+
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp()
+        self.sb = Snowball(relationship, tsim=0.5, save_dir=self.save_dir + os.sep, checkpoint_every=None,
+                           cluster_class=BlendedCluster)
+
+    def tearDown(self):
+        shutil.rmtree(self.save_dir)
+
+    def test_split_shards(self):
+        self.assertEqual(split_shards(range(5), 2), [[0, 2, 4], [1, 3]])
+
+    def test_train_shard(self):
+        model = train_shard(self.sb, ANNOTATIONS[:3])
+        self.assertEqual(len(model.clusters), 2)
+        self.assertFalse(os.path.exists(model.journal_path))
+        self.assertEqual(self.sb.clusters, [])
+        with self.assertRaises(ValueError):
+            train_shard(self.sb, [dict(ANNOTATIONS[0], op='add_phrase', cluster='0')])
+
+    def test_merge_equivalent_clusters(self):
+        self.sb.train_sharded(split_shards(ANNOTATIONS, 2))
+        # Shard 0 has BiFeO3, CoS2 and NiO, shard 1 has the Tc of Fe3O4 and MnO
+        self.assertEqual(summary(self.sb), [
+            ('0', ['name', 'value', 'units'], ['the BiFeO3 has Tc 1103 K here', 'the CoS2 has Tc 116 K here',
+                                               'a NiO has Tc 525 K now'], 1.0),
+            ('1', ['value', 'units', 'name'], ['so 858 K is the Tc of Fe3O4 , right',
+                                               'so 118 K is the Tc of MnO , right'], 1.0)])
+        self.assertEqual(self.sb.cluster_counter, 1)
+
+    def test_dissimilar_clusters_are_added(self):
+        self.sb.minimum_cluster_similarity_score = 1.0
+        self.sb.train_sharded([ANNOTATIONS[:2], ANNOTATIONS[4:]])
+        self.assertEqual([c.label for c in self.sb.clusters], ['0', '1', '2'])
+        self.assertEqual(self.sb.clusters[2].phrases[0].full_sentence, 'a NiO has Tc 525 K now')
+
+    def test_workers(self):
+        shards = split_shards(ANNOTATIONS, 3)
+
+        def state(sb):
+            return summary(sb), [(c.pattern.elements, c.old_pattern_confidence, c.phrases_seen, c.matched_phrases)
+                                 for c in sb.clusters], sb.cluster_counter, sb.clusters_merged
+
+        serial = self.sb.spawn().train_sharded(shards, workers=1)
+        parallel = self.sb.train_sharded(shards, workers=2)
+        self.assertEqual(state(parallel), state(serial))
+        self.assertEqual(len(serial.clusters), 2)
+
+    def test_journal_replay(self):
+        with self.sb:
+            self.sb.train_sharded(split_shards(ANNOTATIONS, 2))
+            replayed = self.sb.spawn()
+            replayed.replay_journal(self.sb.journal_path)
+        self.assertEqual(summary(replayed), summary(self.sb))
+        self.assertTrue(os.path.exists(os.path.join(self.save_dir, 'tc.pkl')))
+
+    def test_journal_replay_keeps_phrase_limit(self):
+        self.sb.max_phrases_per_cluster = 2
+        with self.sb:
+            self.sb.train_sharded([ANNOTATIONS, ANNOTATIONS])
+            replayed = self.sb.spawn()
+            replayed.replay_journal(self.sb.journal_path)
+        self.assertEqual([len(c.phrases) for c in self.sb.clusters], [2, 2])
+        self.assertEqual(summary(replayed), summary(self.sb))
+        self.assertEqual([(c.max_phrases, c.phrases_seen, c.phrases_dropped) for c in replayed.clusters],
+                         [(c.max_phrases, c.phrases_seen, c.phrases_dropped) for c in self.sb.clusters])
+
+    def test_frozen(self):
+        self.sb.freeze()
+        with self.assertRaises(ValueError):
+            self.sb.train_sharded([ANNOTATIONS])
+
+
+class TestClusterMerge(unittest.TestCase):
+
+    def make_cluster(self, label, texts, confidence):
+        sb = Snowball(relationship)
+        cluster = BlendedCluster(label)
+        cluster.restore([sb.decode_phrase(annotation(text, 1, 4)) for text in texts], confidence)
+        return cluster
+
+    def test_restore(self):
+        cluster = self.make_cluster('0', ['the BiFeO3 has Tc 1103 K here', 'a NiO has Tc 525 K now'], 0.4)
+        self.assertEqual(cluster.pattern.confidence, 0.4)
+        self.assertEqual(cluster.order, ['name', 'value', 'units'])
+        self.assertEqual(cluster.dictionaries['middle_1']['total words'], 4)
+
+    def test_confidences_are_weighted(self):
+        cluster = self.make_cluster('0', ['the BiFeO3 has Tc 1103 K here'], 1.0)
+        other = self.make_cluster('1', ['the CoS2 has Tc 116 K here', 'a NiO has Tc 525 K now',
+                                        'the MnO has Tc 118 K here'], 0.5)
+        cluster.merge(other)
+        self.assertEqual(len(cluster.phrases), 4)
+        self.assertAlmostEqual(cluster.pattern.confidence, 0.625)
+        self.assertEqual(cluster.label, '0')
+
+    def test_merge_into_empty(self):
+        other = self.make_cluster('1', ['the CoS2 has Tc 116 K here'], 0.5)
+        cluster = BlendedCluster('7')
+        cluster.merge(other)
+        self.assertEqual(cluster.pattern.confidence, 0.5)
+        self.assertEqual(cluster.order, other.order)
+        self.assertEqual(cluster.pattern.elements, other.pattern.elements)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,7 +15,7 @@ import os
 import unittest
 import numpy as np
 
-from chemdataextractor.relex.utils import mode_rows, match, KnuthMorrisPratt
+from chemdataextractor.relex.utils import mode_rows, match, KnuthMorrisPratt, locate_sequences
 from chemdataextractor.doc import Sentence
 from chemdataextractor.relex import Relation, Entity, Phrase, Cluster
 from chemdataextractor.parse.cem import chemical_name
@@ -59,5 +59,9 @@ class TestRelexUtils(unittest.TestCase):
             result.append(r)
         self.assertEqual(result, expected)
 
-        
-        
+    def test_locate_sequences(self):
+        tokens = ['a', 'b', 'a', 'b', 'a', 'c', 'b', 'a']
+        result = locate_sequences(tokens, [('a', 'b', 'a'), ('b', 'a'), ('a',), ('c', 'a'), ('b', 'a')])
+        self.assertEqual(result, {('a', 'b', 'a'): [0, 2], ('b', 'a'): [1, 3, 6], ('a',): [0, 2, 4, 7], ('c', 'a'): []})
+        for sequence, starts in result.items():
+            self.assertEqual(starts, list(KnuthMorrisPratt(tokens, sequence)))